@@ -1,11 +1,13 @@
+import sqlite3
 import sys
-from PySide6.QtCore import (QCoreApplication, QMetaObject, QSize, Qt)
+from PySide6.QtCore import (QCoreApplication, QDate, QMetaObject, QSize, Qt)
 from PySide6.QtGui import (QFont, QDoubleValidator)
 from PySide6.QtWidgets import (QApplication, QComboBox, QHBoxLayout, QHeaderView,
     QLabel, QLayout, QLineEdit, QMainWindow,
     QSizePolicy, QSpacerItem, QTableWidget, QTableWidgetItem,
-    QVBoxLayout, QWidget, QPushButton, QFormLayout, QCheckBox)
+    QVBoxLayout, QWidget, QPushButton, QFormLayout, QCheckBox, QDateEdit, QMessageBox)
 import database
+from qt_database import DatabaseRelay, ProductSearchPager
 
 class Ui_MainWindow(object):
     '''
@@ -87,7 +89,7 @@ class Ui_MainWindow(object):
         self.CategoryBox.setFont(font)
         self.CategoryBox.addItem("Όλες")
         for category in categories:
-            self.CategoryBox.addItem(category.name)
+            self.CategoryBox.addItem(category.name, category.category_code_int)
         
         self.verticalLayout_3.addWidget(self.CategoryBox)
 
@@ -111,7 +113,7 @@ class Ui_MainWindow(object):
         self.CompanyBox.setFont(font)
         self.CompanyBox.addItem("Όλες")
         for company in companies:
-            self.CompanyBox.addItem(company.name)
+            self.CompanyBox.addItem(company.name, company.company_code_int)
 
         self.verticalLayout_4.addWidget(self.CompanyBox)
 
@@ -165,7 +167,7 @@ class Ui_MainWindow(object):
         self.retranslateUi(MainWindow)
 
         QMetaObject.connectSlotsByName(MainWindow)
-        self.db_manager = database.DatabaseManager()
+        self.checkboxes = []
 
     def retranslateUi(self, MainWindow):
         '''
@@ -197,12 +199,9 @@ class Ui_MainWindow(object):
             return
         self.warningLabel.hide()
         product_code = self.tableWidget.item(selected[0], 1).text()
-        products = self.db_manager.get_all_products()
-        product = None
-        for product in products:
-            if product.product_code == product_code:
-                product = product
-                break
+        # Look the product up by its primary key, without loading the whole catalogue
+        with database.DatabaseManager() as db_manager:
+            product = db_manager.get_product_by_code(int(product_code[1:]))
         if not product:
             self.warningLabel.setText("Το προϊόν δεν βρέθηκε.")
             self.warningLabel.show()
@@ -225,21 +224,24 @@ class Ui_MainWindow(object):
         Returns:
             None
         '''
-        self.update_table(self.db_manager.get_all_products())
+        with database.DatabaseManager() as db_manager:
+            products = db_manager.get_all_products()
+        self.update_table(products)
 
-    def update_table(self, data):
+    def update_table(self, data, start=0):
         '''
         This method updates the table with the given data.
 
         Args:
             data: A list of Product objects.
+            start: The row of the first product. The rows after the given products are removed.
 
         Returns:
             None
         '''
-        self.tableWidget.setRowCount(len(data))
-        self.checkboxes = []
-        for row_num, product in enumerate(data):
+        self.tableWidget.setRowCount(start + len(data))
+        del self.checkboxes[start:]
+        for row_num, product in enumerate(data, start):
             # Add a checkbox to the first column
             checkbox = QCheckBox()
             checkbox.setStyleSheet("margin-left: 5px; margin-right: 5px;")
@@ -263,7 +265,6 @@ class AddWindow(QWidget):
         super().__init__(parent)
         self.callback = callback
         self.product = product
-        self.db_manager = database.DatabaseManager()
         self.setWindowTitle("Προσθήκη Προϊόντος")
         self.layout = QFormLayout()
         self.setLayout(self.layout)
@@ -287,6 +288,20 @@ class AddWindow(QWidget):
         self.quantity_input.setValidator(QDoubleValidator())
         self.layout.addRow(self.quantity_label, self.quantity_input)
 
+        # Drugs are received as batches, whose triggers add the quantity to the stock, so that the stock matches the batches
+        with database.DatabaseManager() as db_manager:
+            self.is_drug = db_manager.get_batch_quantity(self.product.product_code_int) is not None
+        if self.is_drug:
+            self.batch_code_label = QLabel("Παρτίδα:")
+            self.batch_code_input = QLineEdit()
+            self.layout.addRow(self.batch_code_label, self.batch_code_input)
+
+            self.expiration_date_label = QLabel("Λήξη:")
+            self.expiration_date_input = QDateEdit(QDate.currentDate().addYears(1))
+            self.expiration_date_input.setCalendarPopup(True)
+            self.expiration_date_input.setDisplayFormat("dd/MM/yyyy")
+            self.layout.addRow(self.expiration_date_label, self.expiration_date_input)
+
         self.save_button = QPushButton("Οκ")
         self.save_button.clicked.connect(self.save_changes)
         self.cancel_button = QPushButton("Άκυρο")
@@ -298,14 +313,33 @@ class AddWindow(QWidget):
 
     def save_changes(self):
         quantity = self.quantity_input.text()
-        self.product.quantity += int(quantity)
-        self.db_manager.update_product(self.product)
+        if self.is_drug:
+            batch_code = self.batch_code_input.text().strip()
+            if not batch_code:
+                QMessageBox.warning(self, "Σφάλμα", "Συμπληρώστε τον κωδικό της παρτίδας.")
+                return
+            batch = database.DrugBatch(batch_code, self.product.product_code_int, int(quantity), self.expiration_date_input.date().toPython())
+            # The connection is only held while saving, so closing the window in any way leaves none checked out
+            with database.DatabaseManager() as db_manager:
+                try:
+                    # The transaction rolls back a rejected batch, so the window does not keep the database locked
+                    with db_manager.transaction():
+                        db_manager.insert_drug_batch(batch)
+                except sqlite3.IntegrityError:
+                    QMessageBox.warning(self, "Σφάλμα", "Υπάρχει ήδη παρτίδα με αυτόν τον κωδικό.")
+                    return
+                new_quantity = db_manager.get_product_by_code(self.product.product_code_int).quantity
+        else:
+            # Add the received quantity in the database, so that receipts from other stations are not overwritten
+            with database.DatabaseManager() as db_manager:
+                new_quantity = db_manager.adjust_quantity(self.product.product_code_int, int(quantity))
+        if new_quantity is not None:
+            self.product.quantity = new_quantity
         self._close()
     
     def _close(self):
         if self.callback:
             self.callback()
-        self.db_manager.close()
         self.close()
     
 class MainWindow(QMainWindow):
@@ -314,7 +348,7 @@ class MainWindow(QMainWindow):
     
     Attributes:
         ui: The user interface of the main window.
-        db_manager: The database manager.
+        database: The relay that runs the table queries on the database worker thread.
         
     Methods:
         __init__: Initializes the main window.
@@ -322,15 +356,19 @@ class MainWindow(QMainWindow):
         load_manufacturers: Loads the manufacturers into the combo box.
         load_table_data: Loads the initial data into the table.
         filter_table_data: Filters the table data based on the search text, category, and manufacturer.
-        closeEvent: Closes the database connection.
+        closeEvent: Drops the table queries that have not finished.
     '''
     def __init__(self):
         super(MainWindow, self).__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
-        
-        # Initialize database manager
-        self.db_manager = database.DatabaseManager()
+
+        # Run the table queries on the database worker thread, so that a slow or locked database does not freeze the window
+        self.database = DatabaseRelay(self)
+        # Load the products a page at a time, the next page is loaded when the table is scrolled near its end
+        self.pager = ProductSearchPager(self.database, self.ui.tableWidget, self.ui.update_table)
+        # The windows opened from the table reload it through the pager, which keeps the search and loads only the first page
+        self.ui.update_table_db = self.pager.reload
 
         # Load initial data into table
         self.load_table_data()
@@ -342,21 +380,18 @@ class MainWindow(QMainWindow):
 
 
     def load_table_data(self):
-        self.ui.update_table_db()
+        self.pager.search()
 
     def filter_table_data(self):
         search_text = self.ui.SearchBox.text()
-        category = self.ui.CategoryBox.currentText()
-        manufacturer = self.ui.CompanyBox.currentText()
-        all_products = self.db_manager.get_all_products()
-        filtered_products = []
-        for product in all_products:
-            if search_text.lower() in product.name.lower() and (category == "Όλες" or product.category.name == category) and (manufacturer == "Όλες" or product.company.name == manufacturer):
-                filtered_products.append(product)
-        self.ui.update_table(filtered_products)
+        # The "Όλες" entries have no code, so they do not filter
+        category_code = self.ui.CategoryBox.currentData()
+        company_code = self.ui.CompanyBox.currentData()
+        # A newer search supersedes this one, so only the results of the last keystroke reach the table
+        self.pager.search(search_text, category_code, company_code)
 
     def closeEvent(self, event):
-        self.db_manager.close()
+        self.database.close()
         event.accept()
 
 if __name__ == "__main__":
@@ -3,7 +3,8 @@ from PySide6.QtGui import QIcon, QPixmap
 from PySide6.QtCore import Qt, QSize
 from user_dialog import UserInformationDialog
 from create_user_dialog import CreateUserDialog
-from database import DatabaseManager
+from database import PERMISSION_COLUMNS, DatabaseManager, permission_bit
+import collections
 import sys
 
 
@@ -64,7 +65,6 @@ class AdministrationWindow(QWidget):
         self.setLayout(layout)
         #---
 
-        self.db = DatabaseManager()
         self.load_data()
 
 
@@ -72,7 +72,11 @@ class AdministrationWindow(QWidget):
         """Load user data into the table."""
         self.table_widget.setRowCount(0) # Clear the table
 
-        users = self.db.get_all_users() # Fetch user data from database
+        with DatabaseManager() as db:
+            users = db.get_all_users() # Fetch user data from database
+        self.users = users
+        # Users with equal permission masks share a role, counted once here instead of comparing every pair of users
+        self.role_sizes = collections.Counter(user.permissions for user in users)
 
         # Add user data to the table
         for row, user in enumerate(users):
@@ -106,6 +110,11 @@ class AdministrationWindow(QWidget):
             layout = QVBoxLayout()
             layout.addWidget(QLabel(f"Όνομα Χρήστη: {username}"))
             layout.addWidget(QLabel(f"Ονοματεπώνυμο: {fullname}"))
+            mask = self.users[row].permissions.mask
+            is_admin = bool(mask & permission_bit("user_administration"))
+            layout.addWidget(QLabel(f"Διαχειριστής: {'Ναι' if is_admin else 'Όχι'}"))
+            layout.addWidget(QLabel(f"Δικαιώματα: {mask.bit_count()}/{len(PERMISSION_COLUMNS)}"))
+            layout.addWidget(QLabel(f"Χρήστες με ίδια δικαιώματα: {self.role_sizes[self.users[row].permissions]}"))
             dialog.setLayout(layout)
             dialog.exec()
 
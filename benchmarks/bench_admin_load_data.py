@@ -0,0 +1,68 @@
+"""
+Measures how AdministrationWindow.load_data scales with the number of users.
+
+Run from the repository root with:
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.bench_admin_load_data
+"""
+import os
+import tempfile
+import time
+from PySide6.QtWidgets import QApplication
+from database import DatabaseManager, User, UserPermissions
+
+USER_COUNTS = [10, 100, 1000, 10000]
+
+def populate_users(db: DatabaseManager, count: int):
+    """
+    Inserts the given number of users, each with all permissions enabled.
+
+    Args:
+        db (DatabaseManager): The database to insert the users into.
+        count (int): The number of users to insert.
+    """
+    permissions = UserPermissions(*[True] * 12)
+    for i in range(count):
+        db.insert_user(User(0, f"user{i}", "pass", f"User {i}", permissions))
+
+def measure(count: int) -> tuple[float, float]:
+    """
+    Times get_all_users and AdministrationWindow.load_data on a fresh database with the given number of users.
+
+    Args:
+        count (int): The number of users in the database.
+
+    Returns:
+        tuple[float, float]: The seconds spent in get_all_users and in load_data.
+    """
+    from admin_window import AdministrationWindow
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)  # AdministrationWindow always opens database.db in the working directory
+        try:
+            db = DatabaseManager()
+            populate_users(db, count)
+
+            start = time.perf_counter()
+            db.get_all_users()
+            query_time = time.perf_counter() - start
+            db.close()
+
+            window = AdministrationWindow()
+            start = time.perf_counter()
+            window.load_data()
+            load_time = time.perf_counter() - start
+            window.db.close()
+        finally:
+            os.chdir(cwd)
+    return query_time, load_time
+
+def main():
+    app = QApplication([])
+    print(f"{'users':>8} {'get_all_users (ms)':>20} {'load_data (ms)':>16}")
+    for count in USER_COUNTS:
+        query_time, load_time = measure(count)
+        print(f"{count:>8} {query_time * 1000:>20.2f} {load_time * 1000:>16.2f}")
+
+if __name__ == "__main__":
+    main()
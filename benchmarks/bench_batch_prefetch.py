@@ -0,0 +1,83 @@
+"""
+Measures the latency of loading the batches of a page of drugs against the number of drugs,
+comparing one query per row with the single query of prefetch_batches.
+
+Run from the repository root with:
+    python -m benchmarks.bench_batch_prefetch
+"""
+import os
+import random
+import tempfile
+import time
+from database import Category, Company, DatabaseManager, Drug, DrugBatch
+
+# Numbers of drugs the page loads are measured at
+DRUG_COUNTS = [1_000, 10_000, 50_000]
+
+# Batches stored for every drug
+BATCHES_PER_DRUG = 5
+
+# Rows of the stock table visible at once
+PAGE_SIZE = 30
+
+# Number of pages loaded at each size
+LOOKUPS = 50
+
+def per_row_load(db: DatabaseManager, drugs: list[Drug]):
+    """
+    Loads the batches of a page of drugs one row at a time, as the batch window did.
+
+    Args:
+        db (DatabaseManager): The database to read.
+        drugs (list[Drug]): The drugs of the page.
+    """
+    for drug in drugs:
+        drug.batches = db.get_batches_by_product_code(drug.product_code_int)
+
+def measure(count: int) -> tuple[float, float]:
+    """
+    Times loading the batches of random pages of drugs on a fresh database with the given number of drugs.
+
+    Args:
+        count (int): The number of drugs in the database.
+
+    Returns:
+        tuple[float, float]: The milliseconds per page with a query per row and with prefetch_batches.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, "database.db"))
+        company = Company(1, "Εταιρεία")
+        category = Category(1, "Κατηγορία")
+        db.insert_company(company)
+        db.insert_category(category)
+        with db.transaction():
+            for i in range(count):
+                db.insert_drug(Drug("", f"Φάρμακο {i}", 1.0, 2.0, 0, 5, company, category, True, []))
+        db.insert_drug_batches_many(
+            DrugBatch(f"B{code}-{n}", code, 10, f"{2030 + n}-01-01") for code in range(1, count + 1) for n in range(BATCHES_PER_DRUG))
+        starts = [random.randint(1, count - PAGE_SIZE) for _ in range(LOOKUPS)]
+
+        pages = [db.get_products_by_codes(range(start, start + PAGE_SIZE)) for start in starts]
+        start_time = time.perf_counter()
+        for page in pages:
+            per_row_load(db, page)
+        per_row_time = (time.perf_counter() - start_time) * 1000 / LOOKUPS
+
+        pages = [db.get_products_by_codes(range(start, start + PAGE_SIZE)) for start in starts]
+        start_time = time.perf_counter()
+        for page in pages:
+            db.prefetch_batches(page)
+        prefetch_time = (time.perf_counter() - start_time) * 1000 / LOOKUPS
+
+        db.close()
+        db.pool.close_idle()
+    return per_row_time, prefetch_time
+
+def main():
+    print(f"{'drugs':>10} {'per row ms':>11} {'prefetch ms':>12}")
+    for count in DRUG_COUNTS:
+        per_row_time, prefetch_time = measure(count)
+        print(f"{count:>10} {per_row_time:>11.3f} {prefetch_time:>12.3f}")
+
+if __name__ == "__main__":
+    main()
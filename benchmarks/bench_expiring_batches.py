@@ -0,0 +1,87 @@
+"""
+Measures the latency of finding the batches that expire in the next 30 days against the number of batches,
+comparing parsing every batch in Python with the indexed get_expiring_batches query.
+Most batches are empty and expired, as allocation drains batches without deleting them.
+
+Run from the repository root with:
+    python -m benchmarks.bench_expiring_batches
+"""
+import datetime
+import os
+import random
+import tempfile
+import time
+from database import DatabaseManager, DrugBatch
+
+# Numbers of batches the lookups are measured at
+BATCH_COUNTS = [10_000, 100_000, 1_000_000]
+
+# Number of times each lookup is repeated
+LOOKUPS = 20
+
+# The window of the "expiring soon" lookup
+HORIZON = datetime.timedelta(days=30)
+
+# Share of the batches that have been drained by allocation and already expired
+EMPTY_SHARE = 0.5
+
+def scan_lookup(db: DatabaseManager, before: datetime.date) -> list[tuple]:
+    """
+    Finds the expiring batches by reading every batch and parsing its expiration date, as was needed while dates were free-form text.
+
+    Args:
+        db (DatabaseManager): The database to search.
+        before (datetime.date): The first expiration date that is not included.
+
+    Returns:
+        list[tuple]: The first 100 expiring batch rows, soonest first.
+    """
+    db.c.execute('SELECT * FROM DrugBatch')
+    rows = [row for row in db.c.fetchall() if row[2] > 0 and datetime.date.fromisoformat(row[3]) < before]
+    return sorted(rows, key=lambda row: (row[3], row[1]))[:100]
+
+def measure(count: int) -> tuple[float, float]:
+    """
+    Times expiring batch lookups on a fresh database with the given number of batches.
+    EMPTY_SHARE of them are empty and expired, the others hold stock and expire over the next ten years.
+
+    Args:
+        count (int): The number of batches in the database.
+
+    Returns:
+        tuple[float, float]: The milliseconds per lookup with a scan and with get_expiring_batches.
+    """
+    today = datetime.date.today()
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, "database.db"))
+        empty = int(count * EMPTY_SHARE)
+        db.insert_drug_batches_many(
+            DrugBatch(f"E{i}", random.randint(1, 10_000), 0, today - datetime.timedelta(days=random.randint(1, 3650)))
+            for i in range(empty))
+        db.insert_drug_batches_many(
+            DrugBatch(f"B{i}", random.randint(1, 10_000), 10, today + datetime.timedelta(days=random.randint(0, 3650)))
+            for i in range(count - empty))
+        before = today + HORIZON
+
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            scan_lookup(db, before)
+        scan_time = (time.perf_counter() - start) * 1000 / LOOKUPS
+
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            db.get_expiring_batches(before)
+        indexed_time = (time.perf_counter() - start) * 1000 / LOOKUPS
+
+        db.close()
+        db.pool.close_idle()
+    return scan_time, indexed_time
+
+def main():
+    print(f"{'batches':>10} {'scan ms':>10} {'indexed ms':>11}")
+    for count in BATCH_COUNTS:
+        scan_time, indexed_time = measure(count)
+        print(f"{count:>10} {scan_time:>10.2f} {indexed_time:>11.3f}")
+
+if __name__ == "__main__":
+    main()
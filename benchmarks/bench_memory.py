@@ -0,0 +1,81 @@
+"""
+Measures the memory held by loaded products and drug batches, compared with the former __dict__ based classes.
+
+Run from the repository root with:
+    python -m benchmarks.bench_memory [count]
+"""
+import sys
+import tracemalloc
+from database import Category, Company, DrugBatch, Product
+
+# Number of products and of drug batches that are loaded
+DEFAULT_COUNT = 1_000_000
+
+class DictProduct:
+    """
+    The former layout of Product: attributes in a __dict__ and the code kept as a formatted string.
+    """
+    def __init__(self, product_code, name, purchase_cost, selling_price, quantity, quantity_limit, company, category):
+        self.product_code = f"P{str(product_code).zfill(6)}"
+        self.name = name
+        self.purchase_cost = purchase_cost
+        self.selling_price = selling_price
+        self.quantity = quantity
+        self.quantity_limit = quantity_limit
+        self.company = company
+        self.category = category
+
+class DictDrugBatch:
+    """
+    The former layout of DrugBatch: attributes in a __dict__.
+    """
+    def __init__(self, batch_code, product_code, quantity, expiration_date):
+        self.batch_code = batch_code
+        self.product_code = product_code
+        self.quantity = quantity
+        self.expiration_date = expiration_date
+
+def measure(product_class: type, batch_class: type, count: int) -> tuple[float, float]:
+    """
+    Builds count products and count drug batches from rows shaped like the database's, and measures the memory they hold.
+    Names and dates are shared between the two layouts, so only the objects themselves are compared.
+
+    Args:
+        product_class (type): The class to build the products with.
+        batch_class (type): The class to build the drug batches with.
+        count (int): The number of products and of drug batches.
+
+    Returns:
+        tuple[float, float]: The bytes held per product and per drug batch.
+    """
+    company = Company(1, "Εταιρεία")
+    category = Category(1, "Κατηγορία")
+    name = "Προϊόν"
+    expiration_date = "2030-01-01"
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    products = [product_class(i, name, 1.5, 2.5, 10, 5, company, category) for i in range(1, count + 1)]
+    after_products = tracemalloc.get_traced_memory()[0]
+    batches = [batch_class("B", i, 10, expiration_date) for i in range(1, count + 1)]
+    after_batches = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del products, batches
+    return (after_products - before) / count, (after_batches - after_products) / count
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT
+    print(f"{count} products and {count} drug batches")
+    print(f"{'layout':>10} {'bytes/product':>14} {'bytes/batch':>12}")
+    results = {
+        "__dict__": measure(DictProduct, DictDrugBatch, count),
+        "__slots__": measure(Product, DrugBatch, count),
+    }
+    for layout, (product_bytes, batch_bytes) in results.items():
+        print(f"{layout:>10} {product_bytes:>14.0f} {batch_bytes:>12.0f}")
+    (old_product, old_batch), (new_product, new_batch) = results.values()
+    print(f"{'saving':>10} {old_product - new_product:>14.0f} {old_batch - new_batch:>12.0f}")
+
+if __name__ == "__main__":
+    main()
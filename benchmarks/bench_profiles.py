@@ -0,0 +1,56 @@
+"""
+Measures the read and write throughput of each database profile.
+
+Run from the repository root with:
+    python -m benchmarks.bench_profiles
+"""
+import os
+import tempfile
+import time
+from database import DATABASE_PROFILES, Category, Company, DatabaseManager, Product
+
+# Number of products written one commit at a time, like the product windows do
+WRITE_COUNT = 2000
+
+# Number of times the whole catalogue is read back
+READ_REPEATS = 20
+
+def measure(profile: str) -> tuple[float, float]:
+    """
+    Times single-row writes and full catalogue reads on a fresh database using the given profile.
+
+    Args:
+        profile (str): The name of the DATABASE_PROFILES entry to use.
+
+    Returns:
+        tuple[float, float]: The products written per second and the products read per second.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, "database.db"), profile)
+        company = Company(1, "Εταιρεία")
+        category = Category(1, "Κατηγορία")
+        db.insert_company(company)
+        db.insert_category(category)
+
+        start = time.perf_counter()
+        for i in range(WRITE_COUNT):
+            db.insert_product(Product("", f"Προϊόν {i}", 1.0, 2.0, 10, 5, company, category))
+        write_rate = WRITE_COUNT / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(READ_REPEATS):
+            db.get_all_products()
+        read_rate = WRITE_COUNT * READ_REPEATS / (time.perf_counter() - start)
+
+        db.close()
+        db.pool.close_idle()
+    return write_rate, read_rate
+
+def main():
+    print(f"{'profile':>18} {'writes/s':>10} {'reads/s':>12}")
+    for profile in DATABASE_PROFILES:
+        write_rate, read_rate = measure(profile)
+        print(f"{profile:>18} {write_rate:>10.0f} {read_rate:>12.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measures the latency of looking up the product of a receipt against the size of the catalogue,
+comparing a full catalogue load with the primary key lookup used by the receiving window.
+
+Run from the repository root with:
+    python -m benchmarks.bench_receipt_lookup
+"""
+import os
+import random
+import tempfile
+import time
+from database import Category, Company, DatabaseManager, Product
+
+# Catalogue sizes the lookups are measured at
+CATALOGUE_SIZES = [1_000, 10_000, 50_000]
+
+# Number of receipts looked up at each size
+LOOKUPS = 50
+
+def scan_lookup(db: DatabaseManager, product_code: str) -> Product:
+    """
+    Finds a product the way the receiving window used to, by loading the whole catalogue and comparing codes.
+
+    Args:
+        db (DatabaseManager): The database to search.
+        product_code (str): The product code as displayed in the table.
+
+    Returns:
+        Product: The product with the given code.
+    """
+    for product in db.get_all_products():
+        if product.product_code == product_code:
+            return product
+
+def measure(size: int) -> tuple[float, float]:
+    """
+    Times receipt lookups on a fresh catalogue of the given size.
+
+    Args:
+        size (int): The number of products in the catalogue.
+
+    Returns:
+        tuple[float, float]: The milliseconds per lookup with a catalogue scan and with get_product_by_code.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, "database.db"))
+        company = Company(1, "Εταιρεία")
+        category = Category(1, "Κατηγορία")
+        db.insert_company(company)
+        db.insert_category(category)
+        db.insert_products_many(Product("", f"Προϊόν {i}", 1.0, 2.0, 10, 5, company, category) for i in range(size))
+        codes = [random.randint(1, size) for _ in range(LOOKUPS)]
+
+        start = time.perf_counter()
+        for code in codes:
+            scan_lookup(db, f"P{code:06}")
+        scan_time = (time.perf_counter() - start) * 1000 / LOOKUPS
+
+        start = time.perf_counter()
+        for code in codes:
+            db.get_product_by_code(code)
+        indexed_time = (time.perf_counter() - start) * 1000 / LOOKUPS
+
+        db.close()
+        db.pool.close_idle()
+    return scan_time, indexed_time
+
+def main():
+    print(f"{'products':>10} {'scan ms':>10} {'indexed ms':>11}")
+    for size in CATALOGUE_SIZES:
+        scan_time, indexed_time = measure(size)
+        print(f"{size:>10} {scan_time:>10.2f} {indexed_time:>11.3f}")
+
+if __name__ == "__main__":
+    main()
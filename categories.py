@@ -136,15 +136,19 @@ class CategoriesWindow(QWidget):
             dialog (QDialog): The dialog window to close after creating the category.
         """      
         if category_name.strip():  
-            existing_categories = self.db.get_all_categories()
-            category_code = len(existing_categories) + 1
-            category = Category(category_code, category_name)
+            # The database allocates the next free category code
+            category = Category("", category_name)
             self.db.insert_category(category)
             dialog.accept()
             self.load_data()
         else:
             QMessageBox.warning(self, "Σφάλμα", "Το όνομα της κατηγορίας δεν μπορεί να είναι κενό.")
 
+    def closeEvent(self, event):
+        """Hand the database connection back when the window is closed."""
+        self.db.close()
+        event.accept()
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     db = DatabaseManager("database.db")
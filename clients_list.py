@@ -1,11 +1,14 @@
 from PySide6.QtWidgets import QMainWindow, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget, QCheckBox, QHBoxLayout, QDialog, QLineEdit, QFormLayout, QPushButton
 from PySide6.QtCore import Qt
 from database import DatabaseManager, Client
+from qt_database import DatabaseRelay
 
 class ClientWindow(QMainWindow):
     def __init__(self, user_id, parent_window):
         super().__init__()
         self.db = DatabaseManager()
+        # The client list is loaded on the database worker thread, so that opening the window does not wait for it
+        self.database = DatabaseRelay(self)
         self.user_id = user_id
         self.parent_window = parent_window
 
@@ -43,12 +46,13 @@ class ClientWindow(QMainWindow):
         ok_button.clicked.connect(self.add_selected_clients_to_personal_list)
 
     def populate_client_table(self):
+        # Fetch all clients from the database
+        self.database.call_latest("clients", self.fill_client_table, "get_all_clients")
+
+    def fill_client_table(self, clients):
         # Clear existing rows
         self.table.setRowCount(0)
 
-        # Fetch all clients from the database
-        clients = self.db.get_all_clients()
-
         # Populate table with client data
         for client in clients:
             row_position = self.table.rowCount()
@@ -97,15 +101,15 @@ class ClientWindow(QMainWindow):
         dialog.exec()
 
     def create_client(self, dialog, client_name, client_address, client_phone):
-        all_clients = self.db.get_all_clients()
-        client_id = len(all_clients) + 1
-        client = Client(client_id, fullname=client_name, address=client_address, phone=client_phone)
+        # The database allocates the next free client ID
+        client = Client(None, fullname=client_name, address=client_address, phone=client_phone)
         self.db.insert_client(client)
         dialog.accept()
 
         self.populate_client_table()
 
     def add_selected_clients_to_personal_list(self):
+        client_ids = []
         for row in range(self.table.rowCount()):
             checkbox_widget = self.table.cellWidget(row, 0)
             checkbox = checkbox_widget.layout().itemAt(0).widget()
@@ -113,9 +117,18 @@ class ClientWindow(QMainWindow):
                 # Retrieve client ID from the checkbox widget
                 client_id = checkbox_widget.property("client_id")
                 if client_id is not None:
-                    self.db.add_personal_client(self.user_id, client_id)
+                    client_ids.append(client_id)
                 else:
                     print("No client ID found")
 
+        # Add the whole selection in one transaction, clients already in the list are skipped
+        self.db.add_personal_clients(self.user_id, client_ids)
+
         self.parent_window.refresh_personal_clients()
         self.close()
+
+    def closeEvent(self, event):
+        """Hand the database connection back when the window is closed."""
+        self.database.close()
+        self.db.close()
+        event.accept()
@@ -94,4 +94,9 @@ class PersonalClientsWindow(QWidget):
 
     def refresh_personal_clients(self):
         """Refresh the personal clients list."""
-        self.populate_client_table()
\ No newline at end of file
+        self.populate_client_table()
+
+    def closeEvent(self, event):
+        """Hand the database connection back when the window is closed."""
+        self.db.close()
+        event.accept()
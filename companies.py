@@ -136,9 +136,13 @@ class CompaniesWindow(QWidget):
             dialog (QDialog): The dialog window to close after creating the company.
         """      
         if company_name.strip():  
-            existing_companies = self.db.get_all_companies()
-            company_code = len(existing_companies) + 1
-            company = Company(company_code, company_name)
+            # The database allocates the next free company code
+            company = Company("", company_name)
             self.db.insert_company(company)
             dialog.accept()
             self.load_data()
+
+    def closeEvent(self, event):
+        """Hand the database connection back when the window is closed."""
+        self.db.close()
+        event.accept()
@@ -23,6 +23,8 @@ class CreateUserDialog(QDialog):
         super().__init__(parent)
 
         self.db = DatabaseManager()
+        # finished is emitted however the dialog ends, including Esc, which does not send a close event
+        self.finished.connect(self.db.close)
 
         self.setWindowTitle("Δημιουργία νέου Χρήστη")
 
@@ -43,7 +45,7 @@ class CreateUserDialog(QDialog):
         self.layout.addWidget(self.fullname_label)
         self.layout.addWidget(self.fullname_lineedit)
 
-        self.permissions_layout = PermissionsLayout()
+        self.permissions_layout = PermissionsLayout(db=self.db)
         self.layout.addLayout(self.permissions_layout)
 
         self.create_button = QPushButton("Δημιουργία Χρήστη")
@@ -1,16 +1,99 @@
+import atexit
+import bisect
+import contextlib
 import datetime
+import functools
+import inspect
+import json
+import logging
+import os
+import re
 import sqlite3
+import threading
+import time
 import typing
+import weakref
+
+def _parse_code(code: typing.Union[int, str, None]) -> typing.Optional[int]:
+    """
+    Converts a code to the integer stored in the database.
+
+    Args:
+        code (int | str): The code as an integer, or formatted for display with a one letter prefix, e.g. "P000123".
+
+    Returns:
+        int: The code as an integer, or None if the code is empty or cannot be parsed.
+    """
+    if code is None or isinstance(code, int):
+        return code
+    code = str(code).strip()
+    if code[:1].isalpha():
+        code = code[1:]
+    try:
+        return int(code)
+    except ValueError:
+        return None
+
+def _format_code(prefix: str, code: typing.Optional[int]) -> str:
+    """
+    Formats a code for display, with a one letter prefix and six digits.
+
+    Args:
+        prefix (str): The letter identifying the kind of code, e.g. "P" for products.
+        code (int): The code as an integer.
+
+    Returns:
+        str: The formatted code, or an empty string if there is no code.
+    """
+    if code is None:
+        return ""
+    return f"{prefix}{code:06}"
+
+# The text formats expiration dates were entered in before they were stored as ISO dates, tried in order after ISO itself.
+# Dates are written day first, as they are in Greece.
+DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d/%m/%y"]
+
+def _format_date(value: typing.Union[datetime.date, str]) -> str:
+    """
+    Converts a date to the ISO YYYY-MM-DD text stored in the database, which sorts in date order.
+
+    Args:
+        value (datetime.date | str): The date, a datetime, or text in ISO format or one of DATE_FORMATS.
+
+    Returns:
+        str: The date as YYYY-MM-DD, without any time of day.
+
+    Raises:
+        ValueError: If the text is not a date in any of the known formats.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    text = str(value).strip()
+    try:
+        return datetime.datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"Cannot read {value!r} as a date")
 
 class Company:
     """
     Represents a company with a unique company code and name.
+    The code is stored as an integer and only formatted for display when company_code is read.
 
     Attributes:
         company_code (str): The unique identifier for the company.
         name (str): The name of the company.
         company_code_int (int): The company code as an integer.
     """
+    __slots__ = ('_company_code', 'name')
+
     def __init__(self, company_code: str, name: str):
         """
         Initializes a new instance of the Company class.
@@ -19,30 +102,51 @@ class Company:
             company_code (str): The unique identifier for the company.
             name (str): The name of the company.
         """
-        if type(company_code) == int:
-            company_code = f"S{str(company_code).zfill(6)}"
         self.company_code = company_code
         self.name = name
     
     @property
-    def company_code_int(self) -> int:
+    def company_code(self) -> str:
+        """
+        Returns the company code formatted for display.
+
+        Returns:
+            str: The company code, e.g. "S000123", or an empty string if the company has no code yet.
+        """
+        return _format_code("S", self._company_code)
+
+    @company_code.setter
+    def company_code(self, company_code: typing.Union[int, str, None]):
+        """
+        Sets the company code from an integer or a code formatted for display.
+
+        Args:
+            company_code (int | str): The new company code, empty if the company has no code yet.
+        """
+        self._company_code = _parse_code(company_code)
+
+    @property
+    def company_code_int(self) -> typing.Optional[int]:
         """
         Returns the company code as an integer.
 
         Returns:
-            int: The company code as an integer.
+            int: The company code as an integer, or None if the company has no code yet.
         """
-        return int(self.company_code[1:])
+        return self._company_code
 
 class Category:
     """
     Represents a category with a unique category code and name.
+    The code is stored as an integer and only formatted for display when category_code is read.
 
     Attributes:
         category_code (str): The unique identifier for the category.
         name (str): The name of the category.
         category_code_int (int): The category code as an integer.
     """
+    __slots__ = ('_category_code', 'name')
+
     def __init__(self, category_code: str, name: str):
         """
         Initializes a new instance of the Category class.
@@ -51,24 +155,43 @@ class Category:
             category_code (str): The unique identifier for the category.
             name (str): The name of the category.
         """
-        if type(category_code) == int:
-            category_code = f"C{str(category_code).zfill(6)}"
         self.category_code = category_code
         self.name = name
 
     @property
-    def category_code_int(self) -> int:
+    def category_code(self) -> str:
+        """
+        Returns the category code formatted for display.
+
+        Returns:
+            str: The category code, e.g. "C000123", or an empty string if the category has no code yet.
+        """
+        return _format_code("C", self._category_code)
+
+    @category_code.setter
+    def category_code(self, category_code: typing.Union[int, str, None]):
+        """
+        Sets the category code from an integer or a code formatted for display.
+
+        Args:
+            category_code (int | str): The new category code, empty if the category has no code yet.
+        """
+        self._category_code = _parse_code(category_code)
+
+    @property
+    def category_code_int(self) -> typing.Optional[int]:
         """
         Returns the category code as an integer.
 
         Returns:
-            int: The category code as an integer.
+            int: The category code as an integer, or None if the category has no code yet.
         """
-        return int(self.category_code[1:])
+        return self._category_code
 
 class Product:
     """
     Represents a product with a unique product code, name, purchase cost, selling price, quantity, quantity limit, company, and category.
+    The code is stored as an integer and only formatted for display when product_code is read.
 
     Attributes:
         product_code (str): The unique identifier for the product.
@@ -79,7 +202,10 @@ class Product:
         quantity_limit (int): The minimum quantity of the product that should be in stock.
         company (Company): The company that produces the product.
         category (Category): The category to which the product belongs.
+        product_code_int (int): The product code as an integer.
     """
+    __slots__ = ('_product_code', 'name', 'purchase_cost', 'selling_price', 'quantity', 'quantity_limit', 'company', 'category')
+
     def __init__(self, product_code: str, name: str, purchase_cost: float, selling_price: float, quantity: int, quantity_limit: int, company: Company, category: Category):
         """
         Initializes a new instance of the Product class.
@@ -94,8 +220,6 @@ class Product:
             company (Company): The company that produces the product.
             category (Category): The category to which the product belongs.
         """
-        if type(product_code) == int:
-            product_code = f"P{str(product_code).zfill(6)}"
         self.product_code = product_code
         self.name = name
         self.purchase_cost = purchase_cost
@@ -106,14 +230,34 @@ class Product:
         self.category = category
     
     @property
-    def product_code_int(self) -> int:
+    def product_code(self) -> str:
+        """
+        Returns the product code formatted for display.
+
+        Returns:
+            str: The product code, e.g. "P000123", or an empty string if the product has no code yet.
+        """
+        return _format_code("P", self._product_code)
+
+    @product_code.setter
+    def product_code(self, product_code: typing.Union[int, str, None]):
+        """
+        Sets the product code from an integer or a code formatted for display.
+
+        Args:
+            product_code (int | str): The new product code, empty if the product has no code yet.
+        """
+        self._product_code = _parse_code(product_code)
+
+    @property
+    def product_code_int(self) -> typing.Optional[int]:
         """
         Returns the product code as an integer.
 
         Returns:
-            int: The product code as an integer.
+            int: The product code as an integer, or None if the product has no code yet.
         """
-        return int(self.product_code[1:])
+        return self._product_code
 
 class DrugBatch:
     """
@@ -122,8 +266,10 @@ class DrugBatch:
     Attributes:
         batch_code (str): The unique identifier for the drug batch.
         quantity (int): The quantity of drugs in the batch.
-        expiration_date (datetime): The date when the drugs in the batch expire.
+        expiration_date (str): The date when the drugs in the batch expire, as YYYY-MM-DD once stored in the database.
     """
+    __slots__ = ('batch_code', 'product_code', 'quantity', 'expiration_date')
+
     def __init__(self, batch_code: str, product_code: int, quantity: int, expiration_date: datetime):
         """
         Initializes a new instance of the DrugBatch class.
@@ -132,12 +278,56 @@ class DrugBatch:
             batch_code (str): The unique identifier for the drug batch.
             product_code (int): The unique identifier for the drug.
             quantity (int): The quantity of drugs in the batch.
-            expiration_date (datetime): The date when the drugs in the batch expire.
+            expiration_date (datetime): The date when the drugs in the batch expire. Dates and text in one of the formats read by _format_date are accepted.
+        """
+        self.batch_code = batch_code
+        self.product_code = product_code
+        self.quantity = quantity
+        self.expiration_date = expiration_date
+
+class BatchPick:
+    """
+    Represents a quantity taken from a drug batch when an order is allocated.
+    """
+    __slots__ = ('batch_code', 'product_code', 'quantity', 'expiration_date')
+
+    def __init__(self, batch_code: str, product_code: int, quantity: int, expiration_date: str):
+        """
+        Initializes a new instance of the BatchPick class.
+
+        Args:
+            batch_code (str): The code of the batch the drugs are taken from.
+            product_code (int): The product code of the drug.
+            quantity (int): The quantity taken from the batch.
+            expiration_date (str): The expiration date of the batch, as YYYY-MM-DD.
         """
         self.batch_code = batch_code
         self.product_code = product_code
         self.quantity = quantity
         self.expiration_date = expiration_date
+
+class InsufficientStockError(ValueError):
+    """
+    Raised when an allocation asks for more of a product than is in stock. Nothing is allocated.
+
+    Attributes:
+        product_code (int): The product code of the product that is short.
+        requested (int): The quantity that was asked for.
+        available (int): The quantity that could be allocated.
+    """
+    def __init__(self, product_code: int, requested: int, available: int):
+        """
+        Initializes a new instance of the InsufficientStockError class.
+
+        Args:
+            product_code (int): The product code of the product that is short.
+            requested (int): The quantity that was asked for.
+            available (int): The quantity that could be allocated.
+        """
+        super().__init__(f"Product {product_code} has {available} in stock, {requested} requested")
+        self.product_code = product_code
+        self.requested = requested
+        self.available = available
     
 class Drug(Product):
     """
@@ -154,8 +344,12 @@ class Drug(Product):
         category (Category): The category to which the drug belongs.
         quality (bool): The quality of the drug. True if the drug is of high quality, False otherwise.
         batches (list): A list of DrugBatch objects representing the batches of the drug.
+            Drugs read from the database load their batches on first access, unless they were prefetched with DatabaseManager.prefetch_batches.
     """
-    def __init__(self, product_code: str, name: str, purchase_cost: float, selling_price: float, quantity: int, quantity_limit: int, company: Company, category: Category, quality: bool, batches: list):
+    __slots__ = ('quality', '_batches', '_batch_loader')
+
+    def __init__(self, product_code: str, name: str, purchase_cost: float, selling_price: float, quantity: int, quantity_limit: int, company: Company, category: Category, quality: bool,
+                 batches: typing.Optional[list] = None, batch_loader: typing.Optional[typing.Callable[[int], list]] = None):
         """
         Initializes a new instance of the Drug class.
 
@@ -167,17 +361,95 @@ class Drug(Product):
             quantity (int): The quantity of the drug in stock.
             quantity_limit (int): The minimum quantity of the drug that should be in stock.
             quality (bool): The quality of the drug. True if the drug is of high quality, False otherwise.
-            batches (list): A list of DrugBatch objects representing the batches of the drug.
+            batches (list): A list of DrugBatch objects representing the batches of the drug, or None to load them with batch_loader when first accessed.
+            batch_loader (Callable[[int], list]): The function that loads the batches of a product code, or None if the drug has no stored batches.
         """
         super().__init__(product_code, name, purchase_cost, selling_price, quantity, quantity_limit, company, category)
         self.quality = quality
-        self.batches = batches
+        self._batches = batches
+        self._batch_loader = batch_loader
+
+    @property
+    def batches(self) -> list:
+        """The batches of the drug, loaded with the batch loader the first time they are accessed."""
+        if self._batches is None:
+            self._batches = self._batch_loader(self.product_code_int) if self._batch_loader is not None else []
+        return self._batches
+
+    @batches.setter
+    def batches(self, batches: list):
+        self._batches = batches
+
+    @property
+    def batches_loaded(self) -> bool:
+        """Whether the batches are held by the drug, so that accessing them does not query the database."""
+        return self._batches is not None
+
  
+# The UserPermissions attributes in bit order, with the column of the UserPermissions compatibility view that shows each one.
+# A user's permissions are stored in User.Permissions as a bitmask, where the permission at index i is bit 1 << i.
+# New permissions must be added at the end, so that the bits of existing permissions keep their meaning.
+PERMISSION_COLUMNS = {
+    "view_stock": "ViewStock",
+    "edit_stock": "EditStock",
+    "add_products": "AddProduct",
+    "view_notifications": "ViewNotifications",
+    "create_client_list": "CreateClientList",
+    "view_orders": "ViewOrders",
+    "add_orders": "AddOrders",
+    "change_order_state": "ChangeOrderState",
+    "view_bills": "ViewBills",
+    "create_bills": "CreateBills",
+    "view_salaries": "ViewSalaries",
+    "user_administration": "UserAdministration",
+}
+
+def permission_bit(name: str) -> int:
+    """
+    Returns the bit of a permission in the permissions bitmask.
+
+    Args:
+        name (str): The UserPermissions attribute of the permission, e.g. view_stock.
+
+    Returns:
+        int: The bitmask with only the bit of the permission set.
+
+    Raises:
+        ValueError: If there is no permission with the given name.
+    """
+    try:
+        return 1 << list(PERMISSION_COLUMNS).index(name)
+    except ValueError:
+        raise ValueError(f"Unknown permission {name}") from None
+
+class _PermissionFlag:
+    """
+    A boolean attribute of UserPermissions that reads and writes one bit of its mask.
+    """
+    def __set_name__(self, owner: type, name: str):
+        self.bit = permission_bit(name)
+
+    def __get__(self, permissions: typing.Optional['UserPermissions'], owner: type = None):
+        if permissions is None:
+            return self
+        return bool(permissions.mask & self.bit)
+
+    def __set__(self, permissions: 'UserPermissions', value: bool):
+        if value:
+            permissions.mask |= self.bit
+        else:
+            permissions.mask &= ~self.bit
+
 class UserPermissions:
     """
     Represents the permissions a user has in the system.
 
+    The permissions are held in a single integer bitmask, laid out as in PERMISSION_COLUMNS.
+    Each permission attribute reads and writes its bit, so checking a permission costs a single bitwise and,
+    and the permissions of many users can be compared through their masks.
+
     Attributes:
+        mask (int): The bitmask of the permissions, as stored in User.Permissions.
         view_stock (bool): Permission to view stock.
         edit_stock (bool): Permission to edit stock.
         add_products (bool): Permission to add products.
@@ -191,10 +463,26 @@ class UserPermissions:
         view_salaries (bool): Permission to view salaries.
         user_administration (bool): Permission for user administration.
     """
+    __slots__ = ('mask',)
+
+    view_stock = _PermissionFlag()
+    edit_stock = _PermissionFlag()
+    add_products = _PermissionFlag()
+    view_notifications = _PermissionFlag()
+    create_client_list = _PermissionFlag()
+    view_orders = _PermissionFlag()
+    add_orders = _PermissionFlag()
+    change_order_state = _PermissionFlag()
+    view_bills = _PermissionFlag()
+    create_bills = _PermissionFlag()
+    view_salaries = _PermissionFlag()
+    user_administration = _PermissionFlag()
+
     def __init__(self, view_stock=False, edit_stock=False, add_products=False, view_notifications=False, create_client_list=False, view_orders=False, add_orders=False, change_order_state=False, view_bills=False, create_bills=False, view_salaries=False, user_administration=False):
         """
         Initializes a new instance of the UserPermissions class with all permissions set to False.
         """
+        self.mask = 0
         self.view_stock = view_stock
         self.edit_stock = edit_stock
         self.add_products = add_products
@@ -208,6 +496,42 @@ class UserPermissions:
         self.view_salaries = view_salaries
         self.user_administration = user_administration
 
+    @classmethod
+    def from_mask(cls, mask: int) -> 'UserPermissions':
+        """
+        Creates the permissions described by a bitmask.
+
+        Args:
+            mask (int): The bitmask of the permissions, as stored in User.Permissions.
+
+        Returns:
+            UserPermissions: The permissions with the bits of the mask set.
+        """
+        permissions = cls()
+        permissions.mask = mask
+        return permissions
+
+    def includes(self, other: 'UserPermissions') -> bool:
+        """
+        Returns whether these permissions grant everything the other permissions grant.
+
+        Args:
+            other (UserPermissions): The permissions to compare with.
+
+        Returns:
+            bool: True if every permission of other is also set here, False otherwise.
+        """
+        return self.mask & other.mask == other.mask
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, UserPermissions):
+            return NotImplemented
+        return self.mask == other.mask
+
+    def __hash__(self) -> int:
+        # Hashed by mask like the int it wraps, so permissions used as set members or dict keys must not be changed meanwhile
+        return hash(self.mask)
+
 class User:
     """
     Represents a user in the system with a unique ID, username, password, full name, and permissions.
@@ -240,6 +564,8 @@ class Client:
     """
     Represents a client in the system with a unique ID, name, address, phone number, and email.
     """
+    __slots__ = ('client_id', 'fullname', 'address', 'phone')
+
     def __init__(self, client_id: str, fullname: str, address: str, phone: int):
         """
         Initializes a new instance of the Client class.
@@ -264,7 +590,27 @@ class Client:
         """
         Returns the client code as an integer.
         """
-        return int(self.client_id[1:])
+        return int(self.client_id)
+
+
+class StockAlert:
+    """
+    Represents an open low-stock alert, raised when the quantity of a product fell below its quantity limit.
+    """
+    __slots__ = ('alert_id', 'product', 'raised_at')
+
+    def __init__(self, alert_id: int, product: Product, raised_at: str):
+        """
+        Initializes a new instance of the StockAlert class.
+
+        Args:
+            alert_id (int): The unique identifier for the alert.
+            product (Product): The product whose stock is below its quantity limit.
+            raised_at (str): The UTC time the alert was raised, as YYYY-MM-DD HH:MM:SS.
+        """
+        self.alert_id = alert_id
+        self.product = product
+        self.raised_at = raised_at
 
 
 class Bill:
@@ -285,413 +631,2098 @@ class Orders:
         self.client = client
         self.bill = bill
 
-class DatabaseManager:
+# Connection settings for each kind of workstation, applied to every connection as PRAGMA statements when it is opened.
+# All profiles use write-ahead logging, so that long reads in one window do not block writes from other workstations.
+DATABASE_PROFILES = {
+    # Interactive use, a balance between memory use and speed
+    "desktop": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+    # Frequent small writes while stock is received, waits longer for locks held by other workstations
+    "receiving-station": {
+        "busy_timeout": 15000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -8000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    # Large reads over whole tables, uses more memory for the page cache, memory mapping and sorting
+    "reporting": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+# The profile used when none is given
+DEFAULT_PROFILE = "desktop"
+
+def _casefold(text: typing.Optional[str]) -> typing.Optional[str]:
     """
-    Manages interactions with the SQLite3 database.
+    Case folds text for case-insensitive comparisons, registered as the casefold SQL function on every connection.
+    Unlike the built-in lower SQL function, it also handles Greek and other non-ASCII letters.
 
-    Attributes:
-        conn (sqlite3.Connection): The connection to the SQLite3 database.
-        c (sqlite3.Cursor): The cursor for executing SQL statements.
+    Args:
+        text (str): The text to case fold.
+
+    Returns:
+        str: The case folded text, or None if the text is NULL.
     """
-    def __init__(self, database_path='database.db'):
-        """
-        Initializes a new instance of the DatabaseManager class, establishing a connection to the SQLite3 database and creating a cursor for executing SQL statements.
+    if text is None:
+        return None
+    return str(text).casefold()
 
-        Args:
-            database_path (str): The path to the SQLite3 database file.
-        """
-        self.conn = sqlite3.connect(database_path)
-        self.c = self.conn.cursor()
-        self.create_tables()
-        
-    def create_tables(self):
-        """
-        Creates the tables in the SQLite3 database if they do not already exist.
-        """
-        # Create User table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS User (
-                Id INTEGER PRIMARY KEY,
-                Username TEXT NOT NULL UNIQUE,
-                Password TEXT NOT NULL,
-                Fullname TEXT NOT NULL
-            )
-        ''')
-        
-        # Create UserPermissions table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS UserPermissions (
-                UserId INTEGER NOT NULL,
-                ViewStock INTEGER NOT NULL,
-                EditStock INTEGER NOT NULL,
-                AddProduct INTEGER NOT NULL,
-                ViewNotifications INTEGER NOT NULL,
-                CreateClientList INTEGER NOT NULL,
-                ViewOrders INTEGER NOT NULL,
-                AddOrders INTEGER NOT NULL,
-                ChangeOrderState INTEGER NOT NULL,
-                ViewBills INTEGER NOT NULL,
-                CreateBills INTEGER NOT NULL,
-                ViewSalaries INTEGER NOT NULL,
-                UserAdministration INTEGER NOT NULL,
-                PRIMARY KEY (UserId),
-                FOREIGN KEY (UserId) REFERENCES User(Id)
-            )
-        ''')
-        
-        # Create Company table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS Company (
-                CompanyCode INTEGER PRIMARY KEY,
-                Name TEXT NOT NULL
-            )
-        ''')
-        
-        # Create Category table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS Category (
-                CategoryCode INTEGER PRIMARY KEY,
-                Name TEXT NOT NULL
-            )
-        ''')
-        
-        # Create Product table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS Product (
-                ProductCode INTEGER PRIMARY KEY,
-                Name TEXT NOT NULL,
-                PurchaseCost REAL NOT NULL,
-                SellingPrice REAL NOT NULL,
-                Quantity INTEGER NOT NULL,
-                QuantityLimit INTEGER NOT NULL,
-                CompanyCode INTEGER,
-                CategoryCode INTEGER,
-                FOREIGN KEY (CompanyCode) REFERENCES Company(CompanyCode),
-                FOREIGN KEY (CategoryCode) REFERENCES Category(CategoryCode)
-            )
-        ''')
-        
-        # Create Drug table
-        self.c.execute('''
-                    CREATE TABLE IF NOT EXISTS Drug (
-                        ProductCode INTEGER PRIMARY KEY,
-                        Quality INTEGER,
-                        FOREIGN KEY (ProductCode) REFERENCES Product(ProductCode)
-                    )
-                ''')
-        
-        # Create DrugBatch table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS DrugBatch (
-                BatchCode TEXT PRIMARY KEY,
-                ProductCode INTEGER,
-                Quantity INTEGER NOT NULL,
-                ExpirationDate TEXT NOT NULL,
-                FOREIGN KEY (ProductCode) REFERENCES Product(ProductCode)
-            )
-        ''')
+# Upper bounds, in milliseconds, of the buckets of the call duration histograms. Longer calls fall in a final overflow bucket.
+HISTOGRAM_BOUNDS_MS = (0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000)
 
-         # Create Orders table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS Orders (
-                OrderCode INTEGER PRIMARY KEY,
-                Quantity INTEGER NOT NULL,
-                ProductCode INTEGER,
-                ClientId INTEGER,
-                BillCode INTEGER,
-                FOREIGN KEY (ProductCode) REFERENCES Product(ProductCode),
-                FOREIGN KEY (ClientId) REFERENCES Client(ClientId),
-                FOREIGN KEY (BillCode) REFERENCES Bill(BillCode)
-            )
-        ''')
+# DatabaseManager methods that are not timed, because they do not run queries of their own or return before their work is done
+UNINSTRUMENTED_METHODS = {"cache_stats", "close", "transaction"}
 
-        # Create Client table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS Client (
-                ClientId INTEGER PRIMARY KEY,
-                FullName TEXT NOT NULL,
-                Address TEXT,
-                Phone INTEGER
-            )
-        ''') 
-        # Create PersonalClient table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS PersonalClient (
-                UserId INTEGER,
-                ClientId INTEGER,
-                PRIMARY KEY (UserId, ClientId),
-                FOREIGN KEY (UserId) REFERENCES User(Id),
-                FOREIGN KEY (ClientId) REFERENCES Client(ClientId)
-            )
-        ''')  
-
-        # Create Bill table
-        self.c.execute('''
-            CREATE TABLE IF NOT EXISTS Bill (
-                BillCode INTEGER PRIMARY KEY,
-                Date TEXT,
-                PaymentDate TEXT,
-                ClientId INTEGER,
-                OrderCode INTEGER,
-                FOREIGN KEY (ClientId) REFERENCES Client(ClientId),
-                FOREIGN KEY (OrderCode) REFERENCES Orders(OrderCode)
-            )
-        ''')       
-        
-        # Commit the changes and close the connection
-        self.conn.commit()
+logger = logging.getLogger(__name__)
 
-    def get_all_users(self) -> list[User]:
-        """
-        Retrieves all users from the User table in the database.
+class QueryStats:
+    """
+    Collects call counts, rows returned, SQL statements issued and call duration histograms for every DatabaseManager method.
 
-        Each user's permissions are also retrieved from the UserPermissions table.
+    There is one collector in the process, QUERY_STATS. Statistics cover the calls of all threads and database files.
+    Calls slower than slow_query_threshold are logged as warnings to the database logger,
+    and the statistics are written to dump_path as JSON when the process exits.
 
-        Returns:
-            list[User]: A list of User objects representing all users in the database. Each User object includes the user's permissions.
+    Attributes:
+        slow_query_threshold (float): The duration in seconds above which calls are logged, or None to log none.
+            Read in milliseconds from the DATABASE_SLOW_QUERY_MS environment variable.
+        dump_path (str): The JSON file the statistics are written to on exit, or None to not write them.
+            Read from the DATABASE_STATS_FILE environment variable.
+    """
+    def __init__(self):
         """
-        self.c.execute('SELECT * FROM User')
-        users = []
-        for row in self.c.fetchall():
-            self.c.execute('SELECT * FROM UserPermissions WHERE UserId = ?', (row[0],))
-            perm_row = self.c.fetchone()
-            if perm_row:
-                permissions = UserPermissions(
-                    view_stock=bool(perm_row[1]),
-                    edit_stock=bool(perm_row[2]),
-                    add_products=bool(perm_row[3]),
-                    view_notifications=bool(perm_row[4]),
-                    create_client_list=bool(perm_row[5]),
-                    view_orders=bool(perm_row[6]),
-                    add_orders=bool(perm_row[7]),
-                    change_order_state=bool(perm_row[8]),
-                    view_bills=bool(perm_row[9]),
-                    create_bills=bool(perm_row[10]),
-                    view_salaries=bool(perm_row[11]),
-                    user_administration=bool(perm_row[12])
-                )
-                users.append(User(row[0], row[1], row[2], row[3], permissions))
-        return users
-
-    def get_user_by_username(self, username: str) -> typing.Optional[User]:
+        Initializes a new, empty instance of the QueryStats class.
         """
-        Retrieves a user from the User table in the database by their username.
-
-        The user's permissions are also retrieved from the UserPermissions table.
-
-        Args:
-            username (str): The username of the user to retrieve.
+        threshold = os.environ.get('DATABASE_SLOW_QUERY_MS')
+        self.slow_query_threshold = float(threshold) / 1000 if threshold else None
+        self.dump_path = os.environ.get('DATABASE_STATS_FILE')
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._calls = threading.local()
 
-        Returns:
-            User: A User object representing the user with the given username, if found. The User object includes the user's permissions.
-            None: If no user with the given username is found.
-        """
-        self.c.execute('SELECT * FROM User WHERE Username = ?', (username,))
-        row = self.c.fetchone()
-        if row:
-            self.c.execute('SELECT * FROM UserPermissions WHERE UserId = ?', (row[0],))
-            perm_row = self.c.fetchone()
-            if perm_row:
-                permissions = UserPermissions(
-                    view_stock=bool(perm_row[1]),
-                    edit_stock=bool(perm_row[2]),
-                    add_products=bool(perm_row[3]),
-                    view_notifications=bool(perm_row[4]),
-                    create_client_list=bool(perm_row[5]),
-                    view_orders=bool(perm_row[6]),
-                    add_orders=bool(perm_row[7]),
-                    change_order_state=bool(perm_row[8]),
-                    view_bills=bool(perm_row[9]),
-                    create_bills=bool(perm_row[10]),
-                    view_salaries=bool(perm_row[11]),
-                    user_administration=bool(perm_row[12])
-                )
-                return User(row[0], row[1], row[2], row[3], permissions)
-        return None
-    
-    def update_user(self, user: User):
+    def instrument(self, name: str, method: typing.Callable) -> typing.Callable:
         """
-        Updates a user's details and permissions in the User and UserPermissions tables in the database.
+        Wraps a method so that its calls are recorded.
 
         Args:
-            user (User): The User object containing the updated details and permissions of the user.
-
-        The method updates the user's username, password, and full name in the User table and the user's permissions in the UserPermissions table.
-        """
-        self.c.execute('''
-            UPDATE User SET Username = ?, Password = ?, Fullname = ? WHERE Id = ?
-        ''', (user.username, user.password, user.full_name, user.id))
-        self.c.execute('''
-            UPDATE UserPermissions SET ViewStock = ?, EditStock = ?, AddProduct = ?, ViewNotifications = ?, CreateClientList = ?, ViewOrders = ?, AddOrders = ?, ChangeOrderState = ?, ViewBills = ?, CreateBills = ?, ViewSalaries = ?, UserAdministration = ? WHERE UserId = ?
-        ''', (user.permissions.view_stock, user.permissions.edit_stock, user.permissions.add_products, user.permissions.view_notifications, user.permissions.create_client_list, user.permissions.view_orders, user.permissions.add_orders, user.permissions.change_order_state, user.permissions.view_bills, user.permissions.create_bills, user.permissions.view_salaries, user.permissions.user_administration, user.id))
-        self.conn.commit()
-
-    def insert_user(self, user: User):
-        """
-        Inserts a new user into the User and UserPermissions tables in the database.
-        Given user ID is discarded and a new one is generated automatically.
+            name (str): The name the calls are recorded under.
+            method (Callable): The method to wrap.
 
-        Args:
-            user (User): The User object containing the details and permissions of the user to insert.
+        Returns:
+            Callable: The wrapped method.
+        """
+        @functools.wraps(method)
+        def instrumented(*args, **kwargs):
+            # Statements issued while the call runs are counted in its frame by record_statement, including those of nested calls
+            frame = [0, None]
+            calls = self._active_calls()
+            calls.append(frame)
+            self._calls.last_statement = None
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException:
+                self._record(name, time.perf_counter() - start, frame, 0, True, args[1:], kwargs)
+                raise
+            finally:
+                calls.pop()
+            self._record(name, time.perf_counter() - start, frame, _result_rows(result), False, args[1:], kwargs)
+            return result
+        return instrumented
+
+    def _active_calls(self) -> list:
+        """
+        Returns the frames of the instrumented calls running on the calling thread, innermost last.
 
-        The method inserts the user's username, password, and full name into the User table and the user's permissions into the UserPermissions table.
+        Returns:
+            list: The [statement count, last statement] frames of the running calls.
         """
-        self.c.execute('''
-            INSERT INTO User (Username, Password, Fullname) VALUES (?, ?, ?)
-        ''', (user.username, user.password, user.full_name))
-        user_id = self.c.lastrowid
-        self.c.execute('''
-            INSERT INTO UserPermissions (UserId, ViewStock, EditStock, AddProduct, ViewNotifications, CreateClientList, ViewOrders, AddOrders, ChangeOrderState, ViewBills, CreateBills, ViewSalaries, UserAdministration) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, user.permissions.view_stock, user.permissions.edit_stock, user.permissions.add_products, user.permissions.view_notifications, user.permissions.create_client_list, user.permissions.view_orders, user.permissions.add_orders, user.permissions.change_order_state, user.permissions.view_bills, user.permissions.create_bills, user.permissions.view_salaries, user.permissions.user_administration))
-        self.conn.commit()
+        try:
+            return self._calls.frames
+        except AttributeError:
+            self._calls.frames = []
+            return self._calls.frames
 
-    def get_all_companies(self) -> list[Company]:
+    def start_statement(self):
         """
-        Retrieves all companies from the Company table in the database.
-
-        Returns:
-            list[Company]: A list of Company objects representing all companies in the database.
+        Marks that the calling thread is issuing a new statement, so that record_statement counts it even if it repeats the previous one.
+        Called by _TracedCursor before every execute.
         """
-        self.c.execute('SELECT * FROM Company')
-        companies = [Company(row[0], row[1]) for row in self.c.fetchall()]
-        return companies
+        self._calls.last_statement = None
 
-    def update_company(self, company: Company):
+    def record_statement(self, statement: str):
         """
-        Updates a company's name in the Company table in the database.
+        Counts a SQL statement against the instrumented calls running on the calling thread.
+        Installed as the trace callback of every pooled connection.
 
         Args:
-            company (Company): The Company object containing the updated name of the company.
+            statement (str): The SQL statement being executed.
         """
-        self.c.execute('''
-            UPDATE Company SET Name = ? WHERE CompanyCode = ?
-        ''', (company.name, company.company_code_int))
-        self.conn.commit()
+        # Internal statements and trigger steps are reported as comments starting with "-- TRIGGER" by SQLite,
+        # but the sqlite3 module traces every trigger step, and every row of executemany, with the text of the statement itself.
+        # Those repeats are dropped until start_statement marks a new execute, so statements issued again by a loop are all counted.
+        if statement.startswith('--') or statement == getattr(self._calls, 'last_statement', None):
+            return
+        self._calls.last_statement = statement
+        for frame in self._active_calls():
+            frame[0] += 1
+            frame[1] = statement
 
-    def insert_company(self, company: Company):
+    def _record(self, name: str, duration: float, frame: list, rows: int, failed: bool, args: tuple, kwargs: dict):
         """
-        Inserts a new company into the Company table in the database.
-        Given company code is discarded and a new one is generated automatically.
+        Adds a finished call to the statistics of its method, and logs it if it was slow.
 
         Args:
-            company (Company): The Company object containing the name of the company to insert.
-        """
-        self.c.execute('''
-            INSERT INTO Company (Name) VALUES (?)
-        ''', (company.name,))
-        self.conn.commit()
-
-    def get_all_categories(self) -> list[Category]:
-        """
-        Retrieves all categories from the Category table in the database.
+            name (str): The name of the method.
+            duration (float): The duration of the call in seconds.
+            frame (list): The [statement count, last statement] frame of the call.
+            rows (int): The number of rows or objects the call returned.
+            failed (bool): Whether the call raised an exception.
+            args (tuple): The positional arguments of the call, without self.
+            kwargs (dict): The keyword arguments of the call.
+        """
+        bucket = bisect.bisect_left(HISTOGRAM_BOUNDS_MS, duration * 1000)
+        with self._lock:
+            stats = self._methods.get(name)
+            if stats is None:
+                stats = self._methods[name] = {
+                    'calls': 0, 'errors': 0, 'rows': 0, 'statements': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                    'histogram': [0] * (len(HISTOGRAM_BOUNDS_MS) + 1),
+                }
+            stats['calls'] += 1
+            stats['errors'] += failed
+            stats['rows'] += rows
+            stats['statements'] += frame[0]
+            stats['total_seconds'] += duration
+            stats['max_seconds'] = max(stats['max_seconds'], duration)
+            stats['histogram'][bucket] += 1
+        if self.slow_query_threshold is not None and duration > self.slow_query_threshold:
+            arguments = ', '.join([repr(arg) for arg in args] + [f'{key}={value!r}' for key, value in kwargs.items()])
+            logger.warning('Slow database call %s(%.200s) took %.1f ms and %d statements, the last one being: %s',
+                           name, arguments, duration * 1000, frame[0], ' '.join((frame[1] or '').split()))
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of the statistics collected so far.
 
         Returns:
-            list[Category]: A list of Category objects representing all categories in the database.
+            dict: The statistics of every method called so far, keyed by method name. Each entry holds the number of calls,
+                errors, rows returned and statements issued, the total and maximum duration in seconds,
+                and the histogram of call durations keyed by the upper bound of each bucket in milliseconds.
         """
-        self.c.execute('SELECT * FROM Category')
-        categories = [Category(row[0], row[1]) for row in self.c.fetchall()]
-        return categories
+        labels = [f'<={bound}ms' for bound in HISTOGRAM_BOUNDS_MS] + [f'>{HISTOGRAM_BOUNDS_MS[-1]}ms']
+        with self._lock:
+            return {
+                name: dict(stats, histogram=dict(zip(labels, stats['histogram'])))
+                for name, stats in sorted(self._methods.items())
+            }
 
-    def update_category(self, category: Category):
+    def reset(self):
         """
-        Updates a category's name in the Category table in the database.
-
-        Args:
-            category (Category): The Category object containing the updated name of the category.
+        Discards the statistics collected so far.
         """
-        self.c.execute('''
-            UPDATE Category SET Name = ? WHERE CategoryCode = ?
-        ''', (category.name, category.category_code_int))
-        self.conn.commit()
+        with self._lock:
+            self._methods.clear()
 
-    def insert_category(self, category: Category):
+    def dump(self, path: str):
         """
-        Inserts a new category into the Category table in the database.
-        Given category code is discarded and a new one is generated automatically.
+        Writes the statistics collected so far to a JSON file.
 
         Args:
-            category (Category): The Category object containing the name of the category to insert.
+            path (str): The path of the JSON file, which is overwritten.
         """
-        self.c.execute('''
-            INSERT INTO Category (Name) VALUES (?)
-        ''', (category.name,))
-        self.conn.commit()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
 
-    def get_all_products(self) -> list[Product]:
+    def _dump_at_exit(self):
         """
-        Retrieves all products from the Product table in the database.
-        
-        Returns:
-            list[Product]: A list of Product objects representing all products in the database.
+        Writes the statistics to dump_path, if it is set and any call was recorded. Registered to run when the process exits.
         """
-        self.c.execute('SELECT * FROM Product')
-        products = [Product(row[0], row[1], row[2], row[3], row[4], row[5], self.get_company_by_code(row[6]), self.get_category_by_code(row[7])) for row in self.c.fetchall()]
-        return products
+        if self.dump_path and self._methods:
+            try:
+                self.dump(self.dump_path)
+            except OSError as e:
+                logger.warning('Could not write database statistics to %s: %s', self.dump_path, e)
 
-    def update_product(self, product: Product):
-        """
-        Updates a product's details in the Product table in the database.
-        Given product code is discarded and a new one is generated automatically.
+def _result_rows(result: typing.Any) -> int:
+    """
+    Counts the rows or objects returned by a DatabaseManager method.
+
+    Args:
+        result (Any): The return value of the method.
+
+    Returns:
+        int: The length of a returned list or array, or of the list in the first element of a returned page tuple,
+            0 for None and 1 for any other single value.
+    """
+    if result is None:
+        return 0
+    if isinstance(result, tuple):
+        return len(result[0]) if result and isinstance(result[0], list) else 1
+    if isinstance(result, str) or not hasattr(result, '__len__'):
+        return 1
+    return len(result)
+
+# The statistics of all DatabaseManager calls in the process
+QUERY_STATS = QueryStats()
+atexit.register(QUERY_STATS._dump_at_exit)
+
+class _TracedCursor(sqlite3.Cursor):
+    """
+    Cursor that tells QUERY_STATS when each statement is issued, so that repeated statements are told apart from trigger steps.
+    """
+    def execute(self, sql, parameters=()):
+        QUERY_STATS.start_statement()
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        QUERY_STATS.start_statement()
+        return super().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        QUERY_STATS.start_statement()
+        return super().executescript(sql_script)
+
+class _TracedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors, including those of its execute shortcuts, are _TracedCursor instances.
+    """
+    def cursor(self, factory=_TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def _instrumented(cls: type) -> type:
+    """
+    Class decorator that records the calls of every public method of the class in QUERY_STATS.
+    Generator methods are left alone, the methods they call to fetch each page are recorded instead.
+
+    Args:
+        cls (type): The class to instrument.
+
+    Returns:
+        type: The same class, with its public methods wrapped.
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or name in UNINSTRUMENTED_METHODS or not inspect.isfunction(method) or inspect.isgeneratorfunction(method):
+            continue
+        setattr(cls, name, QUERY_STATS.instrument(name, method))
+    return cls
+
+class ConnectionPool:
+    """
+    Hands out reusable connections to a single SQLite3 database file.
+
+    There is one pool per database file and profile in the process, obtained with ConnectionPool.for_path.
+    A connection is checked out with checkout and handed back with checkin, after which it can be reused.
+    Connections are only reused by the thread that opened them, since a sqlite3 connection cannot be used from another thread.
+    The idle connections of a thread are closed when the thread exits.
+
+    An in-memory database only exists on the connection that opened it, so for_path gives every ':memory:' caller a pool of its own.
+
+    Attributes:
+        database_path (str): The path to the SQLite3 database file.
+        profile (str): The name of the DATABASE_PROFILES entry applied to new connections.
+        schema_ready (bool): Whether the schema of the database has already been checked by this process.
+        open_connections (int): The number of connections of this pool that are currently open, whether checked out or idle.
+        idle_connections (int): The number of open connections that are waiting to be checked out again.
+    """
+    # The maximum number of idle connections kept for each thread, further connections are closed when checked in
+    MAX_IDLE_PER_THREAD = 4
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, database_path: str, profile: str = DEFAULT_PROFILE):
+        """
+        Initializes a new, empty instance of the ConnectionPool class.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+            profile (str): The name of the DATABASE_PROFILES entry applied to new connections.
+
+        Raises:
+            ValueError: If there is no profile with the given name.
+        """
+        if profile not in DATABASE_PROFILES:
+            raise ValueError(f"Unknown database profile: {profile}")
+        self.database_path = database_path
+        self.profile = profile
+        self.schema_ready = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._open_connections = 0
+        self._idle_connections = 0
+
+    @classmethod
+    def for_path(cls, database_path: str, profile: str = DEFAULT_PROFILE) -> 'ConnectionPool':
+        """
+        Returns the pool of the given database file and profile, creating it the first time they are used.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+            profile (str): The name of the DATABASE_PROFILES entry applied to new connections.
+
+        Returns:
+            ConnectionPool: The process-wide pool of the database file and profile, or a new pool for an in-memory database.
+        """
+        database_path = os.fspath(database_path)
+        if database_path == ':memory:':
+            return cls(database_path, profile)
+        key = (os.path.abspath(database_path), profile)
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls._pools[key] = cls(database_path, profile)
+            return pool
+
+    @property
+    def open_connections(self) -> int:
+        """
+        Returns the number of connections of this pool that are currently open.
+
+        Returns:
+            int: The number of open connections, whether checked out or idle.
+        """
+        return self._open_connections
+
+    @property
+    def idle_connections(self) -> int:
+        """
+        Returns the number of open connections that are waiting to be checked out again.
+
+        Returns:
+            int: The number of idle connections, across all threads.
+        """
+        return self._idle_connections
+
+    def _thread_idle(self) -> list[sqlite3.Connection]:
+        """
+        Returns the idle connections of the calling thread, which are dropped from the pool when the thread exits.
+
+        Returns:
+            list[sqlite3.Connection]: The idle connections of the calling thread.
+        """
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = _ThreadIdleConnections()
+            # The thread-local holder is released when the thread exits, even if it never called close_idle
+            weakref.finalize(idle, ConnectionPool._discard_idle, weakref.ref(self), idle.connections)
+        return idle.connections
+
+    @staticmethod
+    def _discard_idle(pool_ref: 'weakref.ref[ConnectionPool]', connections: list[sqlite3.Connection]):
+        """
+        Drops the idle connections of a thread that exited, or of a pool that was discarded, closing them as they are released.
+
+        Args:
+            pool_ref (weakref.ref[ConnectionPool]): The pool the connections belong to, which may already be gone.
+            connections (list[sqlite3.Connection]): The idle connections of the thread.
+        """
+        pool = pool_ref()
+        if pool is not None:
+            with pool._lock:
+                pool._open_connections -= len(connections)
+                pool._idle_connections -= len(connections)
+        # close() refuses connections of another thread, releasing the last reference closes them on any thread
+        connections.clear()
+
+    def checkout(self) -> sqlite3.Connection:
+        """
+        Checks out a connection for the calling thread, reusing an idle one when available.
+
+        Returns:
+            sqlite3.Connection: A connection to the database that the caller must hand back with checkin.
+        """
+        idle = self._thread_idle()
+        with self._lock:
+            if idle:
+                self._idle_connections -= 1
+                return idle.pop()
+            self._open_connections += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._open_connections -= 1
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Opens a new connection to the database and applies the settings of the pool's profile.
+
+        Returns:
+            sqlite3.Connection: The new connection.
+        """
+        conn = sqlite3.connect(self.database_path, factory=_TracedConnection)
+        try:
+            for name, value in DATABASE_PROFILES[self.profile].items():
+                conn.execute(f'PRAGMA {name} = {value}')
+            conn.create_function('casefold', 1, _casefold, deterministic=True)
+            conn.set_trace_callback(QUERY_STATS.record_statement)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def checkin(self, conn: sqlite3.Connection):
+        """
+        Hands a connection back to the pool so that the calling thread can reuse it.
+        Any transaction left open on the connection is rolled back.
+
+        Args:
+            conn (sqlite3.Connection): A connection previously returned by checkout on the same thread.
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        idle = self._thread_idle()
+        with self._lock:
+            if len(idle) < self.MAX_IDLE_PER_THREAD:
+                idle.append(conn)
+                self._idle_connections += 1
+                return
+            self._open_connections -= 1
+        conn.close()
+
+    def close_idle(self):
+        """
+        Closes the idle connections of the calling thread.
+        """
+        idle = self._thread_idle()
+        with self._lock:
+            connections = idle[:]
+            idle.clear()
+            self._open_connections -= len(connections)
+            self._idle_connections -= len(connections)
+        for conn in connections:
+            conn.close()
+
+class _ThreadIdleConnections:
+    """
+    Holds the idle connections of one thread of a ConnectionPool, in a thread-local so that it is released when the thread exits.
+
+    Attributes:
+        connections (list[sqlite3.Connection]): The idle connections of the thread.
+    """
+    def __init__(self):
+        """
+        Initializes a new, empty instance of the _ThreadIdleConnections class.
+        """
+        self.connections = []
+
+class IdentityMap:
+    """
+    Keeps a single Company, Category or UserPermissions instance per code for a database file, so that repeated lookups do not query the database.
+    UserPermissions are keyed by user ID.
+
+    There is one identity map per database file in the process, obtained with IdentityMap.for_path.
+    Every in-memory database is a separate database, so each ':memory:' caller gets an identity map of its own.
+    Entries are invalidated by the DatabaseManager methods that change the cached rows.
+
+    Attributes:
+        hits (int): The number of lookups answered from the map.
+        misses (int): The number of lookups that had to query the database.
+    """
+    _maps = {}
+    _maps_lock = threading.Lock()
+
+    def __init__(self):
+        """
+        Initializes a new, empty instance of the IdentityMap class.
+        """
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @classmethod
+    def for_path(cls, database_path: str) -> 'IdentityMap':
+        """
+        Returns the identity map of the given database file, creating it the first time the file is used.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+
+        Returns:
+            IdentityMap: The process-wide identity map of the database file, or a new identity map for an in-memory database.
+        """
+        database_path = os.fspath(database_path)
+        if database_path == ':memory:':
+            return cls()
+        key = os.path.abspath(database_path)
+        with cls._maps_lock:
+            identity_map = cls._maps.get(key)
+            if identity_map is None:
+                identity_map = cls._maps[key] = cls()
+            return identity_map
+
+    def get(self, kind: type, code: int, load: typing.Callable[[], typing.Optional[object]]) -> typing.Optional[object]:
+        """
+        Returns the instance of the given type and code, loading it with load the first time it is requested.
+        Codes that are not found are not remembered, so that they are looked up again once inserted.
+
+        Args:
+            kind (type): The class of the instance, Company, Category or UserPermissions.
+            code (int): The code of the instance.
+            load (Callable): Loads the instance from the database, returning None if it does not exist.
+
+        Returns:
+            object: The shared instance with the given code, or None if it does not exist.
+        """
+        key = (kind, code)
+        with self._lock:
+            instance = self._entries.get(key)
+            if instance is not None:
+                self.hits += 1
+                return instance
+            self.misses += 1
+        instance = load()
+        if instance is None:
+            return None
+        with self._lock:
+            # Another thread may have loaded the same code meanwhile, keep the instance it stored
+            return self._entries.setdefault(key, instance)
+
+    def invalidate(self, kind: type, code: typing.Optional[int] = None):
+        """
+        Drops the instance of the given type and code, or every instance of the type if no code is given.
+
+        Args:
+            kind (type): The class of the instances to drop, Company, Category or UserPermissions.
+            code (int): The code of the instance to drop.
+        """
+        with self._lock:
+            if code is not None:
+                self._entries.pop((kind, code), None)
+                return
+            for key in [key for key in self._entries if key[0] is kind]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Drops every instance in the map.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the map.
+
+        Returns:
+            dict: The number of hits and misses so far and the number of instances currently held, under the keys hits, misses and size.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+# Selects every product column together with the name of its company and category, and the quality of drugs (NULL for other products)
+PRODUCT_SELECT = '''
+    SELECT Product.ProductCode, Product.Name, Product.PurchaseCost, Product.SellingPrice,
+           Product.Quantity, Product.QuantityLimit, Product.CompanyCode, Product.CategoryCode,
+           Company.Name, Category.Name, Drug.Quality
+    FROM Product
+    LEFT JOIN Company ON Company.CompanyCode = Product.CompanyCode
+    LEFT JOIN Category ON Category.CategoryCode = Product.CategoryCode
+    LEFT JOIN Drug ON Drug.ProductCode = Product.ProductCode
+'''
+
+# Selects the open stock alerts, with the columns of PRODUCT_SELECT followed by the alert ID and the time the alert was raised.
+# CROSS JOIN makes SQLite read the few open alerts first and look their products up, whatever the table statistics say.
+STOCK_ALERT_SELECT = '''
+    SELECT Product.ProductCode, Product.Name, Product.PurchaseCost, Product.SellingPrice,
+           Product.Quantity, Product.QuantityLimit, Product.CompanyCode, Product.CategoryCode,
+           Company.Name, Category.Name, Drug.Quality, StockAlert.AlertId, StockAlert.RaisedAt
+    FROM StockAlert
+    CROSS JOIN Product ON Product.ProductCode = StockAlert.ProductCode
+    LEFT JOIN Company ON Company.CompanyCode = Product.CompanyCode
+    LEFT JOIN Category ON Category.CategoryCode = Product.CategoryCode
+    LEFT JOIN Drug ON Drug.ProductCode = Product.ProductCode
+    WHERE StockAlert.ClearedAt IS NULL
+'''
+
+# The columns products can be sorted by in search_products
+PRODUCT_ORDER_COLUMNS = {
+    "code": "Product.ProductCode",
+    "name": "Product.Name",
+    "quantity": "Product.Quantity",
+    "category": "Category.Name",
+    "company": "Company.Name",
+}
+
+# The maximum number of values bound to a single IN list, well below the SQLite limit on query parameters
+MAX_QUERY_PARAMETERS = 500
+
+# The columns product, client and user pages can be sorted by in keyset pagination, with their index in the selected rows.
+# Each one is backed by an index, so that a page costs the same however deep it is.
+PRODUCT_KEYSET_COLUMNS = {
+    "code": ("Product.ProductCode", 0),
+    "name": ("Product.Name", 1),
+    "quantity": ("Product.Quantity", 4),
+}
+
+CLIENT_KEYSET_COLUMNS = {
+    "id": ("Client.ClientId", 0),
+    "name": ("Client.FullName", 1),
+}
+
+USER_KEYSET_COLUMNS = {
+    "id": ("User.Id", 0),
+    "username": ("User.Username", 1),
+}
+
+# The fields of the structured array returned by inventory_snapshot, with their NumPy type and the Product column they are read from.
+# Products without a company or category have 0 in company_code or category_code, since codes start at 1.
+INVENTORY_FIELDS = [
+    ("product_code", "i8", "ProductCode"),
+    ("quantity", "i8", "Quantity"),
+    ("quantity_limit", "i8", "QuantityLimit"),
+    ("purchase_cost", "f8", "PurchaseCost"),
+    ("selling_price", "f8", "SellingPrice"),
+    ("company_code", "i8", "COALESCE(CompanyCode, 0)"),
+    ("category_code", "i8", "COALESCE(CategoryCode, 0)"),
+]
+
+PRODUCT_INSERT = '''
+    INSERT INTO Product (ProductCode, Name, PurchaseCost, SellingPrice, Quantity, QuantityLimit, CompanyCode, CategoryCode) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# The stock of a drug follows its batches, so the quantity is only written for products that are not drugs
+PRODUCT_UPDATE = '''
+    UPDATE Product SET Name = ?, PurchaseCost = ?, SellingPrice = ?, Quantity = CASE WHEN BatchQuantity IS NULL THEN ? ELSE Quantity END,
+                       QuantityLimit = ?, CompanyCode = ?, CategoryCode = ? WHERE ProductCode = ?
+'''
+
+PRODUCT_ADJUST_QUANTITY = '''
+    UPDATE Product SET Quantity = Quantity + ? WHERE ProductCode = ? RETURNING Quantity
+'''
+
+DRUG_BATCH_INSERT = '''
+    INSERT INTO DrugBatch (BatchCode, ProductCode, Quantity, ExpirationDate) VALUES (?, ?, ?, ?)
+'''
+
+# Selects every user column, the last one being the bitmask of the user's permissions
+USER_SELECT = '''
+    SELECT User.Id, User.Username, User.Password, User.Fullname, User.Permissions
+    FROM User
+'''
+
+def _migration_create_tables(c: sqlite3.Cursor):
+    """
+    Schema version 1: creates the tables of the application.
+    Tables that already exist, from databases created before schema versioning, are kept as they are.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    # Create User table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS User (
+            Id INTEGER PRIMARY KEY,
+            Username TEXT NOT NULL UNIQUE,
+            Password TEXT NOT NULL,
+            Fullname TEXT NOT NULL
+        )
+    ''')
+    
+    # Create UserPermissions table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS UserPermissions (
+            UserId INTEGER NOT NULL,
+            ViewStock INTEGER NOT NULL,
+            EditStock INTEGER NOT NULL,
+            AddProduct INTEGER NOT NULL,
+            ViewNotifications INTEGER NOT NULL,
+            CreateClientList INTEGER NOT NULL,
+            ViewOrders INTEGER NOT NULL,
+            AddOrders INTEGER NOT NULL,
+            ChangeOrderState INTEGER NOT NULL,
+            ViewBills INTEGER NOT NULL,
+            CreateBills INTEGER NOT NULL,
+            ViewSalaries INTEGER NOT NULL,
+            UserAdministration INTEGER NOT NULL,
+            PRIMARY KEY (UserId),
+            FOREIGN KEY (UserId) REFERENCES User(Id)
+        )
+    ''')
+    
+    # Create Company table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS Company (
+            CompanyCode INTEGER PRIMARY KEY,
+            Name TEXT NOT NULL
+        )
+    ''')
+    
+    # Create Category table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS Category (
+            CategoryCode INTEGER PRIMARY KEY,
+            Name TEXT NOT NULL
+        )
+    ''')
+    
+    # Create Product table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS Product (
+            ProductCode INTEGER PRIMARY KEY,
+            Name TEXT NOT NULL,
+            PurchaseCost REAL NOT NULL,
+            SellingPrice REAL NOT NULL,
+            Quantity INTEGER NOT NULL,
+            QuantityLimit INTEGER NOT NULL,
+            CompanyCode INTEGER,
+            CategoryCode INTEGER,
+            FOREIGN KEY (CompanyCode) REFERENCES Company(CompanyCode),
+            FOREIGN KEY (CategoryCode) REFERENCES Category(CategoryCode)
+        )
+    ''')
+    
+    # Create Drug table
+    c.execute('''
+                CREATE TABLE IF NOT EXISTS Drug (
+                    ProductCode INTEGER PRIMARY KEY,
+                    Quality INTEGER,
+                    FOREIGN KEY (ProductCode) REFERENCES Product(ProductCode)
+                )
+            ''')
+    
+    # Create DrugBatch table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS DrugBatch (
+            BatchCode TEXT PRIMARY KEY,
+            ProductCode INTEGER,
+            Quantity INTEGER NOT NULL,
+            ExpirationDate TEXT NOT NULL,
+            FOREIGN KEY (ProductCode) REFERENCES Product(ProductCode)
+        )
+    ''')
+
+     # Create Orders table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS Orders (
+            OrderCode INTEGER PRIMARY KEY,
+            Quantity INTEGER NOT NULL,
+            ProductCode INTEGER,
+            ClientId INTEGER,
+            BillCode INTEGER,
+            FOREIGN KEY (ProductCode) REFERENCES Product(ProductCode),
+            FOREIGN KEY (ClientId) REFERENCES Client(ClientId),
+            FOREIGN KEY (BillCode) REFERENCES Bill(BillCode)
+        )
+    ''')
+
+    # Create Client table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS Client (
+            ClientId INTEGER PRIMARY KEY,
+            FullName TEXT NOT NULL,
+            Address TEXT,
+            Phone INTEGER
+        )
+    ''') 
+    # Create PersonalClient table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS PersonalClient (
+            UserId INTEGER,
+            ClientId INTEGER,
+            PRIMARY KEY (UserId, ClientId),
+            FOREIGN KEY (UserId) REFERENCES User(Id),
+            FOREIGN KEY (ClientId) REFERENCES Client(ClientId)
+        )
+    ''')  
+
+    # Create Bill table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS Bill (
+            BillCode INTEGER PRIMARY KEY,
+            Date TEXT,
+            PaymentDate TEXT,
+            ClientId INTEGER,
+            OrderCode INTEGER,
+            FOREIGN KEY (ClientId) REFERENCES Client(ClientId),
+            FOREIGN KEY (OrderCode) REFERENCES Orders(OrderCode)
+        )
+    ''')
+
+def _migration_create_indexes(c: sqlite3.Cursor):
+    """
+    Schema version 2: creates secondary indexes for the foreign keys that queries filter or join on.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    # Batches of a product
+    c.execute('CREATE INDEX IF NOT EXISTS IX_DrugBatch_ProductCode ON DrugBatch (ProductCode)')
+
+    # Products of a category or company
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Product_CategoryCode ON Product (CategoryCode)')
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Product_CompanyCode ON Product (CompanyCode)')
+
+    # Users that have a client in their personal list, the primary key already covers lookups by UserId
+    c.execute('CREATE INDEX IF NOT EXISTS IX_PersonalClient_ClientId ON PersonalClient (ClientId)')
+
+    # Orders and bills of a client, orders of a product
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Orders_ClientId ON Orders (ClientId)')
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Orders_ProductCode ON Orders (ProductCode)')
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Bill_ClientId ON Bill (ClientId)')
+
+# Greek letters with accents or diaeresis and the final sigma, mapped to the letters the product search index stores instead.
+# The index tokenizer folds case and removes Latin diacritics on its own, but keeps these.
+GREEK_SEARCH_FOLDING = {
+    'ά': 'α', 'έ': 'ε', 'ή': 'η', 'ί': 'ι', 'ό': 'ο', 'ύ': 'υ', 'ώ': 'ω',
+    'ϊ': 'ι', 'ϋ': 'υ', 'ΐ': 'ι', 'ΰ': 'υ', 'ς': 'σ',
+    'Ά': 'Α', 'Έ': 'Ε', 'Ή': 'Η', 'Ί': 'Ι', 'Ό': 'Ο', 'Ύ': 'Υ', 'Ώ': 'Ω',
+    'Ϊ': 'Ι', 'Ϋ': 'Υ',
+}
+
+_GREEK_SEARCH_TRANSLATION = str.maketrans(GREEK_SEARCH_FOLDING)
+
+def normalize_search_text(text: str) -> str:
+    """
+    Folds Greek accents, diaeresis and final sigma in text the same way the product search index does.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    return text.translate(_GREEK_SEARCH_TRANSLATION)
+
+def _normalize_search_sql(expression: str) -> str:
+    """
+    Returns an SQL expression that applies normalize_search_text to the value of another SQL expression.
+    Plain SQL is used so that the search index triggers work on every connection, without any registered function.
+
+    Args:
+        expression (str): The SQL expression to normalize.
+
+    Returns:
+        str: The normalizing SQL expression.
+    """
+    for letter, folded in GREEK_SEARCH_FOLDING.items():
+        expression = f"replace({expression}, '{letter}', '{folded}')"
+    return expression
+
+def _migration_create_product_search(c: sqlite3.Cursor):
+    """
+    Schema version 3: creates the ProductSearch full-text index over product, category and company names.
+    The index rowid is the product code and triggers keep it in sync with the Product, Category and Company tables.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5(
+            Name,
+            CategoryName,
+            CompanyName,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+
+    insert_product = f'''
+        INSERT INTO ProductSearch (rowid, Name, CategoryName, CompanyName) VALUES (
+            NEW.ProductCode,
+            {_normalize_search_sql('NEW.Name')},
+            {_normalize_search_sql('(SELECT Name FROM Category WHERE CategoryCode = NEW.CategoryCode)')},
+            {_normalize_search_sql('(SELECT Name FROM Company WHERE CompanyCode = NEW.CompanyCode)')}
+        );
+    '''
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS TR_Product_Insert_Search AFTER INSERT ON Product BEGIN
+            {insert_product}
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS TR_Product_Update_Search AFTER UPDATE OF ProductCode, Name, CategoryCode, CompanyCode ON Product BEGIN
+            DELETE FROM ProductSearch WHERE rowid = OLD.ProductCode;
+            {insert_product}
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_Product_Delete_Search AFTER DELETE ON Product BEGIN
+            DELETE FROM ProductSearch WHERE rowid = OLD.ProductCode;
+        END
+    ''')
+
+    # Categories and companies may be created or renamed after the products that reference them
+    for table, column in (('Category', 'CategoryName'), ('Company', 'CompanyName')):
+        update_products = f'''
+            UPDATE ProductSearch SET {column} = {_normalize_search_sql('NEW.Name')}
+            WHERE rowid IN (SELECT ProductCode FROM Product WHERE {table}Code = NEW.{table}Code);
+        '''
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS TR_{table}_Insert_Search AFTER INSERT ON {table} BEGIN
+                {update_products}
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS TR_{table}_Update_Search AFTER UPDATE OF Name ON {table} BEGIN
+                {update_products}
+            END
+        ''')
+
+    c.execute('DELETE FROM ProductSearch')
+    c.execute(f'''
+        INSERT INTO ProductSearch (rowid, Name, CategoryName, CompanyName)
+        SELECT Product.ProductCode,
+               {_normalize_search_sql('Product.Name')},
+               {_normalize_search_sql('Category.Name')},
+               {_normalize_search_sql('Company.Name')}
+        FROM Product
+        LEFT JOIN Category ON Category.CategoryCode = Product.CategoryCode
+        LEFT JOIN Company ON Company.CompanyCode = Product.CompanyCode
+    ''')
+
+def _migration_create_sort_indexes(c: sqlite3.Cursor):
+    """
+    Schema version 4: creates indexes for the columns that product and client pages can be sorted by.
+    The primary key is implicitly the last column of each index, which keyset pagination uses to break ties.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Product_Name ON Product (Name)')
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Product_Quantity ON Product (Quantity)')
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Client_FullName ON Client (FullName)')
+
+# The tables whose codes are handed out by the Sequence table, keyed by sequence name, with their primary key column
+SEQUENCES = {
+    "Product": "ProductCode",
+    "Company": "CompanyCode",
+    "Category": "CategoryCode",
+    "Client": "ClientId",
+}
+
+def _migration_create_sequences(c: sqlite3.Cursor):
+    """
+    Schema version 5: creates the Sequence table, which holds the next free code of each table in SEQUENCES.
+
+    Each sequence starts after the largest existing code. Triggers move a sequence past any code that is inserted explicitly,
+    so codes handed out by allocate_codes never collide with rows inserted by other means.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS Sequence (
+            Name TEXT PRIMARY KEY,
+            NextValue INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for table, column in SEQUENCES.items():
+        c.execute(f'INSERT OR IGNORE INTO Sequence (Name, NextValue) SELECT ?, COALESCE(MAX({column}), 0) + 1 FROM {table}', (table,))
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS TR_{table}_Insert_Sequence AFTER INSERT ON {table} BEGIN
+                UPDATE Sequence SET NextValue = NEW.{column} + 1 WHERE Name = '{table}' AND NextValue <= NEW.{column};
+            END
+        ''')
+
+def _permission_mask_sql(row: str) -> str:
+    """
+    Builds the SQL expression that packs the permission columns of a UserPermissions row into a bitmask.
+
+    Args:
+        row (str): The name of the row whose columns are packed, e.g. NEW in a trigger.
+
+    Returns:
+        str: The SQL expression of the bitmask.
+    """
+    # The bitwise operators of SQLite share one precedence level, so every term is parenthesized
+    return ' | '.join(f'(({row}.{column} <> 0) << {index})' for index, column in enumerate(PERMISSION_COLUMNS.values()))
+
+def _migration_pack_permissions(c: sqlite3.Cursor):
+    """
+    Schema version 6: moves the permissions of each user into the User.Permissions bitmask.
+
+    The UserPermissions table is replaced by a view with the same columns, computed from the bitmask,
+    whose triggers write inserts, updates and deletes through to User.Permissions, so that existing queries keep working.
+    A database that already has the view is left as it is.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute("SELECT type FROM sqlite_master WHERE name = 'UserPermissions'")
+    if c.fetchone()[0] == 'view':
+        return
+
+    c.execute('ALTER TABLE User ADD COLUMN Permissions INTEGER NOT NULL DEFAULT 0')
+    c.execute(f'''
+        UPDATE User SET Permissions = COALESCE((
+            SELECT {_permission_mask_sql('UserPermissions')} FROM UserPermissions WHERE UserPermissions.UserId = User.Id
+        ), 0)
+    ''')
+    c.execute('DROP TABLE UserPermissions')
+
+    columns = ', '.join(f'(Permissions >> {index}) & 1 AS {column}' for index, column in enumerate(PERMISSION_COLUMNS.values()))
+    c.execute(f'CREATE VIEW UserPermissions AS SELECT Id AS UserId, {columns} FROM User')
+    c.execute(f'''
+        CREATE TRIGGER TR_UserPermissions_Insert INSTEAD OF INSERT ON UserPermissions BEGIN
+            UPDATE User SET Permissions = {_permission_mask_sql('NEW')} WHERE Id = NEW.UserId;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER TR_UserPermissions_Update INSTEAD OF UPDATE ON UserPermissions BEGIN
+            UPDATE User SET Permissions = {_permission_mask_sql('NEW')} WHERE Id = OLD.UserId;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER TR_UserPermissions_Delete INSTEAD OF DELETE ON UserPermissions BEGIN
+            UPDATE User SET Permissions = 0 WHERE Id = OLD.UserId;
+        END
+    ''')
+
+def _migration_create_stock_alerts(c: sqlite3.Cursor):
+    """
+    Schema version 7: creates the StockAlert table, which records every time the stock of a product falls below its quantity limit.
+
+    Triggers on Product keep the table up to date: an alert is raised when a product goes below its limit and cleared when it is back at or above it.
+    The open alerts, whose ClearedAt is NULL, have a partial index of their own, so reading them costs the number of open alerts rather than a scan of Product.
+    Products that are already below their limit get an open alert.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS StockAlert (
+            AlertId INTEGER PRIMARY KEY,
+            ProductCode INTEGER NOT NULL,
+            RaisedAt TEXT NOT NULL,
+            ClearedAt TEXT
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS IX_StockAlert_ProductCode ON StockAlert (ProductCode)')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS UX_StockAlert_Open ON StockAlert (ProductCode) WHERE ClearedAt IS NULL')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_Product_Insert_StockAlert AFTER INSERT ON Product
+        WHEN NEW.Quantity < NEW.QuantityLimit BEGIN
+            INSERT INTO StockAlert (ProductCode, RaisedAt) VALUES (NEW.ProductCode, datetime('now'));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_Product_Update_StockAlert_Raise AFTER UPDATE OF Quantity, QuantityLimit ON Product
+        WHEN NEW.Quantity < NEW.QuantityLimit AND OLD.Quantity >= OLD.QuantityLimit BEGIN
+            INSERT INTO StockAlert (ProductCode, RaisedAt) VALUES (NEW.ProductCode, datetime('now'));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_Product_Update_StockAlert_Clear AFTER UPDATE OF Quantity, QuantityLimit ON Product
+        WHEN NEW.Quantity >= NEW.QuantityLimit AND OLD.Quantity < OLD.QuantityLimit BEGIN
+            UPDATE StockAlert SET ClearedAt = datetime('now') WHERE ProductCode = NEW.ProductCode AND ClearedAt IS NULL;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_Product_Delete_StockAlert AFTER DELETE ON Product BEGIN
+            DELETE FROM StockAlert WHERE ProductCode = OLD.ProductCode;
+        END
+    ''')
+    c.execute('''
+        INSERT INTO StockAlert (ProductCode, RaisedAt)
+        SELECT ProductCode, datetime('now') FROM Product
+        WHERE Quantity < QuantityLimit AND ProductCode NOT IN (SELECT ProductCode FROM StockAlert WHERE ClearedAt IS NULL)
+    ''')
+
+def _migration_normalize_expiration_dates(c: sqlite3.Cursor):
+    """
+    Schema version 8: rewrites the expiration dates of the drug batches as ISO dates and indexes them,
+    so that batches can be found and sorted by expiration date without parsing every row.
+
+    The index also holds the product code, so that batches expiring on the same day are listed by product straight from the index.
+    Dates that cannot be read are left as they are and logged.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute('SELECT BatchCode, ExpirationDate FROM DrugBatch')
+    updates = []
+    for batch_code, expiration_date in c.fetchall():
+        try:
+            normalized = _format_date(expiration_date)
+        except ValueError:
+            logger.warning("Batch %s has an unreadable expiration date %r, left unchanged", batch_code, expiration_date)
+            continue
+        if normalized != expiration_date:
+            updates.append((normalized, batch_code))
+    c.executemany('UPDATE DrugBatch SET ExpirationDate = ? WHERE BatchCode = ?', updates)
+    c.execute('CREATE INDEX IF NOT EXISTS IX_DrugBatch_ExpirationDate ON DrugBatch (ExpirationDate, ProductCode)')
+
+def _migration_create_batch_expiry_index(c: sqlite3.Cursor):
+    """
+    Schema version 9: replaces the index of the batches of a product with one that also holds their expiration date,
+    so that the batches of a product are read in first-expire-first-out order straight from the index.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute('CREATE INDEX IF NOT EXISTS IX_DrugBatch_ProductCode_ExpirationDate ON DrugBatch (ProductCode, ExpirationDate)')
+    # Lookups by product code use the leading column of the new index
+    c.execute('DROP INDEX IF EXISTS IX_DrugBatch_ProductCode')
+
+def _migration_cache_batch_quantities(c: sqlite3.Cursor):
+    """
+    Schema version 10: caches the total quantity of the batches of every drug in Product.BatchQuantity, which is NULL for products that are not drugs.
+
+    Triggers on DrugBatch add the change in quantity of every inserted, updated or deleted batch to both Product.Quantity and Product.BatchQuantity,
+    so the stock of a drug follows its batches without summing them. The two only disagree when the stock of a drug is changed
+    without a batch, and a partial index holds exactly those products, so auditing them does not read the other products.
+    The cache is filled from the existing batches, the stock of the products is left as it is.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute("SELECT COUNT(*) FROM pragma_table_info('Product') WHERE name = 'BatchQuantity'")
+    if not c.fetchone()[0]:
+        c.execute('ALTER TABLE Product ADD COLUMN BatchQuantity INTEGER')
+    c.execute('''
+        UPDATE Product SET BatchQuantity = (SELECT COALESCE(SUM(Quantity), 0) FROM DrugBatch WHERE DrugBatch.ProductCode = Product.ProductCode)
+        WHERE ProductCode IN (SELECT ProductCode FROM Drug)
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS IX_Product_BatchQuantity_Mismatch ON Product (ProductCode) WHERE Quantity <> BatchQuantity')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_Drug_Insert_BatchQuantity AFTER INSERT ON Drug BEGIN
+            UPDATE Product SET BatchQuantity = (SELECT COALESCE(SUM(Quantity), 0) FROM DrugBatch WHERE ProductCode = NEW.ProductCode)
+            WHERE ProductCode = NEW.ProductCode;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_Drug_Delete_BatchQuantity AFTER DELETE ON Drug BEGIN
+            UPDATE Product SET BatchQuantity = NULL WHERE ProductCode = OLD.ProductCode;
+        END
+    ''')
+    # Products that are not drugs have no BatchQuantity, their stock is not tied to batches
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_DrugBatch_Insert_Quantity AFTER INSERT ON DrugBatch BEGIN
+            UPDATE Product SET Quantity = Quantity + NEW.Quantity, BatchQuantity = BatchQuantity + NEW.Quantity
+            WHERE ProductCode = NEW.ProductCode AND BatchQuantity IS NOT NULL;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_DrugBatch_Update_Quantity AFTER UPDATE OF ProductCode, Quantity ON DrugBatch
+        WHEN OLD.Quantity IS NOT NEW.Quantity OR OLD.ProductCode IS NOT NEW.ProductCode BEGIN
+            UPDATE Product SET Quantity = Quantity - OLD.Quantity, BatchQuantity = BatchQuantity - OLD.Quantity
+            WHERE ProductCode = OLD.ProductCode AND BatchQuantity IS NOT NULL;
+            UPDATE Product SET Quantity = Quantity + NEW.Quantity, BatchQuantity = BatchQuantity + NEW.Quantity
+            WHERE ProductCode = NEW.ProductCode AND BatchQuantity IS NOT NULL;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS TR_DrugBatch_Delete_Quantity AFTER DELETE ON DrugBatch BEGIN
+            UPDATE Product SET Quantity = Quantity - OLD.Quantity, BatchQuantity = BatchQuantity - OLD.Quantity
+            WHERE ProductCode = OLD.ProductCode AND BatchQuantity IS NOT NULL;
+        END
+    ''')
+
+def _migration_index_batches_in_stock(c: sqlite3.Cursor):
+    """
+    Schema version 11: limits the expiration date index to the batches that still hold stock.
+
+    Allocation drains batches to zero without deleting them, and the drained batches are the ones that expire first,
+    so with the full index every expiring batch lookup stepped over all of them before reaching a batch with stock.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the migration with.
+    """
+    c.execute('CREATE INDEX IF NOT EXISTS IX_DrugBatch_ExpirationDate_InStock ON DrugBatch (ExpirationDate, ProductCode) WHERE Quantity > 0')
+    c.execute('DROP INDEX IF EXISTS IX_DrugBatch_ExpirationDate')
+
+# The migrations that bring the schema to each version, in order. A database at version N has had the first N migrations applied.
+# New tables, columns and indexes must be added as a new migration at the end of the list, existing migrations must never change.
+MIGRATIONS = [
+    _migration_create_tables,
+    _migration_create_indexes,
+    _migration_create_product_search,
+    _migration_create_sort_indexes,
+    _migration_create_sequences,
+    _migration_pack_permissions,
+    _migration_create_stock_alerts,
+    _migration_normalize_expiration_dates,
+    _migration_create_batch_expiry_index,
+    _migration_cache_batch_quantities,
+    _migration_index_batches_in_stock,
+]
+
+# The schema version of a fully migrated database, stored in PRAGMA user_version
+SCHEMA_VERSION = len(MIGRATIONS)
+
+@_instrumented
+class DatabaseManager:
+    """
+    Manages interactions with the SQLite3 database.
+
+    Attributes:
+        pool (ConnectionPool): The pool the connection was checked out from.
+        identity_map (IdentityMap): The shared Company, Category and UserPermissions instances of the database file.
+        conn (sqlite3.Connection): The connection to the SQLite3 database.
+        c (sqlite3.Cursor): The cursor for executing SQL statements.
+    """
+    def __init__(self, database_path='database.db', profile=DEFAULT_PROFILE):
+        """
+        Initializes a new instance of the DatabaseManager class, checking out a connection to the SQLite3 database from its pool and creating a cursor for executing SQL statements.
+
+        The tables are only created the first time the database is opened by the process, or every time for an in-memory database.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+            profile (str): The name of the DATABASE_PROFILES entry with the connection settings to use.
+
+        Raises:
+            ValueError: If there is no profile with the given name.
+        """
+        self.pool = ConnectionPool.for_path(database_path, profile)
+        self.identity_map = IdentityMap.for_path(database_path)
+        self.conn = self.pool.checkout()
+        self.c = self.conn.cursor()
+        self._transaction_depth = 0
+        self._write_locked = False
+        if not self.pool.schema_ready:
+            self.create_tables()
+            self.pool.schema_ready = True
+        
+    def create_tables(self):
+        """
+        Brings the tables in the SQLite3 database up to date by applying the migrations it is missing.
+
+        The schema version is read from PRAGMA user_version, so a database that is already up to date costs a single pragma read.
+        Pending migrations are applied in one transaction, together with the new schema version.
+        """
+        self.c.execute('PRAGMA user_version')
+        if self.c.fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        self.c.execute('BEGIN IMMEDIATE')
+        try:
+            # Read the version again now that the database is locked, another process may have migrated it meanwhile
+            self.c.execute('PRAGMA user_version')
+            version = self.c.fetchone()[0]
+            for migration in MIGRATIONS[version:]:
+                migration(self.c)
+            if version < SCHEMA_VERSION:
+                self.c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @contextlib.contextmanager
+    def transaction(self, immediate: bool = False):
+        """
+        Groups the changes made inside a with block into a single transaction.
+
+        The changes are committed together when the block ends, or rolled back if it raises an exception.
+        Mutators called inside the block do not commit on their own. Nested transactions join the outermost one.
+
+        Args:
+            immediate (bool): Whether to take the write lock when the transaction begins rather than at its first write,
+                so that no other connection can change what the transaction reads before it writes.
+                A nested immediate transaction can only join an outer transaction that is immediate too.
+
+        Yields:
+            DatabaseManager: This database manager.
+
+        Raises:
+            sqlite3.ProgrammingError: If an immediate transaction is nested in a transaction block that was not opened as immediate.
+        """
+        if self._transaction_depth == 0 and not self.conn.in_transaction:
+            self.c.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            self._write_locked = immediate
+        elif immediate and self._transaction_depth > 0 and not self._write_locked:
+            # An open transaction outside a block was started implicitly by a write, which already holds the write lock
+            raise sqlite3.ProgrammingError('An immediate transaction cannot join a deferred one, open the outer transaction with immediate=True')
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._write_locked = False
+                self.conn.rollback()
+                # Instances loaded inside the transaction may hold changes that were just rolled back
+                self.identity_map.clear()
+            raise
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self._write_locked = False
+            self.conn.commit()
+
+    def _commit(self):
+        """
+        Commits the current transaction, unless it is part of a transaction block that commits later.
+        """
+        if self._transaction_depth == 0:
+            self.conn.commit()
+
+    def cache_stats(self) -> dict:
+        """
+        Returns the counters of the identity map of the database file, which holds the Company, Category and UserPermissions instances.
+
+        Returns:
+            dict: The number of hits and misses so far and the number of instances currently held, under the keys hits, misses and size.
+        """
+        return self.identity_map.stats()
+
+    def allocate_codes(self, sequence: str, count: int = 1) -> range:
+        """
+        Reserves a block of consecutive codes of a sequence with a single atomic statement.
+        Reserved codes are never handed out again, by this or any other connection, even if they are left unused.
+
+        Args:
+            sequence (str): The SEQUENCES key of the table the codes are for.
+            count (int): The number of codes to reserve.
+
+        Returns:
+            range: The reserved codes.
+
+        Raises:
+            ValueError: If there is no sequence with the given name or count is not positive.
+        """
+        if sequence not in SEQUENCES:
+            raise ValueError(f"Unknown sequence: {sequence}")
+        if count < 1:
+            raise ValueError(f"Cannot allocate {count} codes")
+        self.c.execute('UPDATE Sequence SET NextValue = NextValue + ? WHERE Name = ? RETURNING NextValue', (count, sequence))
+        next_value = self.c.fetchall()[0][0]
+        self._commit()
+        return range(next_value - count, next_value)
+
+    def allocate_code(self, sequence: str) -> int:
+        """
+        Reserves the next code of a sequence.
+
+        Args:
+            sequence (str): The SEQUENCES key of the table the code is for.
+
+        Returns:
+            int: The reserved code.
+
+        Raises:
+            ValueError: If there is no sequence with the given name.
+        """
+        return self.allocate_codes(sequence)[0]
+
+    def _keyset_page(self, select: str, key_columns: dict, order_by: str, after: typing.Optional[tuple], limit: int) -> tuple[list[tuple], typing.Optional[tuple]]:
+        """
+        Retrieves one page of rows with keyset pagination.
+
+        Rows are sorted by the order_by column and then by the primary key, which is the first entry of key_columns.
+        Instead of skipping rows with OFFSET, the page starts right after the cursor of the previous page, so every page costs the same.
+
+        Args:
+            select (str): The SELECT statement without WHERE and ORDER BY clauses.
+            key_columns (dict): The columns rows can be sorted by, mapped to the SQL column and its index in the selected rows.
+            order_by (str): The key_columns key to sort the rows by.
+            after (tuple): The cursor returned with the previous page, or None for the first page.
+            limit (int): The maximum number of rows in the page.
+
+        Returns:
+            tuple[list[tuple], tuple]: The rows of the page, and the cursor of the next page or None if this is the last page.
+
+        Raises:
+            ValueError: If order_by is not a key of key_columns.
+        """
+        if order_by not in key_columns:
+            raise ValueError(f"Cannot sort by {order_by}")
+        key_column, key_index = next(iter(key_columns.values()))
+        order_column, order_index = key_columns[order_by]
+
+        if after is None:
+            where, parameters = '', []
+        elif order_column == key_column:
+            where, parameters = f'WHERE {key_column} > ?', [after[1]]
+        else:
+            where, parameters = f'WHERE ({order_column}, {key_column}) > (?, ?)', list(after)
+        order = key_column if order_column == key_column else f'{order_column}, {key_column}'
+        self.c.execute(f'{select} {where} ORDER BY {order} LIMIT ?', parameters + [limit])
+        rows = self.c.fetchall()
+
+        if len(rows) < limit:
+            return rows, None
+        return rows, (rows[-1][order_index], rows[-1][key_index])
+
+    def get_all_users(self) -> list[User]:
+        """
+        Retrieves all users from the User table in the database.
+
+        Each user's permissions are read from the Permissions bitmask of the same row.
+
+        Returns:
+            list[User]: A list of User objects representing all users in the database. Each User object includes the user's permissions.
+        """
+        self.c.execute(USER_SELECT)
+        return [self._user_from_row(row) for row in self.c.fetchall()]
+
+    def get_user_by_username(self, username: str) -> typing.Optional[User]:
+        """
+        Retrieves a user from the User table in the database by their username.
+
+        The user's permissions are read from the Permissions bitmask of the same row.
+
+        Args:
+            username (str): The username of the user to retrieve.
+
+        Returns:
+            User: A User object representing the user with the given username, if found. The User object includes the user's permissions.
+            None: If no user with the given username is found.
+        """
+        self.c.execute(f'{USER_SELECT} WHERE User.Username = ?', (username,))
+        row = self.c.fetchone()
+        if row:
+            return self._user_from_row(row)
+        return None
+
+    def get_users_page(self, after: typing.Optional[tuple] = None, order_by: str = 'id', limit: int = 100) -> tuple[list[User], typing.Optional[tuple]]:
+        """
+        Retrieves one page of users, with their permissions, using keyset pagination.
+
+        Args:
+            after (tuple): The cursor returned with the previous page, or None for the first page.
+            order_by (str): The USER_KEYSET_COLUMNS key to sort the users by.
+            limit (int): The maximum number of users in the page.
+
+        Returns:
+            tuple[list[User], tuple]: The users of the page, and the cursor of the next page or None if this is the last page.
+        """
+        rows, cursor = self._keyset_page(USER_SELECT, USER_KEYSET_COLUMNS, order_by, after, limit)
+        return [self._user_from_row(row) for row in rows], cursor
+
+    def iter_users(self, order_by: str = 'id', page_size: int = 1000) -> typing.Iterator[User]:
+        """
+        Streams all users page by page, so that only one page is held in memory at a time.
+
+        Args:
+            order_by (str): The USER_KEYSET_COLUMNS key to sort the users by.
+            page_size (int): The number of users fetched with each query.
+
+        Yields:
+            User: Every user in the database, with their permissions.
+        """
+        cursor = None
+        while True:
+            users, cursor = self.get_users_page(cursor, order_by, page_size)
+            yield from users
+            if cursor is None:
+                return
+
+    def _user_from_row(self, row: tuple) -> User:
+        """
+        Builds a User object, including its permissions, from a row selected with USER_SELECT.
+
+        Args:
+            row (tuple): A row returned by a USER_SELECT query.
+
+        Returns:
+            User: The User object described by the row.
+        """
+        return User(row[0], row[1], row[2], row[3], UserPermissions.from_mask(row[4]))
+    
+    def update_user(self, user: User):
+        """
+        Updates a user's details and permissions in the User table in the database.
+        The cached permissions of the user are invalidated, so that the session sees the change on its next check.
+
+        Args:
+            user (User): The User object containing the updated details and permissions of the user.
+
+        The method updates the user's username, password, full name and permissions bitmask in the User table.
+        """
+        self.c.execute('''
+            UPDATE User SET Username = ?, Password = ?, Fullname = ?, Permissions = ? WHERE Id = ?
+        ''', (user.username, user.password, user.full_name, user.permissions.mask, user.id))
+        self.identity_map.invalidate(UserPermissions, user.id)
+        self._commit()
+
+    def insert_user(self, user: User):
+        """
+        Inserts a new user into the User table in the database.
+        Given user ID is discarded and a new one is generated automatically.
+
+        Args:
+            user (User): The User object containing the details and permissions of the user to insert.
+
+        The method inserts the user's username, password, full name and permissions bitmask into the User table.
+        """
+        self.c.execute('''
+            INSERT INTO User (Username, Password, Fullname, Permissions) VALUES (?, ?, ?, ?)
+        ''', (user.username, user.password, user.full_name, user.permissions.mask))
+        self._commit()
+
+    def get_user_permissions(self, user_id: int) -> UserPermissions:
+        """
+        Retrieves the permissions of a user, e.g. to check what the logged-in session may do.
+        After the first lookup the same instance is returned from the identity map, until the user is changed.
+        The returned permissions are shared and must not be modified.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            UserPermissions: The shared permissions of the user, or no permissions if there is no user with the given ID.
+        """
+        permissions = self.identity_map.get(UserPermissions, int(user_id), lambda: self._load_user_permissions(int(user_id)))
+        if permissions is None:
+            return UserPermissions()
+        return permissions
+
+    def _load_user_permissions(self, user_id: int) -> typing.Optional[UserPermissions]:
+        """
+        Loads the permissions of a user from the User table in the database, bypassing the identity map.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            UserPermissions: The permissions of the user, if found.
+            None: If no user with the given ID is found.
+        """
+        self.c.execute('SELECT Permissions FROM User WHERE Id = ?', (user_id,))
+        row = self.c.fetchone()
+        if row:
+            return UserPermissions.from_mask(row[0])
+        return None
+
+    def set_user_permission(self, user_id: int, permission: str, granted: bool):
+        """
+        Grants or revokes a single permission of a user by setting or clearing its bit, leaving the other permissions as they are.
+        The cached permissions of the user are invalidated.
+
+        Args:
+            user_id (int): The ID of the user.
+            permission (str): The UserPermissions attribute of the permission, e.g. view_stock.
+            granted (bool): True to grant the permission, False to revoke it.
+
+        Raises:
+            ValueError: If there is no permission with the given name.
+        """
+        bit = permission_bit(permission)
+        if granted:
+            self.c.execute('UPDATE User SET Permissions = Permissions | ? WHERE Id = ?', (bit, user_id))
+        else:
+            self.c.execute('UPDATE User SET Permissions = Permissions & ~? WHERE Id = ?', (bit, user_id))
+        self.identity_map.invalidate(UserPermissions, int(user_id))
+        self._commit()
+
+    def get_all_companies(self) -> list[Company]:
+        """
+        Retrieves all companies from the Company table in the database.
+
+        Returns:
+            list[Company]: A list of Company objects representing all companies in the database.
+        """
+        self.c.execute('SELECT * FROM Company')
+        companies = [Company(row[0], row[1]) for row in self.c.fetchall()]
+        return companies
+
+    def update_company(self, company: Company):
+        """
+        Updates a company's name in the Company table in the database.
+
+        Args:
+            company (Company): The Company object containing the updated name of the company.
+        """
+        self.c.execute('''
+            UPDATE Company SET Name = ? WHERE CompanyCode = ?
+        ''', (company.name, company.company_code_int))
+        self.identity_map.invalidate(Company, company.company_code_int)
+        self._commit()
+
+    def insert_company(self, company: Company) -> int:
+        """
+        Inserts a new company into the Company table in the database.
+        The given company code is used if there is one, otherwise the next code of the Company sequence is allocated.
+
+        Args:
+            company (Company): The Company object containing the name of the company to insert.
+
+        Returns:
+            int: The company code of the inserted company.
+        """
+        with self.transaction():
+            company_code = company.company_code_int
+            if company_code is None:
+                company_code = self.allocate_code('Company')
+            self.c.execute('''
+                INSERT INTO Company (CompanyCode, Name) VALUES (?, ?)
+            ''', (company_code, company.name))
+            self.identity_map.invalidate(Company)
+        return company_code
+
+    def get_all_categories(self) -> list[Category]:
+        """
+        Retrieves all categories from the Category table in the database.
+
+        Returns:
+            list[Category]: A list of Category objects representing all categories in the database.
+        """
+        self.c.execute('SELECT * FROM Category')
+        categories = [Category(row[0], row[1]) for row in self.c.fetchall()]
+        return categories
+
+    def update_category(self, category: Category):
+        """
+        Updates a category's name in the Category table in the database.
+
+        Args:
+            category (Category): The Category object containing the updated name of the category.
+        """
+        self.c.execute('''
+            UPDATE Category SET Name = ? WHERE CategoryCode = ?
+        ''', (category.name, category.category_code_int))
+        self.identity_map.invalidate(Category, category.category_code_int)
+        self._commit()
+
+    def insert_category(self, category: Category) -> int:
+        """
+        Inserts a new category into the Category table in the database.
+        The given category code is used if there is one, otherwise the next code of the Category sequence is allocated.
+
+        Args:
+            category (Category): The Category object containing the name of the category to insert.
+
+        Returns:
+            int: The category code of the inserted category.
+        """
+        with self.transaction():
+            category_code = category.category_code_int
+            if category_code is None:
+                category_code = self.allocate_code('Category')
+            self.c.execute('''
+                INSERT INTO Category (CategoryCode, Name) VALUES (?, ?)
+            ''', (category_code, category.name))
+            self.identity_map.invalidate(Category)
+        return category_code
+
+    def get_all_products(self) -> list[Product]:
+        """
+        Retrieves all products from the Product table in the database.
+
+        The company and category of every product are fetched in the same query.
+        Products that share a company or category share the same Company or Category object.
+
+        Returns:
+            list[Product]: A list of Product objects representing all products in the database.
+        """
+        self.c.execute(PRODUCT_SELECT)
+        return self._products_from_rows(self.c.fetchall())
+
+    def get_product_by_code(self, product_code: int) -> typing.Optional[Product]:
+        """
+        Retrieves a product from the Product table in the database by its product code, together with its company and category.
+
+        Args:
+            product_code (int): The product code of the product to retrieve.
+
+        Returns:
+            Product: A Product object representing the product with the given product code, if found.
+            None: If no product with the given product code is found.
+        """
+        self.c.execute(f'{PRODUCT_SELECT} WHERE Product.ProductCode = ?', (product_code,))
+        products = self._products_from_rows(self.c.fetchall())
+        return products[0] if products else None
+
+    def get_products_by_codes(self, product_codes: typing.Iterable[int]) -> list[Product]:
+        """
+        Retrieves many products from the Product table in the database by their product codes, together with their companies and categories.
+
+        Args:
+            product_codes (Iterable[int]): The product codes of the products to retrieve.
+
+        Returns:
+            list[Product]: The Product objects found, in the order of the given product codes. Codes that are not found are left out.
+        """
+        product_codes = list(dict.fromkeys(product_codes))
+        rows = []
+        for start in range(0, len(product_codes), MAX_QUERY_PARAMETERS):
+            chunk = product_codes[start:start + MAX_QUERY_PARAMETERS]
+            self.c.execute(f'{PRODUCT_SELECT} WHERE Product.ProductCode IN ({", ".join("?" * len(chunk))})', chunk)
+            rows.extend(self.c.fetchall())
+        products = {product.product_code_int: product for product in self._products_from_rows(rows)}
+        return [products[code] for code in product_codes if code in products]
+
+    def search_products(self, text: str = '', category_code: typing.Optional[int] = None, company_code: typing.Optional[int] = None,
+                        order_by: str = 'code', limit: typing.Optional[int] = None, offset: int = 0) -> tuple[list[Product], int]:
+        """
+        Retrieves the products that match a search, filtered and sorted by the database.
+        The text is looked up in the ProductSearch full-text index.
+
+        Args:
+            text (str): Words that must start words of the product, category or company name, ignoring case, accents and final sigma.
+                An empty text matches every product.
+            category_code (int): The code of the category the products must belong to, or None for any category.
+            company_code (int): The code of the company that must produce the products, or None for any company.
+            order_by (str): The PRODUCT_ORDER_COLUMNS key to sort the products by. Products with equal keys are sorted by code.
+            limit (int): The maximum number of products to return, or None to return all matching products.
+            offset (int): The number of matching products to skip before the first returned product.
+
+        Returns:
+            tuple[list[Product], int]: The requested page of matching products, and the total number of matching products.
+
+        Raises:
+            ValueError: If order_by is not a key of PRODUCT_ORDER_COLUMNS.
+        """
+        if order_by not in PRODUCT_ORDER_COLUMNS:
+            raise ValueError(f"Cannot sort products by {order_by}")
+
+        conditions = []
+        parameters = []
+        words = re.findall(r'\w+', normalize_search_text(text))
+        if words:
+            conditions.append('Product.ProductCode IN (SELECT rowid FROM ProductSearch WHERE ProductSearch MATCH ?)')
+            parameters.append(' '.join(f'"{word}"*' for word in words))
+        if category_code is not None:
+            conditions.append('Product.CategoryCode = ?')
+            parameters.append(category_code)
+        if company_code is not None:
+            conditions.append('Product.CompanyCode = ?')
+            parameters.append(company_code)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        query = f'{PRODUCT_SELECT} {where} ORDER BY {PRODUCT_ORDER_COLUMNS[order_by]}, Product.ProductCode'
+        page_parameters = list(parameters)
+        if limit is not None or offset:
+            query += ' LIMIT ? OFFSET ?'
+            page_parameters += [-1 if limit is None else limit, offset]
+        self.c.execute(query, page_parameters)
+        products = self._products_from_rows(self.c.fetchall())
+
+        if limit is None and not offset:
+            return products, len(products)
+        self.c.execute(f'SELECT COUNT(*) FROM Product {where}', parameters)
+        return products, self.c.fetchone()[0]
+
+    def get_products_page(self, after: typing.Optional[tuple] = None, order_by: str = 'code', limit: int = 100) -> tuple[list[Product], typing.Optional[tuple]]:
+        """
+        Retrieves one page of products, with their company and category, using keyset pagination.
+
+        Args:
+            after (tuple): The cursor returned with the previous page, or None for the first page.
+            order_by (str): The PRODUCT_KEYSET_COLUMNS key to sort the products by.
+            limit (int): The maximum number of products in the page.
+
+        Returns:
+            tuple[list[Product], tuple]: The products of the page, and the cursor of the next page or None if this is the last page.
+        """
+        rows, cursor = self._keyset_page(PRODUCT_SELECT, PRODUCT_KEYSET_COLUMNS, order_by, after, limit)
+        return self._products_from_rows(rows), cursor
+
+    def iter_products(self, order_by: str = 'code', page_size: int = 1000) -> typing.Iterator[Product]:
+        """
+        Streams all products page by page, so that only one page is held in memory at a time.
+
+        Args:
+            order_by (str): The PRODUCT_KEYSET_COLUMNS key to sort the products by.
+            page_size (int): The number of products fetched with each query.
+
+        Yields:
+            Product: Every product in the database, with its company and category.
+        """
+        cursor = None
+        while True:
+            products, cursor = self.get_products_page(cursor, order_by, page_size)
+            yield from products
+            if cursor is None:
+                return
+
+    def inventory_snapshot(self, chunk_size: int = 10000) -> 'numpy.ndarray':
+        """
+        Reads the stock figures of every product into a NumPy structured array, one record per product in product code order.
+
+        The array is allocated once from the product count and filled straight from the cursor, without building Product objects.
+        Both are read in one transaction, so the count matches the rows even while other workstations write.
+        The stock_analytics module computes stock value, margins and reorder masks on the result.
+
+        Args:
+            chunk_size (int): The number of rows fetched from SQLite at a time.
+
+        Returns:
+            numpy.ndarray: A structured array with the fields of INVENTORY_FIELDS.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        import numpy
+
+        dtype = numpy.dtype([(name, numpy_type) for name, numpy_type, _ in INVENTORY_FIELDS])
+        columns = ', '.join(column for _, _, column in INVENTORY_FIELDS)
+        with self.transaction():
+            self.c.execute('SELECT COUNT(*) FROM Product')
+            count = self.c.fetchone()[0]
+            snapshot = numpy.empty(count, dtype)
+            self.c.execute(f'SELECT {columns} FROM Product ORDER BY ProductCode')
+            filled = 0
+            while rows := self.c.fetchmany(chunk_size):
+                snapshot[filled:filled + len(rows)] = rows
+                filled += len(rows)
+        return snapshot
+
+    def _products_from_rows(self, rows: list[tuple]) -> list[Product]:
+        """
+        Builds Product objects from rows selected with PRODUCT_SELECT.
+
+        Each distinct company and category code is turned into a single object that is shared by all products referencing it.
+        Drugs are built as Drug objects whose batches are loaded when first accessed, see prefetch_batches to load them for many drugs at once.
+
+        Args:
+            rows (list[tuple]): The rows returned by a PRODUCT_SELECT query.
+
+        Returns:
+            list[Product]: A list of Product and Drug objects, in the order of the given rows.
+        """
+        companies = {}
+        categories = {}
+        products = []
+        if self.pool.database_path == ':memory:':
+            # An in-memory database cannot be opened again, so its batches can only be loaded through this manager
+            batch_loader = self._load_batches
+        else:
+            batch_loader = functools.partial(_load_batches, self.pool.database_path, self.pool.profile)
+        for row in rows:
+            company = companies.get(row[6])
+            if company is None and row[8] is not None:
+                company = companies[row[6]] = Company(row[6], row[8])
+            category = categories.get(row[7])
+            if category is None and row[9] is not None:
+                category = categories[row[7]] = Category(row[7], row[9])
+            if row[10] is None:
+                products.append(Product(row[0], row[1], row[2], row[3], row[4], row[5], company, category))
+            else:
+                products.append(Drug(row[0], row[1], row[2], row[3], row[4], row[5], company, category, bool(row[10]), batch_loader=batch_loader))
+        return products
+
+    def update_product(self, product: Product):
+        """
+        Updates a product's details in the Product table in the database.
+        Given product code is discarded and a new one is generated automatically.
+        The quantity of a drug is not written, its stock is changed through its batches.
 
         Args:
             product (Product): The Product object containing the updated details of the product.
         """
-        self.c.execute('''
-            UPDATE Product SET Name = ?, PurchaseCost = ?, SellingPrice = ?, Quantity = ?, QuantityLimit = ?, CompanyCode = ?, CategoryCode = ? WHERE ProductCode = ?
-        ''', (product.name, product.purchase_cost, product.selling_price, product.quantity, product.quantity_limit, product.company.company_code_int, product.category.category_code_int, product.product_code_int))
-        self.conn.commit()
+        self.c.execute(PRODUCT_UPDATE, self._product_values(product) + (product.product_code_int,))
+        self._commit()
+
+    def update_products_many(self, products: typing.Iterable[Product]):
+        """
+        Updates the details of many products in the Product table in the database, in a single transaction.
+        As with update_product, the quantities of drugs are not written.
 
-    def insert_product(self, product: Product):
+        Args:
+            products (Iterable[Product]): The Product objects containing the updated details of the products.
+        """
+        with self.transaction():
+            self.c.executemany(PRODUCT_UPDATE, (self._product_values(product) + (product.product_code_int,) for product in products))
+
+    def adjust_quantity(self, product_code: int, delta: int) -> typing.Optional[int]:
+        """
+        Adds to the stock of a product in a single statement, so that concurrent adjustments from other workstations are never lost.
+        Only the Quantity column is written.
+
+        Args:
+            product_code (int): The product code of the product.
+            delta (int): The quantity to add, negative to remove stock.
+
+        Returns:
+            int: The new quantity of the product, or None if there is no product with the given code.
+        """
+        self.c.execute(PRODUCT_ADJUST_QUANTITY, (delta, product_code))
+        rows = self.c.fetchall()
+        self._commit()
+        return rows[0][0] if rows else None
+
+    def adjust_quantities(self, deltas: typing.Union[dict[int, int], typing.Iterable[tuple[int, int]]]) -> dict[int, int]:
+        """
+        Adds to the stock of many products in a single transaction, e.g. for all the lines of a delivery.
+
+        Args:
+            deltas (dict[int, int] | Iterable[tuple[int, int]]): The quantity to add to each product, keyed by product code.
+                A product may appear more than once in an iterable of pairs.
+
+        Returns:
+            dict[int, int]: The new quantity of each adjusted product, keyed by product code. Unknown product codes are left out.
+        """
+        if isinstance(deltas, dict):
+            deltas = deltas.items()
+        quantities = {}
+        with self.transaction():
+            for product_code, delta in deltas:
+                self.c.execute(PRODUCT_ADJUST_QUANTITY, (delta, product_code))
+                row = self.c.fetchone()
+                if row:
+                    quantities[product_code] = row[0]
+        return quantities
+
+    def get_active_alerts(self, limit: int = 100) -> list[StockAlert]:
+        """
+        Retrieves the open low-stock alerts, newest first.
+        The alerts are read through the partial index of open alerts, so the cost does not grow with the number of products.
+
+        Args:
+            limit (int): The maximum number of alerts to retrieve.
+
+        Returns:
+            list[StockAlert]: The open alerts, each with its product, company and category.
+        """
+        self.c.execute(f'{STOCK_ALERT_SELECT} ORDER BY StockAlert.RaisedAt DESC, StockAlert.AlertId DESC LIMIT ?', (limit,))
+        rows = self.c.fetchall()
+        products = self._products_from_rows(rows)
+        return [StockAlert(row[11], product, row[12]) for row, product in zip(rows, products)]
+
+    def count_active_alerts(self) -> int:
+        """
+        Counts the open low-stock alerts, e.g. for the badge of the notifications button.
+        Only the partial index of open alerts is read, so the count is cheap enough to poll.
+
+        Returns:
+            int: The number of products whose stock is below their quantity limit.
+        """
+        self.c.execute('SELECT COUNT(*) FROM StockAlert WHERE ClearedAt IS NULL')
+        return self.c.fetchone()[0]
+
+    def insert_product(self, product: Product) -> int:
         """
         Inserts a new product into the Product table in the database.
-        Given product code is discarded and a new one is generated automatically.
+        The given product code is used if there is one, otherwise the next code of the Product sequence is allocated.
         
         Args:
             product (Product): The Product object containing the details of the product to insert.
+
+        Returns:
+            int: The product code of the inserted product.
         """
-        self.c.execute('''
-            INSERT INTO Product (Name, PurchaseCost, SellingPrice, Quantity, QuantityLimit, CompanyCode, CategoryCode) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (product.name, product.purchase_cost, product.selling_price, product.quantity, product.quantity_limit, product.company.company_code_int, product.category.category_code_int))
-        self.conn.commit()
-    
-    def insert_drug(self, drug: Drug):
+        with self.transaction():
+            product_code = product.product_code_int
+            if product_code is None:
+                product_code = self.allocate_code('Product')
+            self.c.execute(PRODUCT_INSERT, (product_code,) + self._product_values(product))
+        return product_code
+
+    def insert_products_many(self, products: typing.Iterable[Product]) -> list[int]:
         """
-        Inserts a new drug into the Drug and Product tables in the database.
-        Given product code is discarded and a new one is generated automatically.
+        Inserts many new products into the Product table in the database, in a single transaction.
+        Given product codes are used, the products without one get codes from a single block allocated from the Product sequence.
 
         Args:
-            drug (Drug): The Drug object containing the details of the drug to insert.
+            products (Iterable[Product]): The Product objects containing the details of the products to insert.
+
+        Returns:
+            list[int]: The product codes of the inserted products, in the given order.
         """
-        self.insert_product(drug)
-        self.c.execute('''
-            INSERT INTO Drug (ProductCode, Quality) VALUES (?, ?)
-        ''', (drug.product_code_int, int(drug.quality)))
-        self.conn.commit()
+        products = list(products)
+        with self.transaction():
+            missing = sum(1 for product in products if product.product_code_int is None)
+            allocated = iter(self.allocate_codes('Product', missing) if missing else ())
+            product_codes = [next(allocated) if product.product_code_int is None else product.product_code_int for product in products]
+            self.c.executemany(PRODUCT_INSERT, ((product_code,) + self._product_values(product) for product_code, product in zip(product_codes, products)))
+        return product_codes
+
+    def _product_values(self, product: Product) -> tuple:
+        """
+        Returns the values of a product in the column order of PRODUCT_INSERT and PRODUCT_UPDATE.
+
+        Args:
+            product (Product): The product to get the values of.
+
+        Returns:
+            tuple: The name, purchase cost, selling price, quantity, quantity limit, company code and category code of the product.
+        """
+        return (product.name, product.purchase_cost, product.selling_price, product.quantity, product.quantity_limit, product.company.company_code_int, product.category.category_code_int)
+    
+    def insert_drug(self, drug: Drug) -> int:
+        """
+        Inserts a new drug into the Drug and Product tables in the database, together with its batches.
+        The given product code is used if there is one, otherwise the next code of the Product sequence is allocated.
+
+        The stock of a drug is held in its batches, so the quantity of the drug must be the total of its batches.
+        The batches are stored before the drug, so the batch triggers leave the stock as it is and the drug starts with a matching batch quantity.
+
+        Args:
+            drug (Drug): The Drug object containing the details of the drug to insert. The product code of its batches is set to the code of the drug.
+
+        Returns:
+            int: The product code of the inserted drug.
+
+        Raises:
+            ValueError: If the quantity of the drug is not the total of its batches, or an expiration date cannot be read as a date. Nothing is inserted.
+        """
+        batches = drug.batches
+        if int(drug.quantity) != sum(batch.quantity for batch in batches):
+            raise ValueError(f"The quantity of drug {drug.name} is not the total of its batches")
+        with self.transaction():
+            product_code = self.insert_product(drug)
+            for batch in batches:
+                batch.product_code = product_code
+            self.c.executemany(DRUG_BATCH_INSERT, ((batch.batch_code, batch.product_code, batch.quantity, _format_date(batch.expiration_date)) for batch in batches))
+            self.c.execute('''
+                INSERT INTO Drug (ProductCode, Quality) VALUES (?, ?)
+            ''', (product_code, int(drug.quality)))
+        return product_code
 
     def insert_drug_batch(self, batch: DrugBatch):
         """
         Inserts a new drug batch into the DrugBatch table in the database.
         Given batch code is discarded and a new one is generated automatically.
+        The expiration date is stored as an ISO date. The batch quantity is added to the stock of the drug by the batch triggers.
 
         Args:
             batch (DrugBatch): The DrugBatch object containing the details of the drug batch to insert.
+
+        Raises:
+            ValueError: If the expiration date cannot be read as a date.
         """
-        self.c.execute('''
-            INSERT INTO DrugBatch (BatchCode, ProductCode, Quantity, ExpirationDate) VALUES (?, ?, ?, ?)
-        ''', (batch.batch_code, batch.product_code, batch.quantity, batch.expiration_date))
-        self.conn.commit()
+        self.c.execute(DRUG_BATCH_INSERT, (batch.batch_code, batch.product_code, batch.quantity, _format_date(batch.expiration_date)))
+        self._commit()
+
+    def insert_drug_batches_many(self, batches: typing.Iterable[DrugBatch]):
+        """
+        Inserts many new drug batches into the DrugBatch table in the database, in a single transaction.
+        The expiration dates are stored as ISO dates. The batch quantities are added to the stock of the drugs by the batch triggers.
+
+        Args:
+            batches (Iterable[DrugBatch]): The DrugBatch objects containing the details of the drug batches to insert.
+
+        Raises:
+            ValueError: If an expiration date cannot be read as a date. No batch is inserted.
+        """
+        with self.transaction():
+            self.c.executemany(DRUG_BATCH_INSERT, ((batch.batch_code, batch.product_code, batch.quantity, _format_date(batch.expiration_date)) for batch in batches))
 
     def update_drug_batch(self, batch: DrugBatch):
         """
         Updates a drug batch's details in the DrugBatch table in the database.
+        The expiration date is stored as an ISO date. The change in quantity is applied to the stock of the drug by the batch triggers.
         
         Args:
             batch (DrugBatch): The DrugBatch object containing the updated details of the drug batch.
+
+        Raises:
+            ValueError: If the expiration date cannot be read as a date.
         """
         self.c.execute('''
             UPDATE DrugBatch SET ProductCode = ?, Quantity = ?, ExpirationDate = ? WHERE BatchCode = ?
-        ''', (batch.product_code, batch.quantity, batch.expiration_date, batch.batch_code))
-        self.conn.commit()
+        ''', (batch.product_code, batch.quantity, _format_date(batch.expiration_date), batch.batch_code))
+        self._commit()
     
     def get_batches_by_product_code(self, product_code: int) -> typing.Optional[list[DrugBatch]]:
         """
@@ -707,13 +2738,276 @@ class DatabaseManager:
         batches = [DrugBatch(row[0], row[1], row[2], row[3]) for row in self.c.fetchall()]
         return batches
 
+    def get_batches_by_product_codes(self, product_codes: typing.Iterable[int]) -> dict[int, list[DrugBatch]]:
+        """
+        Retrieves the drug batches of many products, with one query per MAX_QUERY_PARAMETERS product codes instead of one per product.
+
+        Args:
+            product_codes (Iterable[int]): The product codes of the drug batches to retrieve.
+
+        Returns:
+            dict[int, list[DrugBatch]]: The batches of every given product code, soonest expiring first. Codes without batches map to an empty list.
+        """
+        product_codes = list(dict.fromkeys(product_codes))
+        batches = {code: [] for code in product_codes}
+        for start in range(0, len(product_codes), MAX_QUERY_PARAMETERS):
+            chunk = product_codes[start:start + MAX_QUERY_PARAMETERS]
+            self.c.execute(f'''
+                SELECT BatchCode, ProductCode, Quantity, ExpirationDate FROM DrugBatch
+                WHERE ProductCode IN ({", ".join("?" * len(chunk))})
+                ORDER BY ProductCode, ExpirationDate
+            ''', chunk)
+            for row in self.c.fetchall():
+                batches[row[1]].append(DrugBatch(row[0], row[1], row[2], row[3]))
+        return batches
+
+    def prefetch_batches(self, products: typing.Iterable[Product]):
+        """
+        Loads the batches of the given drugs that have not loaded them yet, in as few queries as get_batches_by_product_codes needs,
+        e.g. for the rows of a table page before their batches are shown. Products that are not drugs are skipped.
+
+        Args:
+            products (Iterable[Product]): The products whose batches to load.
+        """
+        drugs = [product for product in products if isinstance(product, Drug) and not product.batches_loaded]
+        if not drugs:
+            return
+        batches = self.get_batches_by_product_codes(drug.product_code_int for drug in drugs)
+        for drug in drugs:
+            drug.batches = batches[drug.product_code_int]
+
+    def get_expiring_batches(self, before: typing.Union[datetime.date, str], limit: int = 100) -> list[DrugBatch]:
+        """
+        Retrieves the batches that still hold stock and expire before a date, soonest first, e.g. the batches expiring in the next 30 days.
+        Batches that have already expired are included.
+
+        The batches are read in order from the index of the batches that hold stock, so the cost depends on limit
+        and not on the number of batches, however many empty batches are kept.
+
+        Args:
+            before (datetime.date | str): The first expiration date that is not included, in any format read by _format_date.
+            limit (int): The maximum number of batches to retrieve.
+
+        Returns:
+            list[DrugBatch]: The batches, sorted by expiration date and then by product code.
+
+        Raises:
+            ValueError: If before cannot be read as a date.
+        """
+        self.c.execute('''
+            SELECT * FROM DrugBatch
+            WHERE ExpirationDate < ? AND Quantity > 0
+            ORDER BY ExpirationDate, ProductCode
+            LIMIT ?
+        ''', (_format_date(before), limit))
+        return [DrugBatch(row[0], row[1], row[2], row[3]) for row in self.c.fetchall()]
+
+    def allocate_batches(self, product_code: int, quantity: int, on: typing.Union[datetime.date, str, None] = None) -> list[BatchPick]:
+        """
+        Takes stock of a product out of its batches in first-expire-first-out order, e.g. when an order line ships.
+        The batches and the product quantity are decremented together in one transaction, which takes the write lock before reading the batches.
+        Inside a transaction block, the block must be opened with transaction(immediate=True).
+
+        Args:
+            product_code (int): The product code of the product.
+            quantity (int): The quantity to take.
+            on (datetime.date | str): The day of the allocation, batches that expire before it are not used. Defaults to today.
+
+        Returns:
+            list[BatchPick]: The quantities taken from each batch, soonest expiring first. Empty for products that are not drugs.
+
+        Raises:
+            InsufficientStockError: If the unexpired batches, or the stock of a product that is not a drug, hold less than quantity.
+            sqlite3.ProgrammingError: If called inside a transaction block that was not opened as immediate.
+        """
+        return self._allocate({int(product_code): quantity}, on)[int(product_code)]
+
+    def allocate_orders(self, orders: typing.Iterable[Orders], on: typing.Union[datetime.date, str, None] = None) -> dict[int, list[BatchPick]]:
+        """
+        Allocates a wave of orders in first-expire-first-out order, in one transaction.
+
+        The quantities of all the orders of a product are added up, so that the batches of each product are walked once.
+        Earlier orders in the wave get the batches that expire sooner. If any product is short, nothing is allocated.
+        As with allocate_batches, a transaction block around the call must be opened with transaction(immediate=True).
+
+        Args:
+            orders (Iterable[Orders]): The orders to allocate, each with its product and quantity.
+            on (datetime.date | str): The day of the allocation, batches that expire before it are not used. Defaults to today.
+
+        Returns:
+            dict[int, list[BatchPick]]: The quantities taken from each batch for every order, keyed by order code.
+
+        Raises:
+            InsufficientStockError: If a product does not have enough stock for all the orders of the wave.
+            sqlite3.ProgrammingError: If called inside a transaction block that was not opened as immediate.
+        """
+        orders = list(orders)
+        demands = {}
+        for order in orders:
+            product_code = order.product.product_code_int
+            demands[product_code] = demands.get(product_code, 0) + order.quantity
+        product_picks = self._allocate(demands, on)
+
+        # Hand the picks of each product out to its orders in wave order, splitting a batch between two orders where needed
+        allocations = {}
+        for order in orders:
+            picks = product_picks[order.product.product_code_int]
+            remaining = order.quantity
+            allocated = allocations.setdefault(order.code, [])
+            while remaining > 0 and picks:
+                pick = picks[0]
+                taken = min(pick.quantity, remaining)
+                allocated.append(BatchPick(pick.batch_code, pick.product_code, taken, pick.expiration_date))
+                remaining -= taken
+                if taken == pick.quantity:
+                    picks.pop(0)
+                else:
+                    pick.quantity -= taken
+        return allocations
+
+    def _allocate(self, demands: dict[int, int], on: typing.Union[datetime.date, str, None]) -> dict[int, list[BatchPick]]:
+        """
+        Takes the given quantity of every product out of its batches in first-expire-first-out order, in one transaction.
+
+        Args:
+            demands (dict[int, int]): The quantity to take of each product, keyed by product code.
+            on (datetime.date | str): The day of the allocation, batches that expire before it are not used. Defaults to today.
+
+        Returns:
+            dict[int, list[BatchPick]]: The quantities taken from each batch, keyed by product code.
+
+        Raises:
+            InsufficientStockError: If a product is short. Nothing is allocated.
+            ValueError: If a quantity is negative.
+            sqlite3.ProgrammingError: If called inside a transaction block that was not opened as immediate.
+        """
+        for product_code, quantity in demands.items():
+            if quantity < 0:
+                raise ValueError(f"Cannot allocate {quantity} of product {product_code}")
+        on = _format_date(on if on is not None else datetime.date.today())
+        allocations = {}
+        # Take the write lock before reading the batches, so that no other workstation allocates them in between
+        with self.transaction(immediate=True):
+            for product_code, quantity in demands.items():
+                self.c.execute('SELECT EXISTS (SELECT 1 FROM Drug WHERE ProductCode = ?)', (product_code,))
+                if not self.c.fetchone()[0]:
+                    self.c.execute('UPDATE Product SET Quantity = Quantity - ? WHERE ProductCode = ? AND Quantity >= ?', (quantity, product_code, quantity))
+                    if self.c.rowcount == 0:
+                        self.c.execute('SELECT Quantity FROM Product WHERE ProductCode = ?', (product_code,))
+                        row = self.c.fetchone()
+                        raise InsufficientStockError(product_code, quantity, row[0] if row else 0)
+                    allocations[product_code] = []
+                    continue
+
+                picks = self._pick_batches(product_code, quantity, on)
+                available = sum(pick.quantity for pick in picks)
+                if available < quantity:
+                    raise InsufficientStockError(product_code, quantity, available)
+                # The batch triggers take the same quantities off Product.Quantity
+                self.c.executemany('UPDATE DrugBatch SET Quantity = Quantity - ? WHERE BatchCode = ?', ((pick.quantity, pick.batch_code) for pick in picks))
+                allocations[product_code] = picks
+        return allocations
+
+    def _pick_batches(self, product_code: int, quantity: int, on: str) -> list[BatchPick]:
+        """
+        Chooses the batches a quantity of a drug is taken from, walking its unexpired batches in expiration order until the quantity is covered.
+        Only as many batches as needed are read from the index.
+
+        Args:
+            product_code (int): The product code of the drug.
+            quantity (int): The quantity to take.
+            on (str): The day of the allocation as YYYY-MM-DD, batches that expire before it are skipped.
+
+        Returns:
+            list[BatchPick]: The quantities to take from each batch, covering less than quantity if the batches run out.
+        """
+        cursor = self.conn.execute('''
+            SELECT BatchCode, Quantity, ExpirationDate FROM DrugBatch
+            WHERE ProductCode = ? AND ExpirationDate >= ? AND Quantity > 0
+            ORDER BY ExpirationDate
+        ''', (product_code, on))
+        picks = []
+        remaining = quantity
+        try:
+            for batch_code, batch_quantity, expiration_date in cursor:
+                if remaining <= 0:
+                    break
+                taken = min(batch_quantity, remaining)
+                picks.append(BatchPick(batch_code, product_code, taken, expiration_date))
+                remaining -= taken
+        finally:
+            cursor.close()
+        return picks
+
+    def get_batch_quantity(self, product_code: int) -> typing.Optional[int]:
+        """
+        Retrieves the total quantity of the batches of a drug, from the total cached in the Product table.
+
+        Args:
+            product_code (int): The product code of the drug.
+
+        Returns:
+            int: The sum of the quantities of the drug's batches.
+            None: If the product is not a drug or does not exist.
+        """
+        self.c.execute('SELECT BatchQuantity FROM Product WHERE ProductCode = ?', (product_code,))
+        row = self.c.fetchone()
+        return row[0] if row else None
+
+    def audit_batch_quantities(self) -> list[tuple[int, int, int]]:
+        """
+        Finds the drugs whose stock does not match the total of their batches, e.g. because stock was received without a batch.
+        Only the products that are out of sync are read, through their partial index.
+
+        Returns:
+            list[tuple[int, int, int]]: The product code, the stock and the batch total of each drug that is out of sync, by product code.
+        """
+        self.c.execute('SELECT ProductCode, Quantity, BatchQuantity FROM Product WHERE Quantity <> BatchQuantity ORDER BY ProductCode')
+        return self.c.fetchall()
+
+    def rebuild_batch_quantities(self) -> int:
+        """
+        Recomputes the cached batch total of every drug from its batches, in case the batches were changed while the triggers were missing.
+        Every batch is read, so this is a repair tool rather than something to run routinely. The stock of the products is not changed.
+
+        Returns:
+            int: The number of drugs whose cached total was wrong.
+        """
+        self.c.execute('''
+            UPDATE Product SET BatchQuantity = Totals.Total
+            FROM (
+                SELECT Drug.ProductCode, COALESCE(SUM(DrugBatch.Quantity), 0) AS Total
+                FROM Drug
+                LEFT JOIN DrugBatch ON DrugBatch.ProductCode = Drug.ProductCode
+                GROUP BY Drug.ProductCode
+            ) AS Totals
+            WHERE Product.ProductCode = Totals.ProductCode AND Product.BatchQuantity IS NOT Totals.Total
+        ''')
+        changed = self.c.rowcount
+        self._commit()
+        return changed
+
     def get_company_by_code(self, company_code: int) -> typing.Optional[Company]:
         """
         Retrieves a company from the Company table in the database by its company code.
+        After the first lookup the same instance is returned from the identity map, until the company is changed.
         
         Args:
             company_code (int): The company code of the company to retrieve.
         
+        Returns:
+            Company: The shared Company object representing the company with the given company code, if found.
+            None: If no company with the given company code is found.
+        """
+        return self.identity_map.get(Company, int(company_code), lambda: self._load_company(int(company_code)))
+
+    def _load_company(self, company_code: int) -> typing.Optional[Company]:
+        """
+        Loads a company from the Company table in the database, bypassing the identity map.
+
+        Args:
+            company_code (int): The company code of the company to load.
+
         Returns:
             Company: A Company object representing the company with the given company code, if found.
             None: If no company with the given company code is found.
@@ -727,10 +3021,24 @@ class DatabaseManager:
     def get_category_by_code(self, category_code: int) -> typing.Optional[Category]:
         """
         Retrieves a category from the Category table in the database by its category code.
+        After the first lookup the same instance is returned from the identity map, until the category is changed.
         
         Args:
             category_code (int): The category code of the category to retrieve.
         
+        Returns:
+            Category: The shared Category object representing the category with the given category code, if found.
+            None: If no category with the given category code is found.
+        """
+        return self.identity_map.get(Category, int(category_code), lambda: self._load_category(int(category_code)))
+
+    def _load_category(self, category_code: int) -> typing.Optional[Category]:
+        """
+        Loads a category from the Category table in the database, bypassing the identity map.
+
+        Args:
+            category_code (int): The category code of the category to load.
+
         Returns:
             Category: A Category object representing the category with the given category code, if found.
             None: If no category with the given category code is found.
@@ -753,6 +3061,39 @@ class DatabaseManager:
         clients = [Client(row[0], row[1], row[2], row[3]) for row in self.c.fetchall()]
         return clients    
     
+    def get_clients_page(self, after: typing.Optional[tuple] = None, order_by: str = 'id', limit: int = 100) -> tuple[list[Client], typing.Optional[tuple]]:
+        """
+        Retrieves one page of clients using keyset pagination.
+
+        Args:
+            after (tuple): The cursor returned with the previous page, or None for the first page.
+            order_by (str): The CLIENT_KEYSET_COLUMNS key to sort the clients by.
+            limit (int): The maximum number of clients in the page.
+
+        Returns:
+            tuple[list[Client], tuple]: The clients of the page, and the cursor of the next page or None if this is the last page.
+        """
+        rows, cursor = self._keyset_page('SELECT ClientId, FullName, Address, Phone FROM Client', CLIENT_KEYSET_COLUMNS, order_by, after, limit)
+        return [Client(row[0], row[1], row[2], row[3]) for row in rows], cursor
+
+    def iter_clients(self, order_by: str = 'id', page_size: int = 1000) -> typing.Iterator[Client]:
+        """
+        Streams all clients page by page, so that only one page is held in memory at a time.
+
+        Args:
+            order_by (str): The CLIENT_KEYSET_COLUMNS key to sort the clients by.
+            page_size (int): The number of clients fetched with each query.
+
+        Yields:
+            Client: Every client in the database.
+        """
+        cursor = None
+        while True:
+            clients, cursor = self.get_clients_page(cursor, order_by, page_size)
+            yield from clients
+            if cursor is None:
+                return
+
     def get_client_by_id(self, id: int) -> typing.Optional[Client]:
         """
         Retrieves a client from the Client table in the database by their id.
@@ -766,17 +3107,23 @@ class DatabaseManager:
         """
         self.c.execute('SELECT * FROM Client WHERE ClientId = ?', (id, ))
     
-    def insert_client(self, client: Client):
+    def insert_client(self, client: Client) -> int:
         """
         Inserts a new client into the Client table in the database.
+        The given client ID is used if there is one, otherwise the next code of the Client sequence is allocated.
         
         Args:
             client (Client): The Client object containing the details of the client to insert.
+
+        Returns:
+            int: The client ID of the inserted client.
         """
-        self.c.execute('''
-            INSERT INTO Client (FullName, Address, Phone) VALUES (?, ?, ?)
-        ''', (client.fullname, client.address ,client.phone))
-        self.conn.commit()
+        with self.transaction():
+            client_id = client.client_id or self.allocate_code('Client')
+            self.c.execute('''
+                INSERT INTO Client (ClientId, FullName, Address, Phone) VALUES (?, ?, ?, ?)
+            ''', (client_id, client.fullname, client.address, client.phone))
+        return client_id
 
     def update_client(self, client: Client):
         """
@@ -788,7 +3135,7 @@ class DatabaseManager:
         self.c.execute('''
             UPDATE Client SET FullName = ?, Address = ?, Phone = ? WHERE ClientID = ?
         ''', (client.fullname, client.address, client.phone, client.client_id))
-        self.conn.commit()
+        self._commit()
 
     def get_all_personal_clients(self, user_id: int) -> list[Client]:
         """
@@ -826,11 +3173,175 @@ class DatabaseManager:
         self.c.execute('''
             INSERT INTO PersonalClient (UserID, ClientID) VALUES (?, ?)
         ''', (user_id, client_id))
-        self.conn.commit()
+        self._commit()
+
+    def add_personal_clients(self, user_id: int, client_ids: typing.Iterable[int]) -> int:
+        """
+        Adds many personal clients to the PersonalClient table in the database for a given user ID, in a single transaction.
+        Clients that are already personal clients of the user are skipped.
+
+        Args:
+            user_id (int): The ID of the user to associate the personal clients with.
+            client_ids (Iterable[int]): The IDs of the clients to add as personal clients.
+
+        Returns:
+            int: The number of personal clients that were added.
+        """
+        with self.transaction():
+            self.c.executemany('''
+                INSERT OR IGNORE INTO PersonalClient (UserId, ClientId) VALUES (?, ?)
+            ''', ((user_id, client_id) for client_id in client_ids))
+            return self.c.rowcount
+
+    def remove_personal_clients(self, user_id: int, client_ids: typing.Iterable[int]) -> int:
+        """
+        Removes many personal clients from the PersonalClient table in the database for a given user ID, in a single transaction.
+
+        Args:
+            user_id (int): The ID of the user whose personal clients to remove.
+            client_ids (Iterable[int]): The IDs of the clients to remove from the user's personal clients.
+
+        Returns:
+            int: The number of personal clients that were removed.
+        """
+        with self.transaction():
+            self.c.executemany('''
+                DELETE FROM PersonalClient WHERE UserId = ? AND ClientId = ?
+            ''', ((user_id, client_id) for client_id in client_ids))
+            return self.c.rowcount
+
+    def _load_batches(self, product_code: int) -> list[DrugBatch]:
+        """
+        Loads the batches of a drug that were not prefetched, on the connection of this manager.
+
+        Args:
+            product_code (int): The product code of the drug.
+
+        Returns:
+            list[DrugBatch]: The batches of the drug.
+        """
+        return self.get_batches_by_product_codes([product_code])[product_code]
 
     def close(self):
         """
-        Closes the connection to the SQLite3 database.
+        Hands the connection to the SQLite3 database back to its pool.
+        The DatabaseManager cannot be used afterwards, closing it again has no effect.
+        """
+        if self.conn is None:
+            return
+        self.c.close()
+        self.pool.checkin(self.conn)
+        self.conn = None
+        self.c = None
+
+    def __enter__(self) -> 'DatabaseManager':
+        """
+        Returns this database manager, so that a with block hands its connection back to the pool when it ends.
+
+        Returns:
+            DatabaseManager: This database manager.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Hands the connection back to the pool at the end of a with block, see close.
+        """
+        self.close()
+    
+
+def _load_batches(database_path: str, profile: str, product_code: int) -> list[DrugBatch]:
+    """
+    Loads the batches of a drug that were not prefetched, on a connection of the calling thread,
+    since the drug may have been read on another thread, e.g. the worker of a DatabaseExecutor.
+
+    Args:
+        database_path (str): The path to the SQLite3 database file the drug was read from.
+        profile (str): The name of the DATABASE_PROFILES entry the drug was read with.
+        product_code (int): The product code of the drug.
+
+    Returns:
+        list[DrugBatch]: The batches of the drug.
+    """
+    db = DatabaseManager(database_path, profile)
+    try:
+        return db.get_batches_by_product_codes([product_code])[product_code]
+    finally:
+        db.close()
+
+
+class CodeAllocator:
+    """
+    Hands out the codes of one sequence from blocks reserved in the database, so that a workstation reserves codes once per block.
+
+    There is one allocator per database file and sequence in the process, obtained with CodeAllocator.for_path.
+    Codes are never handed out twice, by this or any other process. Codes left in a block when the process exits are skipped.
+
+    Attributes:
+        database_path (str): The path to the SQLite3 database file.
+        sequence (str): The SEQUENCES key of the table the codes are for.
+        block_size (int): The number of codes reserved at a time.
+    """
+    # The number of codes reserved at a time by the allocators obtained with for_path
+    BLOCK_SIZE = 10
+
+    _allocators = {}
+    _allocators_lock = threading.Lock()
+
+    def __init__(self, database_path: str, sequence: str, block_size: int = BLOCK_SIZE):
+        """
+        Initializes a new instance of the CodeAllocator class. The first block is reserved by the first call to next_code.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+            sequence (str): The SEQUENCES key of the table the codes are for.
+            block_size (int): The number of codes reserved at a time.
+
+        Raises:
+            ValueError: If there is no sequence with the given name.
+        """
+        if sequence not in SEQUENCES:
+            raise ValueError(f"Unknown sequence: {sequence}")
+        self.database_path = database_path
+        self.sequence = sequence
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._codes = iter(())
+
+    @classmethod
+    def for_path(cls, database_path: str, sequence: str) -> 'CodeAllocator':
+        """
+        Returns the allocator of the given database file and sequence, creating it the first time they are used.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+            sequence (str): The SEQUENCES key of the table the codes are for.
+
+        Returns:
+            CodeAllocator: The process-wide allocator of the database file and sequence.
         """
-        self.conn.close()
-    
\ No newline at end of file
+        database_path = os.fspath(database_path)
+        key = (database_path if database_path == ':memory:' else os.path.abspath(database_path), sequence)
+        with cls._allocators_lock:
+            allocator = cls._allocators.get(key)
+            if allocator is None:
+                allocator = cls._allocators[key] = cls(database_path, sequence)
+            return allocator
+
+    def next_code(self) -> int:
+        """
+        Returns the next code of the reserved block, reserving a new block when it runs out.
+
+        Returns:
+            int: A code that no other caller has received.
+        """
+        with self._lock:
+            code = next(self._codes, None)
+            if code is None:
+                db = DatabaseManager(self.database_path)
+                try:
+                    self._codes = iter(db.allocate_codes(self.sequence, self.block_size))
+                finally:
+                    db.close()
+                code = next(self._codes)
+            return code
@@ -0,0 +1,184 @@
+import concurrent.futures
+import os
+import threading
+import typing
+from database import DEFAULT_PROFILE, DatabaseManager
+
+class DatabaseExecutor:
+    """
+    Runs DatabaseManager calls on a dedicated worker thread, so that the calling thread never waits for SQLite.
+
+    There is one executor per database file and profile in the process, obtained with DatabaseExecutor.for_path.
+    Calls are queued and run one at a time on a DatabaseManager owned by the worker thread, and their results are delivered through futures.
+    The executor does not depend on Qt, the qt_database module hands the results to the GUI thread.
+
+    Attributes:
+        database_path (str): The path to the SQLite3 database file.
+        profile (str): The name of the DATABASE_PROFILES entry used by the worker's connection.
+    """
+    _executors = {}
+    _executors_lock = threading.Lock()
+
+    def __init__(self, database_path: str = 'database.db', profile: str = DEFAULT_PROFILE):
+        """
+        Initializes a new instance of the DatabaseExecutor class. The worker thread and its connection are started by the first call.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+            profile (str): The name of the DATABASE_PROFILES entry used by the worker's connection.
+        """
+        self.database_path = database_path
+        self.profile = profile
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+        self._db = None
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._shut_down = False
+
+    @classmethod
+    def for_path(cls, database_path: str = 'database.db', profile: str = DEFAULT_PROFILE) -> 'DatabaseExecutor':
+        """
+        Returns the executor of the given database file and profile, creating it the first time they are used.
+
+        Args:
+            database_path (str): The path to the SQLite3 database file.
+            profile (str): The name of the DATABASE_PROFILES entry used by the worker's connection.
+
+        Returns:
+            DatabaseExecutor: The process-wide executor of the database file and profile.
+        """
+        database_path = os.fspath(database_path)
+        key = (database_path if database_path == ':memory:' else os.path.abspath(database_path), profile)
+        with cls._executors_lock:
+            executor = cls._executors.get(key)
+            if executor is None:
+                executor = cls._executors[key] = cls(database_path, profile)
+            return executor
+
+    def submit(self, method: typing.Union[str, typing.Callable], *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Queues a call to run on the worker thread.
+
+        Args:
+            method (str | Callable): The name of the DatabaseManager method to call,
+                or a function that is called with the worker's DatabaseManager followed by the arguments.
+            *args: The positional arguments of the call.
+            **kwargs: The keyword arguments of the call.
+
+        Returns:
+            concurrent.futures.Future: The future that receives the return value or the exception of the call.
+        """
+        return self._executor.submit(self._run, method, args, kwargs)
+
+    def submit_latest(self, key: typing.Hashable, method: typing.Union[str, typing.Callable], *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Queues a call that supersedes the previous call made with the same key, e.g. the query of a search box that is still being typed.
+
+        The previous call is cancelled if it has not started yet. If it is already running it completes,
+        but is_latest no longer reports it, so that its result can be dropped.
+
+        Args:
+            key (Hashable): Identifies the calls that supersede each other.
+            method (str | Callable): The name of the DatabaseManager method to call,
+                or a function that is called with the worker's DatabaseManager followed by the arguments.
+            *args: The positional arguments of the call.
+            **kwargs: The keyword arguments of the call.
+
+        Returns:
+            concurrent.futures.Future: The future that receives the return value or the exception of the call.
+        """
+        with self._lock:
+            previous = self._latest.get(key)
+            future = self._latest[key] = self.submit(method, *args, **kwargs)
+        if previous is not None:
+            previous.cancel()
+        return future
+
+    def is_latest(self, key: typing.Hashable, future: concurrent.futures.Future) -> bool:
+        """
+        Returns whether a call is the latest one made with submit_latest for its key.
+
+        Args:
+            key (Hashable): The key the call was submitted with.
+            future (concurrent.futures.Future): The future returned by submit_latest.
+
+        Returns:
+            bool: True if no call has superseded it and its key has not been forgotten, False otherwise.
+        """
+        with self._lock:
+            return self._latest.get(key) is future
+
+    def forget(self, key: typing.Hashable):
+        """
+        Cancels the pending call of a key and drops the key, e.g. when the window that made the calls is closed.
+
+        Args:
+            key (Hashable): The key the calls were submitted with.
+        """
+        with self._lock:
+            future = self._latest.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def _run(self, method: typing.Union[str, typing.Callable], args: tuple, kwargs: dict) -> typing.Any:
+        """
+        Runs a call on the worker thread, opening the worker's DatabaseManager the first time.
+
+        Args:
+            method (str | Callable): The DatabaseManager method name or the function to call.
+            args (tuple): The positional arguments of the call.
+            kwargs (dict): The keyword arguments of the call.
+
+        Returns:
+            Any: The return value of the call.
+        """
+        if self._db is None:
+            self._db = DatabaseManager(self.database_path, self.profile)
+        if callable(method):
+            return method(self._db, *args, **kwargs)
+        return getattr(self._db, method)(*args, **kwargs)
+
+    def _close_database(self):
+        """
+        Hands the worker's connection back to its pool and closes the worker's idle connections.
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db.pool.close_idle()
+            self._db = None
+
+    def shutdown(self, wait: bool = True):
+        """
+        Cancels the pending calls, closes the worker's connection and stops the worker thread.
+        The executor cannot be used afterwards, for_path returns a new one. Shutting it down again has no effect.
+
+        Args:
+            wait (bool): Whether to wait for the running call and the connection to be closed.
+        """
+        if self._shut_down:
+            return
+        self._shut_down = True
+        with DatabaseExecutor._executors_lock:
+            for key, executor in list(DatabaseExecutor._executors.items()):
+                if executor is self:
+                    del DatabaseExecutor._executors[key]
+        with self._lock:
+            pending = list(self._latest.values())
+            self._latest.clear()
+        for future in pending:
+            future.cancel()
+        self._executor.submit(self._close_database)
+        self._executor.shutdown(wait)
+
+    @classmethod
+    def shutdown_all(cls, wait: bool = True):
+        """
+        Shuts down every executor obtained with for_path, e.g. when the application quits.
+
+        Args:
+            wait (bool): Whether to wait for the running calls and the connections to be closed.
+        """
+        with cls._executors_lock:
+            executors = list(cls._executors.values())
+        for executor in executors:
+            executor.shutdown(wait)
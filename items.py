@@ -6,6 +6,7 @@ from PySide6.QtWidgets import (QApplication, QComboBox, QHBoxLayout, QHeaderView
     QSizePolicy, QSpacerItem, QTableWidget, QTableWidgetItem,
     QVBoxLayout, QWidget, QPushButton, QFormLayout)
 import database
+from qt_database import DatabaseRelay, ProductSearchPager
 
 class Ui_MainWindow(object):
     '''
@@ -87,7 +88,7 @@ class Ui_MainWindow(object):
         self.CategoryBox.setFont(font)
         self.CategoryBox.addItem("Όλες")
         for category in categories:
-            self.CategoryBox.addItem(category.name)
+            self.CategoryBox.addItem(category.name, category.category_code_int)
                 
         self.verticalLayout_3.addWidget(self.CategoryBox)
 
@@ -111,7 +112,7 @@ class Ui_MainWindow(object):
         self.CompanyBox.setFont(font)
         self.CompanyBox.addItem("Όλες")
         for company in companies:
-            self.CompanyBox.addItem(company.name)
+            self.CompanyBox.addItem(company.name, company.company_code_int)
 
         self.verticalLayout_4.addWidget(self.CompanyBox)
 
@@ -145,7 +146,6 @@ class Ui_MainWindow(object):
         self.retranslateUi(MainWindow)
 
         QMetaObject.connectSlotsByName(MainWindow)
-        self.db_manager = database.DatabaseManager()
 
     def retranslateUi(self, MainWindow):
         '''
@@ -172,21 +172,24 @@ class Ui_MainWindow(object):
         Returns:
             None
         '''
-        self.update_table(self.db_manager.get_all_products())
+        with database.DatabaseManager() as db_manager:
+            products = db_manager.get_all_products()
+        self.update_table(products)
 
-    def update_table(self, data):
+    def update_table(self, data, start=0):
         '''
         This method updates the table with the given data.
 
         Args:
             data: A list of Product objects.
+            start: The row of the first product. The rows after the given products are removed.
 
         Returns:
             None
         '''
-        self.tableWidget.setRowCount(len(data))
+        self.tableWidget.setRowCount(start + len(data))
         data_coloumns = 6
-        for row_num, product in enumerate(data):
+        for row_num, product in enumerate(data, start):
             self.tableWidget.setItem(row_num, 0, QTableWidgetItem(product.product_code))
             self.tableWidget.setItem(row_num, 1, QTableWidgetItem(product.name))
             self.tableWidget.setItem(row_num, 2, QTableWidgetItem(str(product.purchase_cost)))
@@ -252,7 +255,6 @@ class ProductWindow(QWidget):
         product: The product object.
         edit: A boolean value indicating whether the window is in edit mode.
         callback: A function to call after the window is closed.
-        db_manager: The database manager.
         data: The data of the product.
 
     Methods:
@@ -266,7 +268,6 @@ class ProductWindow(QWidget):
         self.callback = callback
         self.product = product
         self.edit = edit
-        self.db_manager = database.DatabaseManager()
         self.setWindowTitle("Επεξεργασία Προϊόντος")
         self.layout = QFormLayout()
         self.setLayout(self.layout)
@@ -306,7 +307,8 @@ class ProductWindow(QWidget):
         self.quantity_input = QLineEdit()
         self.quantity_input.setText(str(self.product.quantity))
         self.quantity_input.setValidator(QDoubleValidator())
-        if not self.edit:
+        # The stock of a drug follows its batches, it is changed by receiving or allocating batches
+        if not self.edit or isinstance(self.product, database.Drug):
             self.quantity_input.setDisabled(True)
         self.layout.addRow(self.quantity_label, self.quantity_input)
 
@@ -338,15 +340,17 @@ class ProductWindow(QWidget):
         self.product.name = name
         self.product.purchase_cost = purchase_cost
         self.product.selling_price = selling_price
-        self.product.quantity = quantity
+        if not isinstance(self.product, database.Drug):
+            self.product.quantity = quantity
         self.product.quantity_limit = quantity_limit
-        self.db_manager.update_product(self.product)
+        # The connection is only held while saving, so closing the window in any way leaves none checked out
+        with database.DatabaseManager() as db_manager:
+            db_manager.update_product(self.product)
         self._close()
     
     def _close(self):
         if self.callback:
             self.callback()
-        self.db_manager.close()
         self.close()
 
 class MainWindow(QMainWindow):
@@ -355,7 +359,7 @@ class MainWindow(QMainWindow):
     
     Attributes:
         ui: The user interface of the main window.
-        db_manager: The database manager.
+        database: The relay that runs the table queries on the database worker thread.
         
     Methods:
         __init__: Initializes the main window.
@@ -363,15 +367,19 @@ class MainWindow(QMainWindow):
         load_manufacturers: Loads the manufacturers into the combo box.
         load_table_data: Loads the initial data into the table.
         filter_table_data: Filters the table data based on the search text, category, and manufacturer.
-        closeEvent: Closes the database connection.
+        closeEvent: Drops the table queries that have not finished.
     '''
     def __init__(self):
         super(MainWindow, self).__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
-        
-        # Initialize database manager
-        self.db_manager = database.DatabaseManager()
+
+        # Run the table queries on the database worker thread, so that a slow or locked database does not freeze the window
+        self.database = DatabaseRelay(self)
+        # Load the products a page at a time, the next page is loaded when the table is scrolled near its end
+        self.pager = ProductSearchPager(self.database, self.ui.tableWidget, self.ui.update_table)
+        # The windows opened from the table reload it through the pager, which keeps the search and loads only the first page
+        self.ui.update_table_db = self.pager.reload
 
         # Load initial data into table
         self.load_table_data()
@@ -383,22 +391,18 @@ class MainWindow(QMainWindow):
 
 
     def load_table_data(self):
-        data = self.db_manager.get_all_products()
-        self.ui.update_table(data)
+        self.pager.search()
 
     def filter_table_data(self):
         search_text = self.ui.SearchBox.text()
-        category = self.ui.CategoryBox.currentText()
-        manufacturer = self.ui.CompanyBox.currentText()
-        all_products = self.db_manager.get_all_products()
-        filtered_products = []
-        for product in all_products:
-            if search_text.lower() in product.name.lower() and (category == "Όλες" or product.category.name == category) and (manufacturer == "Όλες" or product.company.name == manufacturer):
-                filtered_products.append(product)
-        self.ui.update_table(filtered_products)
+        # The "Όλες" entries have no code, so they do not filter
+        category_code = self.ui.CategoryBox.currentData()
+        company_code = self.ui.CompanyBox.currentData()
+        # A newer search supersedes this one, so only the results of the last keystroke reach the table
+        self.pager.search(search_text, category_code, company_code)
 
     def closeEvent(self, event):
-        self.db_manager.close()
+        self.database.close()
         event.accept()
 
 if __name__ == "__main__":
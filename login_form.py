@@ -105,6 +105,11 @@ class LoginForm(QWidget):
         self.main_window.show()
         self.close()
 
+    def closeEvent(self, event):
+        """Hand the database connection back when the form is closed."""
+        self.db.close()
+        event.accept()
+
 
 #-------Runs and closes the app-------
 if __name__ == "__main__":
@@ -1,14 +1,23 @@
 import sys
 from PySide6.QtWidgets import QApplication
 from login_form import LoginForm
+import database
+from database_executor import DatabaseExecutor
 
 def main():
     app = QApplication(sys.argv)
 
+    # Write the statistics of the database calls made by the session when the application exits
+    if database.QUERY_STATS.dump_path is None:
+        database.QUERY_STATS.dump_path = "database_stats.json"
+
     with open("styles/styles.qss") as f:
         qss = f.read()
     app.setStyleSheet(qss)
 
+    # Close the connections of the database worker threads before the application exits
+    app.aboutToQuit.connect(DatabaseExecutor.shutdown_all)
+
     login_form = LoginForm()
     login_form.show()
 
@@ -1,6 +1,6 @@
 from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFrame
 from PySide6.QtGui import QPixmap
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QEvent, Qt, QTimer
 from admin_window import AdministrationWindow
 from companies import CompaniesWindow
 from categories import CategoriesWindow
@@ -9,20 +9,21 @@ from view_stock import MainWindow as StockWindow
 from add_stock import MainWindow as AddReceivedStockWindow
 from items import MainWindow as ItemsWindow
 from newItem import MainWindow as NewItemWindow
-from database import DatabaseManager
+from notifications import NotificationsWindow
+from database import DatabaseManager, UserPermissions
+from qt_database import DatabaseRelay
+
+# How often the number of low-stock alerts on the notifications button is refreshed
+ALERT_POLL_INTERVAL_MS = 30_000
 
 class MainWindow(QMainWindow):
     def __init__(self, username):
         super().__init__()
         self.db = DatabaseManager()
+        self.database = DatabaseRelay(self)
         self.username = username
         self.user = self.db.get_user_by_username(username)
 
-        if self.user:
-            self.permissions = self.user.permissions
-        else:
-            self.permissions = []
-
         self.setWindowTitle(" ")
         self.resize(800, 400)
 
@@ -158,8 +159,15 @@ class MainWindow(QMainWindow):
 
         self.check_permissions()
 
+        # The alert count is read on the database worker thread, so polling never blocks the window
+        self.alert_timer = QTimer(self)
+        self.alert_timer.timeout.connect(self.poll_alerts)
+        self.alert_timer.start(ALERT_POLL_INTERVAL_MS)
+        self.poll_alerts()
+
 #---------------------------------------------------------------------------------------------#
         b_logout.clicked.connect(self.logout)
+        self.b_notifications.clicked.connect(self.open_notifications_window)
 
         self.b_userAdministration.clicked.connect(self.open_administration_window)
         self.b_editCategories.clicked.connect(self.open_categories_window)
@@ -214,18 +222,51 @@ class MainWindow(QMainWindow):
         self.new_item = NewItemWindow()
         self.new_item.show()
 
+    def open_notifications_window(self):
+        """Open the window with the low-stock alerts."""
+        self.notifications = NotificationsWindow()
+        self.notifications.show()
+        self.poll_alerts()
+
+    def poll_alerts(self):
+        """Refresh the number of low-stock alerts on the notifications button, if the user may view notifications."""
+        if self.b_notifications.isEnabled():
+            self.database.call_latest("alerts", self.show_alert_count, "count_active_alerts")
+
+    def show_alert_count(self, count):
+        """Show the number of low-stock alerts as a badge on the notifications button."""
+        self.b_notifications.setText(f"Ειδοποιήσεις ({count})" if count else "Ειδοποιήσεις")
+
     def logout(self):
        """Log out of the application."""
        self.close()
        from login_form import LoginForm # import here to avoid circular import
        self.login_window = LoginForm()
        self.login_window.show()
+
+    def changeEvent(self, event):
+        """Check the permissions again when the window is activated, e.g. after the user was edited in the administration window."""
+        if event.type() == QEvent.ActivationChange and self.isActiveWindow():
+            self.check_permissions()
+        super().changeEvent(event)
+
+    def closeEvent(self, event):
+        """Hand the database connection back when the window is closed."""
+        self.alert_timer.stop()
+        self.database.close()
+        self.db.close()
+        event.accept()
 #---------------------------------------------------------------------------------------------#
 
     def check_permissions(self):
         """
-        Check user permissions and disable buttons accordingly.
+        Check user permissions and enable or disable buttons accordingly.
+        The permissions of the session are cached by the database manager until the user is updated, so checking again is cheap.
         """
+        if self.user:
+            permissions = self.db.get_user_permissions(self.user.id)
+        else:
+            permissions = UserPermissions()
 
         button_permissions = {
             self.b_viewStock: "view_stock",
@@ -242,6 +283,6 @@ class MainWindow(QMainWindow):
         }
 
         for button, permission in button_permissions.items():
-            if not getattr(self.permissions, permission):
-                button.setEnabled(False)
-                button.setStyleSheet("color: #A9A9A9;")
+            allowed = getattr(permissions, permission)
+            button.setEnabled(allowed)
+            button.setStyleSheet("" if allowed else "color: #A9A9A9;")
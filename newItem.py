@@ -1,11 +1,11 @@
 import sys
-from PySide6.QtCore import (QCoreApplication, QMetaObject, QSize)
+from PySide6.QtCore import (QCoreApplication, QDate, QMetaObject, QSize)
 from PySide6.QtGui import (QFont, QDoubleValidator)
-from PySide6.QtWidgets import (QApplication, QComboBox, QHBoxLayout, QLabel,
-    QLineEdit, QMainWindow, QPushButton, QSizePolicy,
+from PySide6.QtWidgets import (QApplication, QComboBox, QDateEdit, QHBoxLayout, QLabel,
+    QLineEdit, QMainWindow, QMessageBox, QPushButton, QSizePolicy,
     QVBoxLayout, QWidget)
 import database
-import datetime
+import sqlite3
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -75,7 +75,6 @@ class Ui_MainWindow(object):
         self.QualityCombo.addItem("Φασόν")
 
         self.QualityCombo.hide()
-        self.comboBoxChanged()
 
         self.verticalLayout_2.addWidget(self.QualityCombo)
 
@@ -112,6 +111,29 @@ class Ui_MainWindow(object):
 
         self.verticalLayout_2.addWidget(self.quantityLine)
 
+        # The starting stock of a drug is stored as its first batch, so that the stock matches the batches
+        self.batch_code_label = QLabel(self.centralwidget)
+        self.batch_code_label.setObjectName(u"batch_code_label")
+        self.batch_code_label.setText("Παρτίδα:")
+        self.verticalLayout_2.addWidget(self.batch_code_label)
+
+        self.batchCodeLine = QLineEdit(self.centralwidget)
+        self.batchCodeLine.setObjectName(u"batchCodeLine")
+        self.verticalLayout_2.addWidget(self.batchCodeLine)
+
+        self.expiration_date_label = QLabel(self.centralwidget)
+        self.expiration_date_label.setObjectName(u"expiration_date_label")
+        self.expiration_date_label.setText("Λήξη:")
+        self.verticalLayout_2.addWidget(self.expiration_date_label)
+
+        self.expirationDateEdit = QDateEdit(QDate.currentDate().addYears(1), self.centralwidget)
+        self.expirationDateEdit.setObjectName(u"expirationDateEdit")
+        self.expirationDateEdit.setCalendarPopup(True)
+        self.expirationDateEdit.setDisplayFormat("dd/MM/yyyy")
+        self.verticalLayout_2.addWidget(self.expirationDateEdit)
+
+        self.comboBoxChanged()
+
         self.label_8 = QLabel(self.centralwidget)
         self.label_8.setObjectName(u"label_8")
 
@@ -160,12 +182,9 @@ class Ui_MainWindow(object):
         self.saveButton.setText(QCoreApplication.translate("MainWindow", u"\u0391\u03c0\u03bf\u03b8\u03ae\u03ba\u03b5\u03c5\u03c3\u03b7", None))
 
     def comboBoxChanged(self):
-        if self.TypeCombo.currentText() == "Φάρμακο":
-            self.quality_label.show()
-            self.QualityCombo.show()
-        else:
-            self.quality_label.hide()
-            self.QualityCombo.hide()
+        drug_widgets = [self.quality_label, self.QualityCombo, self.batch_code_label, self.batchCodeLine, self.expiration_date_label, self.expirationDateEdit]
+        for widget in drug_widgets:
+            widget.setVisible(self.TypeCombo.currentText() == "Φάρμακο")
 
     def cancelButtonClicked(self):
         self.close()
@@ -185,12 +204,21 @@ class Ui_MainWindow(object):
             product = database.Product(product_code, name, cost, sell_price, quantity, quantity_limit, company, category)
             self.db_manager.insert_product(product)
         else:
-            #TODO: Fix when batch is implemented
             quality = 1 if self.QualityCombo.currentText() == "Πραγματικό" else 0
-            drug = database.Drug(product_code, name, cost, sell_price, quantity, quantity_limit, company, category, quality, [])
-            # batch = database.DrugBatch(1, product_code, quantity, datetime.datetime.now())
-            drug = database.Drug(product_code, name, cost, sell_price, quantity, quantity_limit, company, category, True, [])
-            self.db_manager.insert_drug(drug)
+            quantity = int(float(quantity or 0))
+            batches = []
+            if quantity:
+                batch_code = self.batchCodeLine.text().strip()
+                if not batch_code:
+                    QMessageBox.warning(self.centralwidget, "Σφάλμα", "Συμπληρώστε τον κωδικό της παρτίδας.")
+                    return
+                batches.append(database.DrugBatch(batch_code, None, quantity, self.expirationDateEdit.date().toPython()))
+            drug = database.Drug(product_code, name, cost, sell_price, quantity, quantity_limit, company, category, quality, batches)
+            try:
+                self.db_manager.insert_drug(drug)
+            except sqlite3.IntegrityError:
+                QMessageBox.warning(self.centralwidget, "Σφάλμα", "Υπάρχει ήδη παρτίδα με αυτόν τον κωδικό.")
+                return
         self.close()
     
     def close(self):
@@ -204,14 +232,10 @@ class MainWindow(QMainWindow):
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
         
-        # Initialize database manager
-        self.db_manager = database.DatabaseManager()
-        products = self.db_manager.get_all_products()
-        self.product_code = 0
-        for product in products:
-            if product.product_code_int > self.product_code:
-                self.product_code = product.product_code_int
-        self.product_code += 1
+        # Share the database connection of the UI
+        self.db_manager = self.ui.db_manager
+        # Reserve the code of the new product up front, so that it can be shown before saving
+        self.product_code = database.CodeAllocator.for_path(self.db_manager.pool.database_path, "Product").next_code()
         self.ui.product_code_label.setText(f"P{str(self.product_code).zfill(6)}")
 
     def closeEvent(self, event):
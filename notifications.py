@@ -0,0 +1,66 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QApplication
+import sys
+from PySide6.QtCore import Qt
+from database import DatabaseManager, StockAlert
+
+# The most alerts shown at once, the newest ones
+ALERT_LIMIT = 500
+
+class NotificationsWindow(QWidget):
+    """
+    Lists the products whose stock has fallen below their quantity limit, newest alert first.
+    """
+    def __init__(self):
+        super().__init__()
+        self.db = DatabaseManager()
+        self.setWindowTitle("Ειδοποιήσεις")
+        self.resize(782, 500)
+
+        layout = QVBoxLayout()
+
+        self.table_widget = QTableWidget()
+        self.table_widget.setColumnCount(5)
+        self.table_widget.setHorizontalHeaderLabels(["Κωδικός", "Όνομα", "Ποσότητα", "Όριο", "Από"])
+        self.table_widget.verticalHeader().setVisible(False)
+        self.table_widget.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table_widget.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+
+        layout.addWidget(self.table_widget)
+        layout.setAlignment(Qt.AlignLeft)
+        self.setLayout(layout)
+
+        self.load_data()
+
+    def load_data(self):
+        """
+        Loads the open low-stock alerts and populates the table widget.
+        """
+        self.fill_table(self.db.get_active_alerts(ALERT_LIMIT))
+
+    def fill_table(self, alerts: list[StockAlert]):
+        """
+        Populates the table widget with the given alerts.
+
+        Args:
+            alerts (list[StockAlert]): The alerts to show.
+        """
+        self.table_widget.setRowCount(len(alerts))
+        for row, alert in enumerate(alerts):
+            product = alert.product
+            self.table_widget.setItem(row, 0, QTableWidgetItem(product.product_code))
+            self.table_widget.setItem(row, 1, QTableWidgetItem(product.name))
+            self.table_widget.setItem(row, 2, QTableWidgetItem(str(product.quantity)))
+            self.table_widget.setItem(row, 3, QTableWidgetItem(str(product.quantity_limit)))
+            self.table_widget.setItem(row, 4, QTableWidgetItem(alert.raised_at))
+
+    def closeEvent(self, event):
+        """Hand the database connection back when the window is closed."""
+        self.db.close()
+        event.accept()
+
+#-------Runs and closes the app-------
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    window = NotificationsWindow()
+    window.show()
+    sys.exit(app.exec())
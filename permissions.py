@@ -4,11 +4,16 @@ from database import DatabaseManager, UserPermissions
 
 class PermissionsLayout(QVBoxLayout):
     """Custom layout for managing user permissions."""
-    def __init__(self, username=None):
-        """Initialize the PermissionsLayout."""
+    def __init__(self, username=None, db=None):
+        """Initialize the PermissionsLayout.
+
+        Args:
+            username (str, optional): The user whose permissions are shown.
+            db (DatabaseManager, optional): The database manager of the owning dialog. A new one is opened if not given.
+        """
         super().__init__()
         self.username = username
-        self.db = DatabaseManager()
+        self.db = db if db else DatabaseManager()
 
         self.addWidget(QLabel("Δικαιώματα:"))
         self.permission_checkboxes = []
@@ -86,17 +91,14 @@ class PermissionsLayout(QVBoxLayout):
             self.permission_checkboxes[target_index].setChecked(False)
             
     def update_permission(self, index, state):
-        """Update permission value in the database when a checkbox is toggled."""
+        """Update permission value in the database when a checkbox is toggled, setting or clearing only its bit."""
         column_name = self.permission_columns[index]
         checkbox = self.permission_checkboxes[index]
         value = 1 if checkbox.isChecked() else 0
 
         user = self.db.get_user_by_username(self.username)
         if user:
-            permissions = getattr(user, 'permissions', UserPermissions())
-            setattr(permissions, column_name, value)
-            user.permissions = permissions
-            self.db.update_user(user)
+            self.db.set_user_permission(user.id, column_name, value)
 
     def get_permissions(self):
         """Get the current permission values."""
@@ -0,0 +1,195 @@
+import concurrent.futures
+import typing
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtWidgets import QAbstractItemView
+from database import DEFAULT_PROFILE
+from database_executor import DatabaseExecutor
+
+class DatabaseRelay(QObject):
+    """
+    Runs DatabaseManager calls on the worker thread of a DatabaseExecutor and hands their results to callbacks on the GUI thread.
+
+    Each window owns a relay, so the keys of its superseding calls do not clash with other windows sharing the executor.
+
+    Attributes:
+        executor (DatabaseExecutor): The executor that runs the calls.
+    """
+    # Emitted from the worker thread when a call finishes, delivered to _deliver on the thread of the relay
+    _finished = Signal(object, object, object)
+
+    def __init__(self, parent: typing.Optional[QObject] = None, database_path: str = 'database.db', profile: str = DEFAULT_PROFILE):
+        """
+        Initializes a new instance of the DatabaseRelay class.
+
+        Args:
+            parent (QObject): The window that owns the relay.
+            database_path (str): The path to the SQLite3 database file.
+            profile (str): The name of the DATABASE_PROFILES entry used by the worker's connection.
+        """
+        super().__init__(parent)
+        self.executor = DatabaseExecutor.for_path(database_path, profile)
+        self._keys = set()
+        self._finished.connect(self._deliver)
+
+    def call_latest(self, key: str, callback: typing.Callable[[typing.Any], None], method: typing.Union[str, typing.Callable], *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Runs a call on the worker thread and passes its result to callback on the GUI thread.
+        A call superseded by a newer call with the same key is dropped, so its callback is never run.
+
+        Args:
+            key (str): Identifies the calls of this relay that supersede each other.
+            callback (Callable): Receives the return value of the call. Exceptions raised by the call are raised on the GUI thread instead.
+            method (str | Callable): The name of the DatabaseManager method to call,
+                or a function that is called with the worker's DatabaseManager followed by the arguments.
+            *args: The positional arguments of the call.
+            **kwargs: The keyword arguments of the call.
+
+        Returns:
+            concurrent.futures.Future: The future of the call.
+        """
+        key = (id(self), key)
+        self._keys.add(key)
+        future = self.executor.submit_latest(key, method, *args, **kwargs)
+        future.add_done_callback(lambda future: self._emit(key, callback, future))
+        return future
+
+    def _emit(self, key: tuple, callback: typing.Callable[[typing.Any], None], future: concurrent.futures.Future):
+        """
+        Sends a finished call to the GUI thread, unless it has been cancelled or superseded.
+
+        Args:
+            key (tuple): The executor key of the call.
+            callback (Callable): The callback of the call.
+            future (concurrent.futures.Future): The finished future of the call.
+        """
+        if future.cancelled() or not self.executor.is_latest(key, future):
+            return
+        self._finished.emit(key, callback, future)
+
+    def _deliver(self, key: tuple, callback: typing.Callable[[typing.Any], None], future: concurrent.futures.Future):
+        """
+        Runs the callback of a finished call on the GUI thread, unless a newer call was made while it was being delivered.
+
+        Args:
+            key (tuple): The executor key of the call.
+            callback (Callable): The callback of the call.
+            future (concurrent.futures.Future): The finished future of the call.
+        """
+        if self.executor.is_latest(key, future):
+            callback(future.result())
+
+    def close(self):
+        """
+        Cancels the pending calls of this relay and drops the results of its running call.
+        """
+        for key in self._keys:
+            self.executor.forget(key)
+        self._keys.clear()
+
+# The number of products loaded into a table at a time
+PRODUCT_PAGE_SIZE = 100
+
+# How close to the end of a table, in rows, the next page is loaded
+PRODUCT_PAGE_THRESHOLD = 20
+
+class ProductSearchPager(QObject):
+    """
+    Shows the results of search_products in a table a page at a time, loading the next page when the table is scrolled near its end,
+    so that a search never loads every matching product.
+
+    The pages are loaded through a DatabaseRelay, a new search supersedes the pages still being loaded for the previous one.
+
+    Attributes:
+        products (list[Product]): The products loaded so far, in table order.
+        total (int): The number of products matching the current search.
+    """
+    def __init__(self, relay: DatabaseRelay, table: QAbstractItemView, show_rows: typing.Callable[[list, int], None], page_size: int = PRODUCT_PAGE_SIZE):
+        """
+        Initializes a new instance of the ProductSearchPager class. Nothing is loaded until search is called.
+
+        Args:
+            relay (DatabaseRelay): The relay the pages are loaded through, also the parent of the pager.
+            table (QAbstractItemView): The table the products are shown in, whose scrolling loads the next pages.
+            show_rows (Callable[[list, int], None]): Shows a page of products in the table, starting at the given row.
+                The rows after the page are removed, so a page shown at row 0 replaces the table.
+            page_size (int): The number of products loaded at a time.
+        """
+        super().__init__(relay)
+        self.relay = relay
+        self.table = table
+        self.show_rows = show_rows
+        self.page_size = page_size
+        self.products = []
+        self.total = 0
+        self._search = ('', None, None)
+        self._loading = False
+        table.verticalScrollBar().valueChanged.connect(self._scrolled)
+
+    def search(self, text: str = '', category_code: typing.Optional[int] = None, company_code: typing.Optional[int] = None):
+        """
+        Replaces the table with the first page of the products matching a search.
+
+        Args:
+            text (str): The words the products must match, as in search_products. An empty text matches every product.
+            category_code (int): The code of the category the products must belong to, or None for any category.
+            company_code (int): The code of the company that must produce the products, or None for any company.
+        """
+        self._search = (text, category_code, company_code)
+        self._load(0)
+
+    def reload(self):
+        """
+        Replaces the table with the first page of the current search again, e.g. after a product was changed.
+        """
+        self._load(0)
+
+    def load_more(self):
+        """
+        Appends the next page of the current search to the table, unless every match is loaded or a page is being loaded.
+        """
+        if not self._loading and len(self.products) < self.total:
+            self._load(len(self.products))
+
+    def _load(self, offset: int):
+        """
+        Loads the page of the current search starting at offset, superseding the page being loaded.
+
+        Args:
+            offset (int): The number of products before the page.
+        """
+        self._loading = True
+        text, category_code, company_code = self._search
+        self.relay.call_latest("products", lambda result: self._show(offset, *result), "search_products",
+                               text, category_code, company_code, limit=self.page_size, offset=offset)
+
+    def _show(self, offset: int, products: list, total: int):
+        """
+        Shows a loaded page, then loads the next one if the last rows are already in view.
+
+        Args:
+            offset (int): The number of products before the page.
+            products (list[Product]): The products of the page.
+            total (int): The number of products matching the search.
+        """
+        self._loading = False
+        self.products[offset:] = products
+        self.total = total
+        self.show_rows(products, offset)
+        self._fill()
+
+    def _scrolled(self, value: int):
+        """
+        Loads the next page when the table is scrolled close to the last loaded row.
+
+        Args:
+            value (int): The position of the vertical scroll bar.
+        """
+        self._fill()
+
+    def _fill(self):
+        """
+        Loads the next page if the last rows of the table are in view, or the rows do not fill the table.
+        """
+        last_visible = self.table.rowAt(self.table.viewport().height() - 1)
+        if last_visible < 0 or last_visible >= len(self.products) - PRODUCT_PAGE_THRESHOLD:
+            self.load_more()
@@ -0,0 +1,96 @@
+import numpy
+
+# The snapshot fields the stock can be valued at
+PRICE_FIELDS = ("purchase_cost", "selling_price")
+
+# The snapshot fields the stock value can be grouped by
+GROUP_FIELDS = ("category_code", "company_code")
+
+def stock_value(snapshot: numpy.ndarray, price: str = "purchase_cost") -> float:
+    """
+    Calculates the total value of the stock.
+
+    Args:
+        snapshot (numpy.ndarray): An inventory snapshot returned by DatabaseManager.inventory_snapshot.
+        price (str): The price field to value the stock at, purchase_cost or selling_price.
+
+    Returns:
+        float: The sum of quantity times price over all products.
+
+    Raises:
+        ValueError: If price is not purchase_cost or selling_price.
+    """
+    if price not in PRICE_FIELDS:
+        raise ValueError(f"Cannot value stock at {price}")
+    return float(numpy.dot(snapshot["quantity"], snapshot[price]))
+
+def stock_value_by(snapshot: numpy.ndarray, field: str, price: str = "purchase_cost") -> numpy.ndarray:
+    """
+    Calculates the value of the stock of every category or company.
+
+    Args:
+        snapshot (numpy.ndarray): An inventory snapshot returned by DatabaseManager.inventory_snapshot.
+        field (str): The code field to group the products by, category_code or company_code.
+        price (str): The price field to value the stock at, purchase_cost or selling_price.
+
+    Returns:
+        numpy.ndarray: The stock value indexed by code, index 0 holds the products without a category or company.
+
+    Raises:
+        ValueError: If field is not category_code or company_code, or price is not purchase_cost or selling_price.
+    """
+    if field not in GROUP_FIELDS:
+        raise ValueError(f"Cannot group stock by {field}")
+    if price not in PRICE_FIELDS:
+        raise ValueError(f"Cannot value stock at {price}")
+    return numpy.bincount(snapshot[field], weights=snapshot["quantity"] * snapshot[price])
+
+def margins(snapshot: numpy.ndarray) -> numpy.ndarray:
+    """
+    Calculates the profit margin of every product.
+
+    Args:
+        snapshot (numpy.ndarray): An inventory snapshot returned by DatabaseManager.inventory_snapshot.
+
+    Returns:
+        numpy.ndarray: The selling price minus the purchase cost of each product, in snapshot order.
+    """
+    return snapshot["selling_price"] - snapshot["purchase_cost"]
+
+def margin_ratios(snapshot: numpy.ndarray) -> numpy.ndarray:
+    """
+    Calculates the profit margin of every product as a fraction of its selling price.
+
+    Args:
+        snapshot (numpy.ndarray): An inventory snapshot returned by DatabaseManager.inventory_snapshot.
+
+    Returns:
+        numpy.ndarray: The margin divided by the selling price of each product, NaN for products sold for free.
+    """
+    selling_price = snapshot["selling_price"]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(selling_price != 0, margins(snapshot) / selling_price, numpy.nan)
+
+def under_limit(snapshot: numpy.ndarray) -> numpy.ndarray:
+    """
+    Finds the products whose stock has fallen below their quantity limit.
+
+    Args:
+        snapshot (numpy.ndarray): An inventory snapshot returned by DatabaseManager.inventory_snapshot.
+
+    Returns:
+        numpy.ndarray: A boolean mask that is True for every product that needs to be reordered.
+    """
+    return snapshot["quantity"] < snapshot["quantity_limit"]
+
+def reorder_quantities(snapshot: numpy.ndarray) -> numpy.ndarray:
+    """
+    Calculates how many items of every product must be ordered to bring it back to its quantity limit.
+
+    Args:
+        snapshot (numpy.ndarray): An inventory snapshot returned by DatabaseManager.inventory_snapshot.
+
+    Returns:
+        numpy.ndarray: The missing quantity of each product, 0 for products at or above their limit.
+    """
+    return numpy.maximum(snapshot["quantity_limit"] - snapshot["quantity"], 0)
@@ -1,5 +1,11 @@
+import datetime
+import json
+import logging
+import multiprocessing
 import pytest
-from database import Category, Company, DatabaseManager, Product, User, UserPermissions
+import threading
+from database import DATABASE_PROFILES, QUERY_STATS, SCHEMA_VERSION, Category, Client, CodeAllocator, Company, ConnectionPool, DatabaseManager, Drug, DrugBatch, InsufficientStockError, Orders, Product, User, UserPermissions
+import database
 import sqlite3
 
 class SQLiteDB:
@@ -75,6 +81,21 @@ def test_get_all_users(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[Use
         assert u[0].permissions.user_administration == user.permissions.user_administration
 
 
+def test_get_user_by_username(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[User]):
+    insert_users(sqlite_db, users)
+
+    for user in users:
+        u = db.get_user_by_username(user.username)
+        assert u is not None
+        assert u.id == user.id
+        assert u.password == user.password
+        assert u.full_name == user.full_name
+        assert u.permissions.view_stock == user.permissions.view_stock
+        assert u.permissions.user_administration == user.permissions.user_administration
+
+    assert db.get_user_by_username("nobody") is None
+
+
 def test_update_user(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[User]):
     insert_users(sqlite_db, users)
 
@@ -128,6 +149,59 @@ def test_insert_user(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[User]
         sqlite_db.cur.execute("SELECT * FROM User WHERE Username = ?", (user.username,))
         assert len(sqlite_db.cur.fetchall()) == 1
 
+def test_permissions_bitmask(sqlite_db: SQLiteDB, db: DatabaseManager):
+    permissions = UserPermissions(view_stock=True, view_bills=True)
+    assert permissions.mask == 0b100000001
+    permissions.view_bills = False
+    permissions.user_administration = True
+    assert permissions == UserPermissions.from_mask(0b100000000001)
+    assert UserPermissions(*[True] * 12).includes(permissions)
+    assert not permissions.includes(UserPermissions(edit_stock=True))
+    assert len({permissions, UserPermissions.from_mask(0b100000000001), UserPermissions()}) == 2
+
+    db.insert_user(User(0, "jdoe", "pass", "John Doe", permissions))
+    sqlite_db.cur.execute("SELECT ViewStock, ViewBills, UserAdministration FROM UserPermissions")
+    assert sqlite_db.cur.fetchone() == (1, 0, 1)
+    sqlite_db.cur.execute("UPDATE UserPermissions SET ViewBills = 1, ViewStock = 0")
+    sqlite_db.con.commit()
+    assert db.get_user_by_username("jdoe").permissions == UserPermissions(view_bills=True, user_administration=True)
+
+def test_permissions_migration(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[User]):
+    insert_users(sqlite_db, users)
+    sqlite_db.cur.execute("INSERT INTO User(Username, Password, FullName) VALUES ('nobody', 'pass', 'Nobody')")
+    for name in ("Insert", "Update", "Delete"):
+        sqlite_db.cur.execute(f"DROP TRIGGER TR_UserPermissions_{name}")
+    sqlite_db.cur.execute("DROP VIEW UserPermissions")
+    sqlite_db.cur.execute("CREATE TABLE UserPermissions AS SELECT Id AS UserId, 1 AS ViewStock, 0 AS EditStock, 0 AS AddProduct, 0 AS ViewNotifications, 0 AS CreateClientList, 0 AS ViewOrders, 0 AS AddOrders, 0 AS ChangeOrderState, 1 AS ViewBills, 0 AS CreateBills, 0 AS ViewSalaries, 0 AS UserAdministration FROM User WHERE Username <> 'nobody'")
+    sqlite_db.cur.execute("ALTER TABLE User DROP COLUMN Permissions")
+    sqlite_db.cur.execute(f"PRAGMA user_version = {database.MIGRATIONS.index(database._migration_pack_permissions)}")
+    sqlite_db.con.commit()
+
+    db.create_tables()
+
+    masks = {user.username: user.permissions.mask for user in db.get_all_users()}
+    assert masks == {"jdoe": 0b100000001, "bwayne": 0b100000001, "pparker": 0b100000001, "nobody": 0}
+
+def test_session_permissions_are_cached(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[User]):
+    insert_users(sqlite_db, users)
+    user = db.get_user_by_username("jdoe")
+
+    permissions = db.get_user_permissions(user.id)
+    assert permissions.view_stock
+    assert db.get_user_permissions(user.id) is permissions
+
+    user.permissions = UserPermissions(view_orders=True)
+    db.update_user(user)
+    assert db.get_user_permissions(user.id) == UserPermissions(view_orders=True)
+
+    db.set_user_permission(user.id, "view_bills", True)
+    db.set_user_permission(user.id, "view_orders", False)
+    assert db.get_user_permissions(user.id) == UserPermissions(view_bills=True)
+    assert db.get_user_by_username("bwayne").permissions.user_administration
+    assert db.get_user_permissions(12345) == UserPermissions()
+    with pytest.raises(ValueError):
+        db.set_user_permission(user.id, "fly", True)
+
 
 @pytest.fixture
 def companies():
@@ -171,6 +245,24 @@ def test_insert_company(sqlite_db: SQLiteDB, db: DatabaseManager, companies: lis
         sqlite_db.cur.execute("SELECT * FROM Company WHERE Name = ?", (company.name,))
         assert len(sqlite_db.cur.fetchall()) == 1
 
+def test_get_company_by_code_is_cached(sqlite_db: SQLiteDB, db: DatabaseManager, companies: list[Company]):
+    insert_companies(sqlite_db, companies)
+    code = companies[0].company_code_int
+
+    company = db.get_company_by_code(code)
+    assert db.get_company_by_code(code) is company
+    assert DatabaseManager(sqlite_db.path).get_company_by_code(code) is company
+    assert db.get_company_by_code(999) is None
+    assert db.cache_stats() == {"hits": 2, "misses": 2, "size": 1}
+
+    company.name = "Renamed"
+    db.update_company(company)
+    renamed = db.get_company_by_code(code)
+    assert renamed is not company and renamed.name == "Renamed"
+
+    db.insert_company(Company("", "New"))
+    assert db.cache_stats()["size"] == 0
+
 @pytest.fixture
 def sample_categories():
     return [
@@ -214,5 +306,755 @@ def test_insert_category(sqlite_db: SQLiteDB, db: DatabaseManager, sample_catego
         assert len(sqlite_db.cur.fetchall()) == 1
 
 
+def test_get_category_by_code_forgets_rolled_back_changes(sqlite_db: SQLiteDB, db: DatabaseManager, sample_categories: list[Category]):
+    insert_categories(sqlite_db, sample_categories)
+    code = sample_categories[0].category_code_int
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.update_category(Category(code, "Rolled back"))
+            assert db.get_category_by_code(code).name == "Rolled back"
+            raise RuntimeError
+
+    assert db.get_category_by_code(code).name == sample_categories[0].name
+
+
+
+
+def insert_products(sqlite_db: SQLiteDB, products: list[Product]):
+    for product in products:
+        sqlite_db.cur.execute('''INSERT INTO Product(Name, PurchaseCost, SellingPrice, Quantity, QuantityLimit, CompanyCode, CategoryCode)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                              (product.name, product.purchase_cost, product.selling_price, product.quantity,
+                               product.quantity_limit, product.company.company_code_int, product.category.category_code_int))
+        product.product_code = f"P{sqlite_db.cur.lastrowid:06}"
+        sqlite_db.con.commit()
+
+@pytest.fixture
+def sample_products(sqlite_db: SQLiteDB, companies: list[Company], sample_categories: list[Category]):
+    insert_companies(sqlite_db, companies)
+    insert_categories(sqlite_db, sample_categories)
+    return [
+        Product("", f"Προϊόν {i}", 1.5 * i, 2.5 * i, 10 * i, 5, companies[i % len(companies)], sample_categories[i % len(sample_categories)])
+        for i in range(1, 10)
+    ]
+
+def test_get_all_products(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+
+    all_products = db.get_all_products()
+
+    assert len(all_products) == len(sample_products)
+
+    for product in sample_products:
+        p = [p for p in all_products if p.product_code == product.product_code]
+        assert len(p) == 1
+        assert p[0].name == product.name
+        assert p[0].purchase_cost == product.purchase_cost
+        assert p[0].selling_price == product.selling_price
+        assert p[0].quantity == product.quantity
+        assert p[0].quantity_limit == product.quantity_limit
+        assert p[0].company.company_code_int == product.company.company_code_int
+        assert p[0].company.name == product.company.name
+        assert p[0].category.category_code_int == product.category.category_code_int
+        assert p[0].category.name == product.category.name
+
+def test_get_product_by_code(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+    expected = sample_products[2]
+
+    product = db.get_product_by_code(expected.product_code_int)
+
+    assert (product.product_code, product.name, product.quantity) == (expected.product_code, expected.name, expected.quantity)
+    assert (product.company.name, product.category.name) == (expected.company.name, expected.category.name)
+    assert db.get_product_by_code(999) is None
+
+def test_get_products_by_codes(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product], monkeypatch: pytest.MonkeyPatch):
+    insert_products(sqlite_db, sample_products)
+    monkeypatch.setattr(database, "MAX_QUERY_PARAMETERS", 2)
+    codes = [p.product_code_int for p in reversed(sample_products)]
+
+    products = db.get_products_by_codes(codes[:3] + [999] + codes[3:] + codes[:1])
+
+    assert [p.product_code_int for p in products] == codes
+    assert products[0].company is products[3].company
+    assert db.get_products_by_codes([]) == []
+
+def test_adjust_quantity(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+    first, second = sample_products[0], sample_products[1]
+
+    assert db.adjust_quantity(first.product_code_int, 5) == first.quantity + 5
+    assert db.adjust_quantity(first.product_code_int, -2) == first.quantity + 3
+    assert db.adjust_quantity(999, 5) is None
+    assert db.adjust_quantities([(first.product_code_int, 1), (second.product_code_int, 4), (first.product_code_int, 1), (999, 1)]) == {
+        first.product_code_int: first.quantity + 5,
+        second.product_code_int: second.quantity + 4,
+    }
+    sqlite_db.cur.execute("SELECT Quantity FROM Product WHERE ProductCode IN (?, ?) ORDER BY ProductCode", (first.product_code_int, second.product_code_int))
+    assert sqlite_db.cur.fetchall() == [(first.quantity + 5,), (second.quantity + 4,)]
+
+def test_stock_alerts(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+    first, second = sample_products[0], sample_products[1]
+    assert db.count_active_alerts() == 0
+
+    db.adjust_quantity(first.product_code_int, -8)
+    db.adjust_quantity(first.product_code_int, -1)
+    db.adjust_quantity(second.product_code_int, -16)
+    alerts = db.get_active_alerts()
+    assert db.count_active_alerts() == 2
+    assert sorted(alert.product.product_code for alert in alerts) == [first.product_code, second.product_code]
+    assert {alert.product.quantity for alert in alerts} == {1, 4}
+
+    db.adjust_quantity(first.product_code_int, 4)
+    second.quantity, second.quantity_limit = 4, 3
+    db.update_product(second)
+    assert db.count_active_alerts() == 0
+    db.adjust_quantity(first.product_code_int, -5)
+    assert [alert.product.product_code for alert in db.get_active_alerts()] == [first.product_code]
+    sqlite_db.cur.execute("SELECT COUNT(*), COUNT(ClearedAt) FROM StockAlert")
+    assert sqlite_db.cur.fetchone() == (3, 2)
+
+    sqlite_db.cur.execute("DELETE FROM Product WHERE ProductCode = ?", (first.product_code_int,))
+    sqlite_db.con.commit()
+    assert db.count_active_alerts() == 0
+
+def test_stock_alerts_migration(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    for name in ("Insert_StockAlert", "Update_StockAlert_Raise", "Update_StockAlert_Clear", "Delete_StockAlert"):
+        sqlite_db.cur.execute(f"DROP TRIGGER TR_Product_{name}")
+    sqlite_db.cur.execute("DROP TABLE StockAlert")
+    insert_products(sqlite_db, sample_products)
+    sqlite_db.cur.execute("UPDATE Product SET Quantity = 0 WHERE ProductCode <= 3")
+    sqlite_db.cur.execute(f"PRAGMA user_version = {database.MIGRATIONS.index(database._migration_create_stock_alerts)}")
+    sqlite_db.con.commit()
+
+    db.create_tables()
+
+    assert db.count_active_alerts() == 3
+
+def adjust_quantity_repeatedly(database_path: str, product_codes: list[int], repeats: int):
+    db = DatabaseManager(database_path)
+    for _ in range(repeats):
+        db.adjust_quantity(product_codes[0], 1)
+        db.adjust_quantities({code: 1 for code in product_codes})
+    db.close()
+
+def test_adjust_quantity_from_many_processes(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products[:2])
+    codes = [p.product_code_int for p in sample_products[:2]]
+    processes, repeats = 4, 100
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=adjust_quantity_repeatedly, args=(str(sqlite_db.path), codes, repeats)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0] * processes
+    sqlite_db.cur.execute("SELECT Quantity FROM Product ORDER BY ProductCode")
+    assert sqlite_db.cur.fetchall() == [(sample_products[0].quantity + 2 * processes * repeats,), (sample_products[1].quantity + processes * repeats,)]
+
+def test_product_codes_are_stored_as_integers():
+    product = Product("P000042", "Προϊόν", 1.0, 2.0, 1, 1, Company(3, "Εταιρεία"), Category("", "Κατηγορία"))
+
+    assert (product.product_code, product.product_code_int) == ("P000042", 42)
+    assert (product.company.company_code, product.company.company_code_int) == ("S000003", 3)
+    assert (product.category.category_code, product.category.category_code_int) == ("", None)
+    product.product_code = 7
+    assert product.product_code == "P000007"
+    assert not hasattr(product, "__dict__")
+
+def test_get_all_products_shares_companies_and_categories(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+
+    all_products = db.get_all_products()
+
+    assert len({id(p.company) for p in all_products}) == len({p.company.company_code_int for p in sample_products})
+    assert len({id(p.category) for p in all_products}) == len({p.category.category_code_int for p in sample_products})
+
+def test_connection_pool_reuses_connections(sqlite_db: SQLiteDB):
+    pool = ConnectionPool.for_path(sqlite_db.path)
+
+    db1 = DatabaseManager(sqlite_db.path)
+    conn = db1.conn
+    db1.close()
+    db1.close()
+    db2 = DatabaseManager(sqlite_db.path)
+
+    assert db2.pool is pool
+    assert db2.conn is conn
+    assert pool.open_connections == 1
+
+    db3 = DatabaseManager(sqlite_db.path)
+    assert db3.conn is not conn
+    assert pool.open_connections == 2
+
+    db2.close()
+    db3.close()
+    assert pool.idle_connections == 2
+    pool.close_idle()
+    assert pool.open_connections == 0
+
+def test_database_manager_closes_at_end_of_with_block(sqlite_db: SQLiteDB):
+    pool = ConnectionPool.for_path(sqlite_db.path)
+    idle = pool.idle_connections
+    with DatabaseManager(sqlite_db.path) as db:
+        assert db.get_all_users() is not None
+    assert db.conn is None
+    assert pool.idle_connections == max(idle, 1)
+
+def test_connection_pool_is_per_thread(sqlite_db: SQLiteDB):
+    db = DatabaseManager(sqlite_db.path)
+    conn = db.conn
+    db.close()
+
+    thread_conns = []
+    def worker():
+        thread_db = DatabaseManager(sqlite_db.path)
+        thread_conns.append(thread_db.conn)
+        thread_db.get_all_users()
+        thread_db.close()
+        thread_db.pool.close_idle()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert len(thread_conns) == 1
+    assert thread_conns[0] is not conn
+    assert db.pool.open_connections == 1
+
+def test_connection_pool_drops_idle_connections_of_exited_threads(sqlite_db: SQLiteDB):
+    pool = ConnectionPool.for_path(sqlite_db.path)
+    pool.close_idle()
+
+    def worker():
+        DatabaseManager(sqlite_db.path).close()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert pool.open_connections == 0
+    assert pool.idle_connections == 0
+
+def test_in_memory_databases_are_separate():
+    db1 = DatabaseManager(':memory:')
+    db1.insert_company(Company(1, "Εταιρεία"))
+    db2 = DatabaseManager(':memory:')
+
+    assert db2.get_all_companies() == []
+    assert db2.pool is not db1.pool
+    assert db2.identity_map is not db1.identity_map
+    assert db1.get_company_by_code(1).name == "Εταιρεία"
+    assert db2.get_company_by_code(1) is None
+
+    db1.insert_category(Category(1, "Κατηγορία"))
+    drug = db1.insert_drug(Drug("", "Panadol", 1.0, 2.0, 12, 5, Company(1, ""), Category(1, ""), True,
+                                [DrugBatch("P1", None, 12, "2030-01-01")]))
+    assert [b.batch_code for b in db1.get_product_by_code(drug).batches] == ["P1"]
+    db1.close()
+    db2.close()
+
+def test_new_database_is_at_schema_version(sqlite_db: SQLiteDB, db: DatabaseManager):
+    sqlite_db.cur.execute("PRAGMA user_version")
+    assert sqlite_db.cur.fetchone()[0] == SCHEMA_VERSION
+
+def test_up_to_date_schema_is_checked_with_one_pragma(db: DatabaseManager):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    db.create_tables()
+    db.conn.set_trace_callback(QUERY_STATS.record_statement)
+
+    assert statements == ["PRAGMA user_version"]
+
+def test_unversioned_database_is_migrated(sqlite_db: SQLiteDB):
+    sqlite_db.cur.execute("CREATE TABLE Company (CompanyCode INTEGER PRIMARY KEY, Name TEXT NOT NULL)")
+    sqlite_db.cur.execute("INSERT INTO Company(Name) VALUES ('Legacy')")
+    sqlite_db.con.commit()
+
+    db = DatabaseManager(sqlite_db.path)
+
+    assert [c.name for c in db.get_all_companies()] == ["Legacy"]
+    sqlite_db.cur.execute("PRAGMA user_version")
+    assert sqlite_db.cur.fetchone()[0] == SCHEMA_VERSION
+
+@pytest.mark.parametrize("profile", sorted(DATABASE_PROFILES))
+def test_profile_is_applied(sqlite_db: SQLiteDB, profile: str):
+    db = DatabaseManager(sqlite_db.path, profile)
+
+    for name, value in DATABASE_PROFILES[profile].items():
+        db.c.execute(f"PRAGMA {name}")
+        actual = db.c.fetchone()[0]
+        if name == "journal_mode":
+            assert actual.upper() == value
+        elif name in ("busy_timeout", "cache_size", "mmap_size"):
+            assert actual == value
+    db.close()
+
+def test_allocate_codes(sqlite_db: SQLiteDB, db: DatabaseManager, companies: list[Company]):
+    assert db.allocate_code("Company") == 1
+    assert db.allocate_codes("Company", 3) == range(2, 5)
+    sqlite_db.cur.execute("INSERT INTO Company(CompanyCode, Name) VALUES (50, 'Explicit')")
+    sqlite_db.con.commit()
+    assert db.allocate_code("Company") == 51
+    assert db.allocate_code("Category") == 1
+    with pytest.raises(ValueError):
+        db.allocate_code("Orders")
+
+    assert db.insert_company(companies[0]) == 52
+    assert db.insert_company(Company(60, "Explicit")) == 60
+    assert db.insert_client(Client(None, "Πελάτης", "Οδός", 2100000000)) == 1
+    assert db.insert_products_many([Product("P000010", "Α", 1.0, 2.0, 1, 1, companies[0], Category("", "")), Product("", "Β", 1.0, 2.0, 1, 1, companies[0], Category("", ""))]) == [10, 1]
+    assert db.allocate_code("Company") == 61
+
+def test_sequences_start_after_existing_codes(sqlite_db: SQLiteDB, db: DatabaseManager):
+    for table in ("Product", "Company", "Category", "Client"):
+        sqlite_db.cur.execute(f"DROP TRIGGER TR_{table}_Insert_Sequence")
+    sqlite_db.cur.execute("DROP TABLE Sequence")
+    sqlite_db.cur.execute("INSERT INTO Client(ClientId, FullName) VALUES (7, 'Πελάτης')")
+    sqlite_db.cur.execute(f"PRAGMA user_version = {database.MIGRATIONS.index(database._migration_create_sequences)}")
+    sqlite_db.con.commit()
+
+    db.create_tables()
+
+    assert db.allocate_code("Client") == 8
+    assert db.allocate_code("Product") == 1
+
+def test_code_allocator_reserves_blocks(sqlite_db: SQLiteDB, db: DatabaseManager):
+    allocator = CodeAllocator(sqlite_db.path, "Product", block_size=5)
+    other = CodeAllocator(sqlite_db.path, "Product", block_size=5)
+
+    assert [allocator.next_code() for _ in range(3)] == [1, 2, 3]
+    assert other.next_code() == 6
+    assert [allocator.next_code() for _ in range(3)] == [4, 5, 11]
+    assert CodeAllocator.for_path(sqlite_db.path, "Product") is CodeAllocator.for_path(sqlite_db.path, "Product")
+
+    codes = []
+    threads = [threading.Thread(target=lambda: codes.extend(allocator.next_code() for _ in range(50))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(codes)) == 200
+
+def test_query_stats(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product], tmp_path):
+    insert_products(sqlite_db, sample_products)
+    # The first full text query of a connection also reads the search index configuration
+    db.search_products("προϊόν", limit=1)
+    QUERY_STATS.reset()
+
+    db.get_all_products()
+    db.get_all_products()
+    db.search_products("προϊόν", limit=2)
+    with pytest.raises(ValueError):
+        db.search_products(order_by="Price")
+
+    stats = QUERY_STATS.snapshot()
+    assert {key: stats["get_all_products"][key] for key in ("calls", "errors", "rows", "statements")} == {
+        "calls": 2, "errors": 0, "rows": 2 * len(sample_products), "statements": 2}
+    assert {key: stats["search_products"][key] for key in ("calls", "errors", "rows", "statements")} == {
+        "calls": 2, "errors": 1, "rows": 2, "statements": 2}
+    assert sum(stats["get_all_products"]["histogram"].values()) == 2
+
+    QUERY_STATS.dump(tmp_path / "stats.json")
+    with open(tmp_path / "stats.json", encoding="utf-8") as f:
+        assert json.load(f) == stats
+
+def test_query_stats_count_repeats_but_not_trigger_steps(db: DatabaseManager):
+    db.insert_drug(Drug("", "Depon", 1.0, 2.0, 0, 5, Company(1, ""), Category(1, ""), True, []))
+    repeat = QUERY_STATS.instrument("repeat", lambda db: [db.c.execute("SELECT 1") for _ in range(3)])
+    QUERY_STATS.reset()
+
+    repeat(db)
+    # The batch and stock alert triggers run several steps, traced with the text of the insert
+    db.insert_drug_batch(DrugBatch("B1", 1, 10, "2030-01-01"))
+
+    stats = QUERY_STATS.snapshot()
+    assert stats["repeat"]["statements"] == 3
+    assert stats["insert_drug_batch"]["statements"] == 3  # BEGIN, INSERT and COMMIT
+
+def test_slow_query_log(db: DatabaseManager, caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(QUERY_STATS, "slow_query_threshold", 0)
+
+    with caplog.at_level(logging.WARNING, logger="database"):
+        db.get_client_by_id(5)
+
+    assert len(caplog.records) == 1
+    assert "get_client_by_id(5)" in caplog.text and "FROM Client WHERE" in caplog.text
+
+def test_unknown_profile(sqlite_db: SQLiteDB):
+    with pytest.raises(ValueError):
+        DatabaseManager(sqlite_db.path, "no-such-profile")
+
+def test_transaction_commits_once(sqlite_db: SQLiteDB, db: DatabaseManager, companies: list[Company]):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    with db.transaction():
+        for company in companies:
+            db.insert_company(company)
+    db.conn.set_trace_callback(QUERY_STATS.record_statement)
+
+    assert statements.count("COMMIT") == 1
+    sqlite_db.cur.execute("SELECT COUNT(*) FROM Company")
+    assert sqlite_db.cur.fetchone()[0] == len(companies)
+
+def test_transaction_rolls_back_on_error(sqlite_db: SQLiteDB, db: DatabaseManager, companies: list[Company]):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            for company in companies:
+                db.insert_company(company)
+            raise RuntimeError()
+
+    sqlite_db.cur.execute("SELECT COUNT(*) FROM Company")
+    assert sqlite_db.cur.fetchone()[0] == 0
+
+def test_products_many(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    db.insert_products_many(sample_products * 1000)
+
+    all_products = db.get_all_products()
+    assert len(all_products) == len(sample_products) * 1000
+
+    for product in all_products:
+        product.quantity += 1
+    db.update_products_many(all_products)
+
+    sqlite_db.cur.execute("SELECT SUM(Quantity) FROM Product")
+    assert sqlite_db.cur.fetchone()[0] == sum(p.quantity for p in all_products)
+
+def test_insert_drug_batches_many(sqlite_db: SQLiteDB, db: DatabaseManager):
+    db.insert_drug_batches_many(DrugBatch(f"B{i}", 1, i, "2030-01-01") for i in range(100))
+
+    assert len(db.get_batches_by_product_code(1)) == 100
+
+@pytest.mark.parametrize("value", ["2030-01-31", "2030-01-31 15:00:00", "31/01/2030", "31-01-2030", "31.01.2030", "2030/01/31",
+                                   datetime.date(2030, 1, 31), datetime.datetime(2030, 1, 31, 15)])
+def test_expiration_dates_are_stored_as_iso(sqlite_db: SQLiteDB, db: DatabaseManager, value):
+    db.insert_drug_batch(DrugBatch("B1", 1, 10, value))
+
+    assert db.get_batches_by_product_code(1)[0].expiration_date == "2030-01-31"
+    with pytest.raises(ValueError):
+        db.update_drug_batch(DrugBatch("B1", 1, 10, "soon"))
+
+def test_get_expiring_batches(sqlite_db: SQLiteDB, db: DatabaseManager):
+    db.insert_drug_batches_many([
+        DrugBatch("B1", 2, 10, "2030-03-01"),
+        DrugBatch("B2", 1, 10, "2030-02-01"),
+        DrugBatch("B3", 1, 0, "2030-01-01"),
+        DrugBatch("B4", 3, 10, "2029-12-31"),
+        DrugBatch("B5", 1, 10, "2030-03-01"),
+    ])
+
+    assert [b.batch_code for b in db.get_expiring_batches("2030-03-02")] == ["B4", "B2", "B5", "B1"]
+    assert [b.batch_code for b in db.get_expiring_batches(datetime.date(2030, 3, 1), limit=1)] == ["B4"]
+
+def test_expiring_batches_skip_empty_batches_in_index(sqlite_db: SQLiteDB, db: DatabaseManager):
+    db.insert_drug_batches_many(DrugBatch(f"E{i}", 1, 0, "2024-01-01") for i in range(100))
+    db.insert_drug_batches_many([DrugBatch("LIVE", 1, 10, "2030-01-01")])
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    assert [b.batch_code for b in db.get_expiring_batches("2031-01-01")] == ["LIVE"]
+    db.conn.set_trace_callback(QUERY_STATS.record_statement)
+    db.c.execute(f"EXPLAIN QUERY PLAN {statements[0]}")
+    assert any("IX_DrugBatch_ExpirationDate_InStock" in row[3] for row in db.c.fetchall())
+
+@pytest.fixture
+def drug_stock(db: DatabaseManager, companies: list[Company], sample_categories: list[Category]) -> tuple[int, int]:
+    company, category = companies[0], sample_categories[0]
+    db.insert_company(company)
+    db.insert_category(category)
+    drug = db.insert_drug(Drug("", "Depon", 1.0, 2.0, 0, 5, Company(1, company.name), Category(1, category.name), True, []))
+    product = db.insert_product(Product("", "Γάζες", 1.0, 2.0, 20, 5, Company(1, company.name), Category(1, category.name)))
+    db.insert_drug_batches_many([
+        DrugBatch("LATE", drug, 20, "2031-01-01"),
+        DrugBatch("EXPIRED", drug, 10, "2024-01-01"),
+        DrugBatch("SOON", drug, 10, "2030-01-01"),
+        DrugBatch("EMPTY", drug, 0, "2029-01-01"),
+        DrugBatch("MIDDLE", drug, 20, "2030-06-01"),
+    ])
+    return drug, product
+
+def test_batch_triggers_keep_drug_stock(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+    assert db.get_product_by_code(drug).quantity == 60
+    assert db.get_batch_quantity(drug) == 60
+    assert db.get_batch_quantity(product) is None
+
+    db.update_drug_batch(DrugBatch("SOON", drug, 4, "2030-01-01"))
+    db.update_drug_batch(DrugBatch("LATE", product, 20, "2031-01-01"))
+    sqlite_db.cur.execute("DELETE FROM DrugBatch WHERE BatchCode = 'EXPIRED'")
+    sqlite_db.con.commit()
+    assert db.get_product_by_code(drug).quantity == 24
+    assert db.get_product_by_code(product).quantity == 20
+    assert db.audit_batch_quantities() == []
+
+    db.adjust_quantity(drug, 5)
+    assert db.audit_batch_quantities() == [(drug, 29, 24)]
+
+def test_insert_drug_stores_its_batches(db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug = db.insert_drug(Drug("", "Panadol", 1.0, 2.0, 12, 5, Company(1, ""), Category(1, ""), True,
+                               [DrugBatch("P1", None, 12, "2030-01-01")]))
+    assert db.get_product_by_code(drug).quantity == 12
+    assert db.get_batch_quantity(drug) == 12
+    assert [b.batch_code for b in db.get_batches_by_product_code(drug)] == ["P1"]
+
+    with pytest.raises(ValueError):
+        db.insert_drug(Drug("", "Algofren", 1.0, 2.0, 12, 5, Company(1, ""), Category(1, ""), True, []))
+
+    product = db.get_product_by_code(drug)
+    product.quantity = 100
+    product.quantity_limit = 8
+    db.update_product(product)
+    assert (db.get_product_by_code(drug).quantity, db.get_product_by_code(drug).quantity_limit) == (12, 8)
+    assert db.audit_batch_quantities() == []
+
+def test_rebuild_batch_quantities(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+    sqlite_db.cur.execute("DROP TRIGGER TR_DrugBatch_Insert_Quantity")
+    sqlite_db.cur.execute("INSERT INTO DrugBatch VALUES ('UNTRACKED', ?, 7, '2030-01-01')", (drug,))
+    sqlite_db.con.commit()
+    assert db.get_batch_quantity(drug) == 60
+
+    assert db.rebuild_batch_quantities() == 1
+    assert db.get_batch_quantity(drug) == 67
+    assert db.audit_batch_quantities() == [(drug, 60, 67)]
+    assert db.rebuild_batch_quantities() == 0
+
+def test_batch_quantities_migration(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+    sqlite_db.cur.execute("DROP INDEX IX_Product_BatchQuantity_Mismatch")
+    sqlite_db.cur.execute("UPDATE Product SET BatchQuantity = NULL, Quantity = 50")
+    sqlite_db.cur.execute(f"PRAGMA user_version = {database.MIGRATIONS.index(database._migration_cache_batch_quantities)}")
+    sqlite_db.con.commit()
+
+    db.create_tables()
+
+    assert db.get_batch_quantity(drug) == 60
+    assert db.get_batch_quantity(product) is None
+    assert db.audit_batch_quantities() == [(drug, 50, 60)]
+
+def batch_quantities(sqlite_db: SQLiteDB) -> dict[str, int]:
+    sqlite_db.cur.execute("SELECT BatchCode, Quantity FROM DrugBatch")
+    return dict(sqlite_db.cur.fetchall())
+
+def test_allocate_batches_first_expire_first_out(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+
+    picks = db.allocate_batches(drug, 25, on="2025-01-01")
+
+    assert [(pick.batch_code, pick.quantity) for pick in picks] == [("SOON", 10), ("MIDDLE", 15)]
+    assert batch_quantities(sqlite_db) == {"LATE": 20, "EXPIRED": 10, "SOON": 0, "EMPTY": 0, "MIDDLE": 5}
+    assert db.get_product_by_code(drug).quantity == 35
+    assert db.allocate_batches(product, 5) == []
+    assert db.get_product_by_code(product).quantity == 15
+
+def test_allocate_batches_is_all_or_nothing(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+
+    with pytest.raises(InsufficientStockError) as error:
+        db.allocate_batches(drug, 51, on="2025-01-01")
+    assert (error.value.requested, error.value.available) == (51, 50)
+    with pytest.raises(InsufficientStockError):
+        db.allocate_orders([Orders(1, 5, Product(drug, "", 0, 0, 0, 0, None, None), None, None),
+                            Orders(2, 21, Product(product, "", 0, 0, 0, 0, None, None), None, None)], on="2025-01-01")
+
+    assert batch_quantities(sqlite_db) == {"LATE": 20, "EXPIRED": 10, "SOON": 10, "EMPTY": 0, "MIDDLE": 20}
+    assert db.get_product_by_code(drug).quantity == 60
+    assert db.get_product_by_code(product).quantity == 20
+
+def test_allocate_batches_needs_an_immediate_transaction(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        with db.transaction():
+            db.allocate_batches(drug, 5, on="2025-01-01")
+    assert batch_quantities(sqlite_db)["SOON"] == 10
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    with db.transaction(immediate=True):
+        db.allocate_batches(drug, 5, on="2025-01-01")
+        db.allocate_batches(product, 5)
+    db.conn.set_trace_callback(QUERY_STATS.record_statement)
+    assert statements[0] == "BEGIN IMMEDIATE" and statements.count("COMMIT") == 1
+    assert batch_quantities(sqlite_db)["SOON"] == 5
+
+def test_allocate_orders_wave(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+    orders = [
+        Orders(1, 6, Product(drug, "", 0, 0, 0, 0, None, None), None, None),
+        Orders(2, 2, Product(product, "", 0, 0, 0, 0, None, None), None, None),
+        Orders(3, 30, Product(drug, "", 0, 0, 0, 0, None, None), None, None),
+    ]
+
+    allocations = db.allocate_orders(orders, on=datetime.date(2025, 1, 1))
+
+    assert {code: [(pick.batch_code, pick.quantity) for pick in picks] for code, picks in allocations.items()} == {
+        1: [("SOON", 6)],
+        2: [],
+        3: [("SOON", 4), ("MIDDLE", 20), ("LATE", 6)],
+    }
+    assert batch_quantities(sqlite_db) == {"LATE": 14, "EXPIRED": 10, "SOON": 0, "EMPTY": 0, "MIDDLE": 0}
+    assert db.get_product_by_code(drug).quantity == 24
+    assert db.get_product_by_code(product).quantity == 18
+
+def test_drug_batches_load_on_first_access(sqlite_db: SQLiteDB, db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+    products = {p.product_code_int: p for p in db.get_all_products()}
+    assert isinstance(products[drug], Drug) and products[drug].quality is True
+    assert not isinstance(products[product], Drug)
+    assert not products[drug].batches_loaded
+
+    batches = products[drug].batches
+
+    assert [b.batch_code for b in batches] == ["EXPIRED", "EMPTY", "SOON", "MIDDLE", "LATE"]
+    assert products[drug].batches is batches
+
+def test_prefetch_batches_uses_one_query(db: DatabaseManager, drug_stock: tuple[int, int]):
+    drug, product = drug_stock
+    other = db.insert_drug(Drug("", "Panadol", 1.0, 2.0, 0, 5, Company(1, ""), Category(1, ""), False, []))
+    products = db.get_products_by_codes([drug, product, other])
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    db.prefetch_batches(products)
+    db.prefetch_batches(products)
+    db.conn.set_trace_callback(QUERY_STATS.record_statement)
+
+    assert len(statements) == 1 and f"IN ({drug}, {other})" in statements[0]
+    assert len(products[0].batches) == 5
+    assert products[2].batches == []
+
+def test_expiration_dates_migration(sqlite_db: SQLiteDB, db: DatabaseManager):
+    sqlite_db.cur.execute("DROP INDEX IX_DrugBatch_ExpirationDate_InStock")
+    sqlite_db.cur.executemany("INSERT INTO DrugBatch VALUES (?, 1, 10, ?)", [("B1", "01/02/2030"), ("B2", "2029-12-31"), ("B3", "unknown")])
+    sqlite_db.cur.execute(f"PRAGMA user_version = {database.MIGRATIONS.index(database._migration_normalize_expiration_dates)}")
+    sqlite_db.con.commit()
+
+    db.create_tables()
+
+    sqlite_db.cur.execute("SELECT BatchCode, ExpirationDate FROM DrugBatch ORDER BY BatchCode")
+    assert sqlite_db.cur.fetchall() == [("B1", "2030-02-01"), ("B2", "2029-12-31"), ("B3", "unknown")]
+    assert [b.batch_code for b in db.get_expiring_batches("2030-06-01")] == ["B2", "B1"]
+
+def test_search_products(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+    category = sample_products[0].category
+
+    products, total = db.search_products("ΠΡΟΪΌΝ", category_code=category.category_code_int)
+
+    expected = [p for p in sample_products if p.category.category_code_int == category.category_code_int]
+    assert total == len(expected)
+    assert [p.product_code for p in products] == [p.product_code for p in expected]
+
+    products, total = db.search_products("προϊόν 1", company_code=sample_products[0].company.company_code_int)
+    assert [p.name for p in products] == ["Προϊόν 1"]
+    assert total == 1
+
+def test_search_products_pages(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+
+    products, total = db.search_products(order_by="quantity", limit=4, offset=4)
+
+    assert total == len(sample_products)
+    by_quantity = sorted(sample_products, key=lambda p: p.quantity)
+    assert [p.product_code for p in products] == [p.product_code for p in by_quantity[4:8]]
+
+    with pytest.raises(ValueError):
+        db.search_products(order_by="Name; DROP TABLE Product")
+
+def test_get_products_page(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    for product, quantity in zip(sample_products, [5, 3, 5, 1, 3, 5, 2, 1, 4]):
+        product.quantity = quantity
+    insert_products(sqlite_db, sample_products)
+    expected = [p.product_code for p in sorted(sample_products, key=lambda p: (p.quantity, p.product_code))]
+
+    pages, cursor = [], None
+    while True:
+        products, cursor = db.get_products_page(cursor, order_by="quantity", limit=4)
+        pages.append([p.product_code for p in products])
+        if cursor is None:
+            break
+
+    assert pages == [expected[0:4], expected[4:8], expected[8:]]
+    assert [p.product_code for p in db.iter_products(order_by="name", page_size=2)] == [p.product_code for p in sample_products]
+    with pytest.raises(ValueError):
+        db.get_products_page(order_by="PurchaseCost")
+
+def test_inventory_snapshot(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    numpy = pytest.importorskip("numpy")
+    sample_products[0].category = Category("", "")
+    insert_products(sqlite_db, sample_products)
+
+    snapshot = db.inventory_snapshot(chunk_size=4)
+
+    assert snapshot["product_code"].tolist() == [p.product_code_int for p in sample_products]
+    assert snapshot["quantity"].tolist() == [p.quantity for p in sample_products]
+    assert snapshot["purchase_cost"].tolist() == [p.purchase_cost for p in sample_products]
+    assert snapshot["company_code"].tolist() == [p.company.company_code_int for p in sample_products]
+    assert snapshot["category_code"][0] == 0
+    assert db.inventory_snapshot().dtype == snapshot.dtype
+    assert len(DatabaseManager(sqlite_db.path).inventory_snapshot()) == len(sample_products)
+    assert not db.conn.in_transaction
+
+def test_get_clients_page(db: DatabaseManager):
+    names = ["Γιώργος", "Άννα", "Βασίλης", "Άννα", "Δήμητρα"]
+    for name in names:
+        db.insert_client(Client(0, name, "Οδός", 2100000000))
+
+    clients, cursor = db.get_clients_page(order_by="name", limit=2)
+    assert [(c.client_id, c.fullname) for c in clients] == [(2, "Άννα"), (4, "Άννα")]
+    assert cursor == ("Άννα", 4)
+    assert [c.client_id for c in db.iter_clients(order_by="name", page_size=2)] == [2, 4, 3, 1, 5]
+    assert [c.client_id for c in db.iter_clients(page_size=5)] == [1, 2, 3, 4, 5]
+
+def test_add_and_remove_personal_clients(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[User]):
+    insert_users(sqlite_db, users)
+    client_ids = [db.insert_client(Client(None, f"Πελάτης {i}", "Οδός", 2100000000)) for i in range(5)]
+    db.add_personal_client(1, client_ids[0])
+
+    assert db.add_personal_clients(1, client_ids) == 4
+    assert db.add_personal_clients(1, client_ids[:2]) == 0
+    assert db.add_personal_clients(2, client_ids[:2]) == 2
+    assert db.remove_personal_clients(1, client_ids[3:] + [999]) == 2
+
+    assert [c.client_id for c in db.get_all_personal_clients(1)] == client_ids[:3]
+    assert [c.client_id for c in db.get_all_personal_clients(2)] == client_ids[:2]
+
+def test_iter_users(sqlite_db: SQLiteDB, db: DatabaseManager, users: list[User]):
+    insert_users(sqlite_db, users)
+
+    assert [u.username for u in db.iter_users(page_size=2)] == ["jdoe", "bwayne", "pparker"]
+    assert [u.username for u in db.iter_users(order_by="username", page_size=1)] == ["bwayne", "jdoe", "pparker"]
+    assert db.get_users_page(order_by="username", limit=3)[1] == ("pparker", 3)
+
+def test_search_products_ignores_accents(sqlite_db: SQLiteDB, db: DatabaseManager, companies: list[Company], sample_categories: list[Category]):
+    insert_companies(sqlite_db, companies)
+    insert_categories(sqlite_db, sample_categories)
+    names = ["Ασπιρίνη", "ΑΣΠΙΡΊΝΗ", "Σιρόπι για τον βήχα", "Aspirin Café"]
+    db.insert_products_many(Product("", name, 1.0, 2.0, 1, 1, companies[0], sample_categories[0]) for name in names)
+
+    assert [p.name for p in db.search_products("ασπιρινη")[0]] == names[:2]
+    assert [p.name for p in db.search_products("Ασπιρ")[0]] == names[:2]
+    assert [p.name for p in db.search_products("βηχας")[0]] == []
+    assert [p.name for p in db.search_products("ΒΗΧΑ σιροπ")[0]] == names[2:3]
+    assert [p.name for p in db.search_products("cafe")[0]] == names[3:]
+
+def test_search_index_follows_renames(sqlite_db: SQLiteDB, db: DatabaseManager, sample_products: list[Product]):
+    insert_products(sqlite_db, sample_products)
+    company = sample_products[0].company
+
+    company.name = "Φαρμακευτική"
+    db.update_company(company)
+    product = sample_products[1]
+    product.name = "Παυσίπονο"
+    db.update_product(product)
 
+    expected = [p.product_code for p in sample_products if p.company.company_code_int == company.company_code_int]
+    assert [p.product_code for p in db.search_products("φαρμακευτικη")[0]] == expected
+    assert [p.product_code for p in db.search_products("παυσιπονο")[0]] == [product.product_code]
+    assert product.product_code not in [p.product_code for p in db.search_products("προϊόν")[0]]
 
@@ -0,0 +1,83 @@
+import pytest
+import threading
+from database import Company, DatabaseManager
+from database_executor import DatabaseExecutor
+
+@pytest.fixture
+def executor(tmp_path):
+    executor = DatabaseExecutor.for_path(tmp_path / "database.db")
+    yield executor
+    executor.shutdown()
+
+def block_worker(executor: DatabaseExecutor) -> threading.Event:
+    """
+    Keeps the worker thread busy until the returned event is set.
+
+    Args:
+        executor (DatabaseExecutor): The executor whose worker is blocked.
+
+    Returns:
+        threading.Event: The event that releases the worker.
+    """
+    started, release = threading.Event(), threading.Event()
+    executor.submit(lambda db: (started.set(), release.wait()))
+    started.wait()
+    return release
+
+def test_submit_runs_on_worker_thread(executor: DatabaseExecutor):
+    db = DatabaseManager(executor.database_path)
+    db.insert_company(Company("", "Εταιρεία"))
+    db.close()
+
+    assert [c.name for c in executor.submit("get_all_companies").result()] == ["Εταιρεία"]
+    assert executor.submit(lambda db: threading.get_ident()).result() != threading.get_ident()
+    assert DatabaseExecutor.for_path(executor.database_path) is executor
+    with pytest.raises(ValueError):
+        executor.submit("search_products", order_by="Price").result()
+
+def test_submit_latest_cancels_superseded_calls(executor: DatabaseExecutor):
+    release = block_worker(executor)
+    first = executor.submit_latest("search", "search_products", "α")
+    other = executor.submit_latest("clients", "get_all_clients")
+    last = executor.submit_latest("search", "search_products", "αλ")
+    release.set()
+
+    assert first.cancelled()
+    assert last.result() == ([], 0)
+    assert other.result() == []
+    assert executor.is_latest("search", last) and not executor.is_latest("search", first)
+
+def test_submit_latest_drops_running_calls(executor: DatabaseExecutor):
+    started, release = threading.Event(), threading.Event()
+    running = executor.submit_latest("search", lambda db: (started.set(), release.wait()))
+    started.wait()
+    executor.submit_latest("search", "get_all_products")
+    release.set()
+
+    assert running.result() == (None, True)
+    assert not executor.is_latest("search", running)
+
+def test_forget_and_shutdown_cancel_pending_calls(executor: DatabaseExecutor):
+    release = block_worker(executor)
+    forgotten = executor.submit_latest("search", "get_all_products")
+    pending = executor.submit_latest("clients", "get_all_clients")
+    executor.forget("search")
+    assert forgotten.cancelled()
+
+    executor.shutdown(wait=False)
+    assert pending.cancelled()
+    release.set()
+    executor.shutdown()
+    assert DatabaseExecutor.for_path(executor.database_path) is not executor
+    DatabaseExecutor.for_path(executor.database_path).shutdown()
+    with pytest.raises(RuntimeError):
+        executor.submit("get_all_products")
+
+def test_shutdown_all_closes_the_worker_connection(executor: DatabaseExecutor):
+    pool = executor.submit(lambda db: db.pool).result()
+    assert pool.open_connections == 1
+
+    DatabaseExecutor.shutdown_all()
+    assert pool.open_connections == 0
+    with pytest.raises(RuntimeError):
+        executor.submit("get_all_products")
@@ -0,0 +1,138 @@
+import inspect
+import pytest
+import re
+from database import QUERY_STATS, Category, Client, Company, DatabaseManager, Drug, DrugBatch, Orders, Product, User, UserPermissions
+
+# Number of rows in each of the large tables of the fixture
+ROW_COUNT = 100_000
+
+# Methods that do not query the database
+NON_QUERY_METHODS = {"cache_stats", "close", "create_tables", "transaction"}
+
+# Maintenance methods that read whole tables on purpose
+FULL_SCAN_METHODS = {"rebuild_batch_quantities"}
+
+def sample_product(code: int = 1) -> Product:
+    return Product(code, "Ασπιρίνη", 1.0, 2.0, 10, 5, Company(1, "Εταιρεία"), Category(1, "Κατηγορία"))
+
+# Full-text index lookups, which the query plan shows as a virtual table scan with a MATCH constraint
+FULL_TEXT_MATCH = re.compile(r"VIRTUAL TABLE INDEX \d+:M")
+
+# One call for every public DatabaseManager method that queries the database
+DATABASE_CALLS = {
+    "allocate_code": lambda db: db.allocate_code("Product"),
+    "allocate_codes": lambda db: db.allocate_codes("Client", 10),
+    "get_all_users": lambda db: db.get_all_users(),
+    "get_user_by_username": lambda db: db.get_user_by_username("user500"),
+    "get_users_page": lambda db: db.get_users_page(("user500", 500), order_by="username", limit=50),
+    "iter_users": lambda db: next(db.iter_users(order_by="username", page_size=50)),
+    "update_user": lambda db: db.update_user(User(500, "user500", "pass", "User 500", UserPermissions())),
+    "insert_user": lambda db: db.insert_user(User(0, "new_user", "pass", "New User", UserPermissions())),
+    "get_user_permissions": lambda db: db.get_user_permissions(500),
+    "set_user_permission": lambda db: db.set_user_permission(500, "view_bills", False),
+    "get_all_companies": lambda db: db.get_all_companies(),
+    "update_company": lambda db: db.update_company(Company(5, "Εταιρεία 5")),
+    "insert_company": lambda db: db.insert_company(Company("", "Νέα εταιρεία")),
+    "get_all_categories": lambda db: db.get_all_categories(),
+    "update_category": lambda db: db.update_category(Category(5, "Κατηγορία 5")),
+    "insert_category": lambda db: db.insert_category(Category("", "Νέα κατηγορία")),
+    "get_all_products": lambda db: db.get_all_products(),
+    "get_product_by_code": lambda db: db.get_product_by_code(500),
+    "get_active_alerts": lambda db: db.get_active_alerts(),
+    "count_active_alerts": lambda db: db.count_active_alerts(),
+    "get_products_by_codes": lambda db: db.get_products_by_codes([500, 1500, 2500]),
+    "search_products": lambda db: db.search_products("προϊόν 5", category_code=5, order_by="name", limit=50, offset=50),
+    "get_products_page": lambda db: db.get_products_page(("Προϊόν 500", 500), order_by="name", limit=50),
+    "iter_products": lambda db: next(db.iter_products(order_by="quantity", page_size=50)),
+    "inventory_snapshot": lambda db: db.inventory_snapshot(),
+    "update_product": lambda db: db.update_product(sample_product(500)),
+    "adjust_quantity": lambda db: db.adjust_quantity(500, 5),
+    "adjust_quantities": lambda db: db.adjust_quantities({500: 5, 501: -5}),
+    "insert_product": lambda db: db.insert_product(sample_product("")),
+    "insert_products_many": lambda db: db.insert_products_many([sample_product(""), sample_product("")]),
+    "update_products_many": lambda db: db.update_products_many([sample_product(500), sample_product(501)]),
+    "insert_drug": lambda db: db.insert_drug(Drug(ROW_COUNT + 10, "Depon", 1.0, 2.0, 10, 5, Company(1, ""), Category(1, ""), True,
+                                                [DrugBatch("NEW_DRUG", None, 10, "2031-01-01")])),
+    "insert_drug_batch": lambda db: db.insert_drug_batch(DrugBatch("NEW", 500, 10, "2030-01-01")),
+    "insert_drug_batches_many": lambda db: db.insert_drug_batches_many([DrugBatch("NEW1", 500, 10, "2030-01-01"), DrugBatch("NEW2", 501, 10, "2030-01-01")]),
+    "update_drug_batch": lambda db: db.update_drug_batch(DrugBatch("B500", 500, 20, "2030-01-01")),
+    "get_expiring_batches": lambda db: db.get_expiring_batches("2030-06-01"),
+    "get_batch_quantity": lambda db: db.get_batch_quantity(501),
+    "audit_batch_quantities": lambda db: db.audit_batch_quantities(),
+    "allocate_batches": lambda db: db.allocate_batches(501, 1, on="2029-01-01"),
+    "allocate_orders": lambda db: db.allocate_orders([Orders(1, 1, sample_product(503), None, None), Orders(2, 1, sample_product(502), None, None)], on="2029-01-01"),
+    "get_batches_by_product_code": lambda db: db.get_batches_by_product_code(500),
+    "get_batches_by_product_codes": lambda db: db.get_batches_by_product_codes([501, 1501, 2501]),
+    "prefetch_batches": lambda db: db.prefetch_batches(db.get_products_by_codes([501, 1501, 2501])),
+    "get_company_by_code": lambda db: db.get_company_by_code(5),
+    "get_category_by_code": lambda db: db.get_category_by_code(5),
+    "get_all_clients": lambda db: db.get_all_clients(),
+    "get_client_by_id": lambda db: db.get_client_by_id(500),
+    "get_clients_page": lambda db: db.get_clients_page(("Πελάτης 500", 500), order_by="name", limit=50),
+    "iter_clients": lambda db: next(db.iter_clients(page_size=50)),
+    "insert_client": lambda db: db.insert_client(Client(0, "Νέος πελάτης", "Οδός", 2100000000)),
+    "update_client": lambda db: db.update_client(Client(500, "Πελάτης 500", "Οδός", 2100000000)),
+    "get_all_personal_clients": lambda db: db.get_all_personal_clients(500),
+    "add_personal_client": lambda db: db.add_personal_client(2, ROW_COUNT),
+    "add_personal_clients": lambda db: db.add_personal_clients(3, [ROW_COUNT, ROW_COUNT - 1]),
+    "remove_personal_clients": lambda db: db.remove_personal_clients(3, [ROW_COUNT, ROW_COUNT - 1]),
+}
+
+@pytest.fixture(scope="module")
+def large_db(tmp_path_factory):
+    db = DatabaseManager(tmp_path_factory.mktemp("plans") / "database.sqlite")
+    rows = range(1, ROW_COUNT + 1)
+    db.c.executemany("INSERT INTO Company(CompanyCode, Name) VALUES (?, ?)", ((i, f"Εταιρεία {i}") for i in range(1, 101)))
+    db.c.executemany("INSERT INTO Category(CategoryCode, Name) VALUES (?, ?)", ((i, f"Κατηγορία {i}") for i in range(1, 101)))
+    db.c.executemany("INSERT INTO User(Id, Username, Password, Fullname) VALUES (?, ?, ?, ?)", ((i, f"user{i}", "pass", f"User {i}") for i in rows))
+    db.c.executemany("INSERT INTO UserPermissions VALUES (?, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1)", ((i,) for i in rows))
+    db.c.executemany("INSERT INTO Product(ProductCode, Name, PurchaseCost, SellingPrice, Quantity, QuantityLimit, CompanyCode, CategoryCode) VALUES (?, ?, 1.0, 2.0, 10, 5, ?, ?)", ((i, f"Προϊόν {i}", i % 100 + 1, i % 100 + 1) for i in rows))
+    db.c.executemany("INSERT INTO Drug VALUES (?, 1)", ((i,) for i in rows if i % 2))
+    db.c.executemany("INSERT INTO DrugBatch VALUES (?, ?, 10, '2030-01-01')", ((f"B{i}", i) for i in rows))
+    db.c.executemany("INSERT INTO Client VALUES (?, ?, 'Οδός', 2100000000)", ((i, f"Πελάτης {i}") for i in rows))
+    db.c.executemany("INSERT INTO PersonalClient VALUES (?, ?)", ((i % 1000 + 1, i) for i in rows))
+    db.c.executemany("INSERT INTO Bill(BillCode, ClientId) VALUES (?, ?)", ((i, i) for i in rows))
+    db.c.executemany("INSERT INTO Orders VALUES (?, 1, ?, ?, ?)", ((i, i, i, i) for i in rows))
+    db.conn.commit()
+    db.c.execute("ANALYZE")
+    yield db
+    db.close()
+
+def table_scans(db: DatabaseManager, statement: str) -> list[str]:
+    """
+    Returns the full table scans in the query plan of a statement.
+
+    Args:
+        db (DatabaseManager): The database to plan the statement on.
+        statement (str): The SQL statement, with its parameters already bound.
+
+    Returns:
+        list[str]: The query plan steps that scan a whole table.
+    """
+    # A scan of a partial index only reads the rows matching the index, not the whole table
+    db.c.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")
+    partial_indexes = {row[0] for row in db.c.fetchall()}
+    db.c.execute(f"EXPLAIN QUERY PLAN {statement}")
+    return [row[3] for row in db.c.fetchall()
+            if row[3].startswith("SCAN ") and row[3] != "SCAN CONSTANT ROW" and not FULL_TEXT_MATCH.search(row[3])
+            and row[3].rsplit(" ", 1)[-1] not in partial_indexes]
+
+def test_every_query_method_is_planned():
+    methods = {name for name, _ in inspect.getmembers(DatabaseManager, inspect.isfunction) if not name.startswith("_")}
+    assert methods - NON_QUERY_METHODS - FULL_SCAN_METHODS == set(DATABASE_CALLS)
+
+@pytest.mark.parametrize("method", sorted(DATABASE_CALLS))
+def test_query_does_not_scan_tables(large_db: DatabaseManager, method: str):
+    statements = []
+    large_db.conn.set_trace_callback(statements.append)
+    try:
+        DATABASE_CALLS[method](large_db)
+    finally:
+        large_db.conn.set_trace_callback(QUERY_STATS.record_statement)
+
+    for statement in statements:
+        keyword = statement.lstrip().split(None, 1)[0].upper()
+        # Statements without a WHERE clause read the whole table on purpose
+        if keyword not in ("SELECT", "UPDATE", "DELETE", "WITH") or "WHERE" not in statement.upper():
+            continue
+        assert table_scans(large_db, statement) == [], f"{method} scans a table: {statement.strip()}"
@@ -0,0 +1,40 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from database import INVENTORY_FIELDS
+import stock_analytics
+
+@pytest.fixture
+def snapshot():
+    dtype = numpy.dtype([(name, numpy_type) for name, numpy_type, _ in INVENTORY_FIELDS])
+    # product_code, quantity, quantity_limit, purchase_cost, selling_price, company_code, category_code
+    return numpy.array([
+        (1, 10, 5, 1.0, 2.0, 1, 1),
+        (2, 3, 5, 2.0, 2.5, 1, 2),
+        (3, 0, 1, 4.0, 0.0, 2, 0),
+    ], dtype)
+
+def test_stock_value(snapshot):
+    assert stock_analytics.stock_value(snapshot) == 16.0
+    assert stock_analytics.stock_value(snapshot, "selling_price") == 27.5
+    with pytest.raises(ValueError):
+        stock_analytics.stock_value(snapshot, "quantity")
+
+def test_stock_value_by(snapshot):
+    assert stock_analytics.stock_value_by(snapshot, "category_code").tolist() == [0.0, 10.0, 6.0]
+    assert stock_analytics.stock_value_by(snapshot, "company_code", "selling_price").tolist() == [0.0, 27.5, 0.0]
+    with pytest.raises(ValueError):
+        stock_analytics.stock_value_by(snapshot, "product_code")
+    with pytest.raises(ValueError):
+        stock_analytics.stock_value_by(snapshot, "category_code", "quantity")
+
+def test_margins(snapshot):
+    assert stock_analytics.margins(snapshot).tolist() == [1.0, 0.5, -4.0]
+    ratios = stock_analytics.margin_ratios(snapshot)
+    assert ratios[:2].tolist() == [0.5, 0.2]
+    assert numpy.isnan(ratios[2])
+
+def test_under_limit(snapshot):
+    assert stock_analytics.under_limit(snapshot).tolist() == [False, True, True]
+    assert stock_analytics.reorder_quantities(snapshot).tolist() == [0, 2, 1]
@@ -9,6 +9,8 @@ class UserInformationDialog(QDialog):
     def __init__(self, user_id, username, parent=None):
         super().__init__(parent)
         self.db = DatabaseManager()
+        # finished is emitted however the dialog ends, including Esc, which does not send a close event
+        self.finished.connect(self.db.close)
         self.username = username
 
         self.setWindowTitle("Επεξεργασία χρήστη")
@@ -51,7 +53,7 @@ class UserInformationDialog(QDialog):
         layout.addLayout(namelayout)
 
         #---User Permissions
-        self.permissions_layout = PermissionsLayout(self.username)
+        self.permissions_layout = PermissionsLayout(self.username, self.db)
         self.permission_checkboxes = self.permissions_layout.permission_checkboxes
 
         layout.addLayout(self.permissions_layout)
@@ -96,4 +98,4 @@ class UserInformationDialog(QDialog):
 
         QMessageBox.information(self, "Επιτυχία", "Τα στοιχεία χρήστη ενημερώθηκαν με επιτυχία.")
         self.user_updated.emit()  # Emit the signal to notify that the user info has been updated
-        self.close()
\ No newline at end of file
+        self.close()
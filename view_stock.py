@@ -6,6 +6,7 @@ from PySide6.QtWidgets import (QApplication, QComboBox, QHBoxLayout, QHeaderView
     QSizePolicy, QSpacerItem, QTableWidget, QTableWidgetItem,
     QVBoxLayout, QWidget, QPushButton, QFormLayout)
 import database
+from qt_database import DatabaseRelay, ProductSearchPager
 
 class Ui_MainWindow(object):
     '''
@@ -87,7 +88,7 @@ class Ui_MainWindow(object):
         self.CategoryBox.setFont(font)
         self.CategoryBox.addItem("Όλες")
         for category in categories:
-            self.CategoryBox.addItem(category.name)
+            self.CategoryBox.addItem(category.name, category.category_code_int)
         
         self.verticalLayout_3.addWidget(self.CategoryBox)
 
@@ -111,7 +112,7 @@ class Ui_MainWindow(object):
         self.CompanyBox.setFont(font)
         self.CompanyBox.addItem("Όλες")
         for company in companies:
-            self.CompanyBox.addItem(company.name)
+            self.CompanyBox.addItem(company.name, company.company_code_int)
 
         self.verticalLayout_4.addWidget(self.CompanyBox)
 
@@ -145,7 +146,7 @@ class Ui_MainWindow(object):
         self.retranslateUi(MainWindow)
 
         QMetaObject.connectSlotsByName(MainWindow)
-        self.db_manager = database.DatabaseManager()
+        self.products = []
 
     def retranslateUi(self, MainWindow):
         '''
@@ -172,21 +173,25 @@ class Ui_MainWindow(object):
         Returns:
             None
         '''
-        self.update_table(self.db_manager.get_all_products())
+        with database.DatabaseManager() as db_manager:
+            products = db_manager.get_all_products()
+        self.update_table(products)
 
-    def update_table(self, data):
+    def update_table(self, data, start=0):
         '''
         This method updates the table with the given data.
 
         Args:
             data: A list of Product objects.
+            start: The row of the first product. The rows after the given products are removed.
 
         Returns:
             None
         '''
-        self.tableWidget.setRowCount(len(data))
+        self.products[start:] = data
+        self.tableWidget.setRowCount(start + len(data))
         data_coloumns = 5
-        for row_num, product in enumerate(data):
+        for row_num, product in enumerate(data, start):
             self.tableWidget.setItem(row_num, 0, QTableWidgetItem(product.product_code))
             self.tableWidget.setItem(row_num, 1, QTableWidgetItem(product.name))
             self.tableWidget.setItem(row_num, 2, QTableWidgetItem(str(product.category.name)))
@@ -214,6 +219,24 @@ class Ui_MainWindow(object):
         self.tableWidget.setColumnWidth(6, 30)
         self.tableWidget.setColumnWidth(7, 30)
 
+    def visible_products(self):
+        '''
+        This method returns the products of the rows currently shown in the table.
+
+        Args:
+            None
+
+        Returns:
+            list: The Product objects of the visible rows, from top to bottom.
+        '''
+        first = self.tableWidget.rowAt(0)
+        if first < 0:
+            return []
+        last = self.tableWidget.rowAt(self.tableWidget.viewport().height() - 1)
+        if last < 0:
+            last = self.tableWidget.rowCount() - 1
+        return self.products[first:last + 1]
+
     def edit_item_lambda(self, product):
         '''
         This method returns a lambda function that opens the edit window for the given product.
@@ -238,7 +261,6 @@ class BatchWindow(QWidget):
     Attributes:
         product: The product object.
         callback: A function to call after the window is closed.
-        db_manager: The database manager.
         data: The data of the product.
 
     Methods:
@@ -251,7 +273,6 @@ class BatchWindow(QWidget):
         super().__init__(parent)
         self.callback = callback
         self.product = product
-        self.db_manager = database.DatabaseManager()
         self.setWindowTitle("Πληροφορίες")
         self.layout = QFormLayout()
         self.setLayout(self.layout)
@@ -290,8 +311,12 @@ class BatchWindow(QWidget):
         self.batch_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
         self.batch_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
         self.batch_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
+        # Batches cannot be edited yet, so the column of their edit buttons is hidden
+        self.batch_table.setColumnHidden(3, True)
+        self.update_batch_table()
 
         self.edit_button = QPushButton("Επεξεργασία")
+        self.edit_button.setDisabled(True)
         # self.edit_button.clicked.connect(self.edit_changes)
         self.cancel_button = QPushButton("Ακύρωση")
         self.cancel_button.clicked.connect(self._close)
@@ -301,22 +326,13 @@ class BatchWindow(QWidget):
         self.layout.addRow(button_layout)
 
     def update_batch_table(self):
-        self.dbm = database.DatabaseManager()
-        batches = self.dbm.get_batches_by_product_code(self.product.product_code_int)
+        # The batches of the visible rows are usually prefetched by the stock window, otherwise the drug loads its own on first access
+        batches = self.product.batches if isinstance(self.product, database.Drug) else []
         self.batch_table.setRowCount(len(batches))
         for row_num, batch in enumerate(batches):
             self.batch_table.setItem(row_num, 0, QTableWidgetItem(batch.batch_code))
             self.batch_table.setItem(row_num, 1, QTableWidgetItem(str(batch.expiration_date)))
             self.batch_table.setItem(row_num, 2, QTableWidgetItem(str(batch.quantity)))
-            edit_button = QPushButton("")
-            icon = QIcon()
-            icon.addFile(u"assets/edit.svg", QSize(), QIcon.Normal, QIcon.Off)
-            edit_button.setIcon(icon)
-            edit_button.setIconSize(QSize(16, 16))
-            edit_button.clicked.connect(self.edit_batch_lambda(batch))
-            self.batch_table.setCellWidget(row_num, 3, edit_button)
-        self.batch_table.setColumnWidth(3, 30)
-        self.dbm.close()
 
     def edit_batch_lambda(self, batch):
         pass
@@ -328,7 +344,6 @@ class BatchWindow(QWidget):
     def _close(self):
         if self.callback:
             self.callback()
-        self.db_manager.close()
         self.close()
 
 class MainWindow(QMainWindow):
@@ -342,19 +357,28 @@ class MainWindow(QMainWindow):
         __init__: Initializes the main window.
         load_table_data: Loads the initial data into the table.
         filter_table_data: Filters the table data based on the search text, category, and manufacturer.
-        closeEvent: Closes the database connection.
+        show_products: Shows the given products in the table.
+        prefetch_visible_batches: Loads the batches of the visible drugs in a single query.
+        closeEvent: Drops the table queries that have not finished.
     '''
     def __init__(self):
         super(MainWindow, self).__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
-        
-        # Initialize database manager
-        self.db_manager = database.DatabaseManager()
+
+        # Run the table queries on the database worker thread, so that a slow or locked database does not freeze the window
+        self.database = DatabaseRelay(self)
+        # Load the products a page at a time, the next page is loaded when the table is scrolled near its end
+        self.pager = ProductSearchPager(self.database, self.ui.tableWidget, self.show_products)
+        # The windows opened from the table reload it through the pager, which keeps the search and loads only the first page
+        self.ui.update_table_db = self.pager.reload
 
         # Load initial data into table
         self.load_table_data()
 
+        # Load the batches of the rows that scroll into view, a page at a time instead of one query per row
+        self.ui.tableWidget.verticalScrollBar().valueChanged.connect(self.prefetch_visible_batches)
+
         # Connect search box and combo box signals to filter method
         self.ui.SearchBox.textChanged.connect(self.filter_table_data)
         self.ui.CategoryBox.currentIndexChanged.connect(self.filter_table_data)
@@ -362,22 +386,35 @@ class MainWindow(QMainWindow):
 
 
     def load_table_data(self):
-        data = self.db_manager.get_all_products()
-        self.ui.update_table(data)
+        self.pager.search()
 
     def filter_table_data(self):
         search_text = self.ui.SearchBox.text()
-        category = self.ui.CategoryBox.currentText()
-        manufacturer = self.ui.CompanyBox.currentText()
-        all_products = self.db_manager.get_all_products()
-        filtered_products = []
-        for product in all_products:
-            if search_text.lower() in product.name.lower() and (category == "Όλες" or product.category.name == category) and (manufacturer == "Όλες" or product.company.name == manufacturer):
-                filtered_products.append(product)
-        self.ui.update_table(filtered_products)
+        # The "Όλες" entries have no code, so they do not filter
+        category_code = self.ui.CategoryBox.currentData()
+        company_code = self.ui.CompanyBox.currentData()
+        # A newer search supersedes this one, so only the results of the last keystroke reach the table
+        self.pager.search(search_text, category_code, company_code)
+
+    def show_products(self, products, start=0):
+        self.ui.update_table(products, start)
+        self.prefetch_visible_batches()
+
+    def prefetch_visible_batches(self):
+        drugs = [product for product in self.ui.visible_products() if isinstance(product, database.Drug) and not product.batches_loaded]
+        if not drugs:
+            return
+
+        def assign_batches(batches):
+            for drug in drugs:
+                if not drug.batches_loaded:
+                    drug.batches = batches[drug.product_code_int]
+
+        # A newer scroll supersedes this one, the rows it leaves unloaded are requested again when they are shown
+        self.database.call_latest("batches", assign_batches, "get_batches_by_product_codes", [drug.product_code_int for drug in drugs])
 
     def closeEvent(self, event):
-        self.db_manager.close()
+        self.database.close()
         event.accept()
 
 if __name__ == "__main__":